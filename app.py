@@ -2,170 +2,448 @@ import os
 import asyncio
 import json
 import uuid
-import shutil
+import contextlib
+import concurrent.futures
 from werkzeug.utils import secure_filename
-from flask import Flask, render_template, request, redirect, url_for
-from scraper.upd_1 import run_scrape_and_save
-from scraper.upd_structure import run_structure
-from scraper.Scripts.upd_fabric_analysis import run_fabric_analysis_from_json
-from scraper.Scripts.upd_flare_analysis import run_flare_analysis_from_json
-from scraper.Scripts.upd_waist_analysis import run_waist_analysis_from_json
-# from scraper.Scripts.upd_hip_analysis import run_hip_analysis_from_json
-# from scraper.Scripts.upd_skirt_analysis import run_skirt_analysis_from_json
-from scraper.Scripts.upd_bodice import run_Bodice_analysis_from_json
-from scraper.Scripts.upd_back import run_Back_analysis_from_json
-from scraper.Scripts.upd_oneShoulder import run_One_Shoulder_analysis_from_json
-from scraper.Scripts.upd_seleeves import run_Seleevs_analysis_from_json
-from scraper.Scripts.upd_Neckline import run_neckline_analysis_from_json
-from scraper.Scripts.upd_hemline import run_Hemline_analysis_from_json
-from scraper.Scripts.Script import run_fit_analysis
-
-from concurrent.futures import ProcessPoolExecutor
+from werkzeug.security import safe_join
+import hashlib
+from flask import (Flask, Request, Response, abort, make_response, render_template, request, redirect, send_file,
+                   send_from_directory, stream_with_context, url_for)
+# Image work (scraper.image_variants, PIL, OpenCV) is imported by the views that need it, not at startup.
+from scraper import (pipeline, metrics, tracing, uploads, compare, results_store, static_cache, admission,
+                     jobs, job_queue, cancellation, singleflight)
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Each photo is checked on its own while werkzeug parses the body, not once the whole body is in.
+        return uploads.file_stream()
 
 app = Flask(__name__)
 app.static_folder = 'static'
-
-executor = ProcessPoolExecutor(max_workers=5)
-
-def run_in_executor(func, *args):
-    loop = asyncio.get_event_loop()
-    return loop.run_in_executor(executor, func, *args)
+app.request_class = UploadRequest
+# Two photos plus the form.
+app.config['MAX_CONTENT_LENGTH'] = 2 * uploads.MAX_UPLOAD_BYTES + 64 * 1024
+
+UPLOAD_FOLDER = os.path.join(app.root_path, 'static', 'images', 'uploads')
+
+if os.getenv("PIPELINE_WARMUP", "1") == "1":
+    pipeline.warm_up_in_background()
+
+if os.getenv("UPLOAD_GC", "1") == "1":
+    uploads.start_gc(UPLOAD_FOLDER)
+
+# Stream the fit conclusion to the output page instead of running it inside the POST.
+STREAM_FIT = os.getenv("STREAM_FIT", "1") == "1"
+# Behind reverse proxies every request comes from the last proxy; identify clients by X-Forwarded-For
+# instead. The number of proxies in front of the app, as werkzeug's ProxyFix(x_for=...) takes it.
+TRUST_PROXY = int(os.getenv("TRUST_PROXY", "0"))
+JOBS_DIR = jobs.JOBS_DIR
+# One fit per job however many pages open its conclusion stream (reloads, a second tab). Once the
+# last page following a fit has gone away it is stopped, unless a page reconnects within this many seconds.
+STREAM_GRACE = float(os.getenv("STREAM_RECONNECT_GRACE", "30"))
+_fits = singleflight.Group("fit", grace=STREAM_GRACE)
+
+def save_job(job_id, record):
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    with open(os.path.join(JOBS_DIR, f"{job_id}.json"), 'w', encoding='utf-8') as f:
+        json.dump(record, f)
+
+def load_job(job_id):
+    try:
+        with open(os.path.join(JOBS_DIR, f"{secure_filename(job_id)}.json"), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
     if request.method == 'POST':
-        url = request.form.get('dress_url')
-        front_image = request.files.get('front_image')
-        side_image = request.files.get('side_image')
-        action = request.form.get('action')
-
-        if not front_image or not side_image:
-            return render_template('index.html', error="Please upload both front and side images")
-
-        if not url:
-            return render_template('index.html', error="Please enter a URL")
-
-        upload_folder = os.path.join(app.root_path, 'static', 'images', 'uploads')
-        os.makedirs(upload_folder, exist_ok=True)
-
-        front_filename = secure_filename(front_image.filename)
-        side_filename = secure_filename(side_image.filename)
-
-        _, front_ext = os.path.splitext(front_filename)
-        _, side_ext = os.path.splitext(side_filename)
-
-        front_unique = f"front_{uuid.uuid4().hex}{front_ext}"
-        side_unique = f"side_{uuid.uuid4().hex}{side_ext}"
-
-        front_image_path = os.path.join(upload_folder, front_unique)
-        side_image_path = os.path.join(upload_folder, side_unique)
-
-        front_image.save(front_image_path)
-        side_image.save(side_image_path)
-
-        print(f"Front image saved to: {front_image_path}")
-        print(f"Side image saved to: {side_image_path}")
-
-        # Always define path outside try
-        analysis_json_path = None
-
         try:
-            if action == "analyze":
-                print("[DEBUG] Starting scrape...")
-                run_scrape_and_save(url)
-                print("[DEBUG] Scrape done. Starting structure...")
-                run_structure()
-                print("[DEBUG] Structure done.")
-
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-
-                tasks = [
-                    run_in_executor(run_fabric_analysis_from_json),
-                    run_in_executor(run_flare_analysis_from_json),
-                    run_in_executor(run_waist_analysis_from_json),
-                    # run_in_executor(run_hip_analysis_from_json),
-                    # run_in_executor(run_skirt_analysis_from_json),
-                    run_in_executor(run_Bodice_analysis_from_json),
-                    run_in_executor(run_Back_analysis_from_json),
-                    run_in_executor(run_One_Shoulder_analysis_from_json),
-                    run_in_executor(run_Seleevs_analysis_from_json),
-                    run_in_executor(run_neckline_analysis_from_json),
-                    run_in_executor(run_Hemline_analysis_from_json)
-                ]
-
-                results = loop.run_until_complete(asyncio.gather(*tasks))
-                # print(f"[DEBUG] Analysis tasks completed. Results: {results}")
-
-                keys = [
-                    'fabric_analysis', 'flare_analysis',
-                    'waist_analysis',
-                    # 'hip_analysis',
-                    # 'skirt_analysis',
-                    'bodice_analysis', 'back_analysis',
-                    'one_shoulder_analysis', 'sleeves_analysis',
-                    'neckline_analysis', 'hemline_analysis'
-                ]
-
-                if len(keys) != len(tasks):
-                    raise Exception("Mismatch: keys and tasks length must match!")
-
-                analysis_results = {k: v for k, v in zip(keys, results) if v}
-                print(f"[DEBUG] Compiled analysis_results: {analysis_results}")
-
-                if not analysis_results:
-                    raise Exception("No analysis results produced!")
-
-                os.makedirs('data', exist_ok=True)
-                analysis_json_path = os.path.join('data', 'analysis_results.json')
-                with open(analysis_json_path, 'w', encoding='utf-8') as f:
-                    json.dump(analysis_results, f, ensure_ascii=False, indent=2)
-
-                print(f"[DEBUG] Analysis results written to {analysis_json_path}")
-
-                conclusion = run_fit_analysis(front_image_path, side_image_path, analysis_json_path)
-                print("Fit analysis conclusion:", conclusion)
-
-                script_data_path = os.path.join('scraper', 'Scripts', 'data')
-                if os.path.exists(script_data_path):
-                    shutil.rmtree(script_data_path)
-
-                return redirect(url_for('output'))
-
-            else:
-                return render_template('index.html', error="Unknown action.")
+            return pipeline.run_coroutine(submit())
+        except concurrent.futures.CancelledError:
+            return render_template('index.html', error="The job was cancelled."), 409
+    return render_template('index.html')
 
-        except Exception as e:
-            print(f"[ERROR] Exception: {str(e)} | analysis_json_path: {analysis_json_path}")
-            return render_template('index.html', error=f"Error: {str(e)}")
+# A random id per browser, for "the same browser resubmitted the same dress"; an address can be shared (NAT).
+BROWSER_COOKIE = 'browser'
+
+@app.after_request
+def set_browser_cookie(response):
+    if BROWSER_COOKIE not in request.cookies and response.mimetype == 'text/html':
+        response.set_cookie(BROWSER_COOKIE, uuid.uuid4().hex, max_age=365 * 24 * 3600, httponly=True, samesite='Lax')
+    return response
+
+def client_id():
+    """The address admission limits are counted against."""
+    if TRUST_PROXY:
+        # Each proxy appends the address it got the request from; what comes before those the caller wrote.
+        forwarded = [hop.strip() for hop in ','.join(request.headers.getlist('X-Forwarded-For')).split(',') if hop.strip()]
+        if len(forwarded) >= TRUST_PROXY:
+            return forwarded[-TRUST_PROXY]
+    return request.remote_addr or 'unknown'
+
+async def submit():
+    """Handle the index form: validate, then run the job once admitted."""
+    url = request.form.get('dress_url')
+    front_image = request.files.get('front_image')
+    side_image = request.files.get('side_image')
+    action = request.form.get('action')
+
+    if not front_image or not side_image:
+        return render_template('index.html', error="Please upload both front and side images")
+
+    if not url:
+        return render_template('index.html', error="Please enter a URL")
+
+    compare_urls = compare.parse_urls(url, request.form.get('compare_urls'))
+    if action == "compare":
+        if len(compare_urls) < 2:
+            return render_template('index.html', error="Enter at least one more dress URL to compare")
+        if len(compare_urls) > compare.MAX_DRESSES:
+            return render_template('index.html', error=f"Compare at most {compare.MAX_DRESSES} dresses at a time")
+
+    job_id = uuid.uuid4().hex
+    client = client_id()
+    # The same browser submitting the same dress again abandons its earlier job.
+    browser = request.cookies.get(BROWSER_COOKIE)
+    cancellation.register(job_id, key=(browser, action, url) if browser else None)
 
-    return render_template('index.html')
+    try:
+        with tracing.job(job_id):
+            async with admission.slot(client):
+                return await run_job(job_id, url, action, compare_urls, front_image, side_image)
+    except admission.Rejected as e:
+        cancellation.finish(job_id, completed=False)
+        return render_template('index.html', error=str(e)), e.status, {'Retry-After': str(e.retry_after)}
+    except asyncio.CancelledError:
+        # Cancelled while waiting for a slot or storing the photos; run_job accounts for the rest.
+        cancellation.cancelled(job_id)
+        cancellation.finish(job_id, completed=False)
+        uploads.release(job_id)
+        raise
+
+async def run_job(job_id, url, action, compare_urls, front_image, side_image):
+    """Store the photos and run the analysis or comparison job."""
+    try:
+        with tracing.job(job_id):
+            front_upload = await asyncio.to_thread(uploads.save_upload, front_image, UPLOAD_FOLDER, 'front', owner=job_id)
+            side_upload = await asyncio.to_thread(uploads.save_upload, side_image, UPLOAD_FOLDER, 'side', owner=job_id)
+    except uploads.UploadError as e:
+        uploads.release(job_id)
+        cancellation.finish(job_id, completed=False)
+        tracing.export(job_id)
+        return render_template('index.html', error=str(e))
+
+    front_image_path = front_upload['path']
+    side_image_path = side_upload['path']
+
+    print(f"Front image saved to: {front_image_path} ({front_upload['original_bytes']} -> {front_upload['stored_bytes']} bytes)")
+    print(f"Side image saved to: {side_image_path} ({side_upload['original_bytes']} -> {side_upload['stored_bytes']} bytes)")
+
+    # Always define path outside try
+    analysis_json_path = None
+    # The photos stay referenced, and the job registered, until the job's conclusion stream has run.
+    keep_uploads = False
+    completed = False
 
-@app.route('/output')
-def output():
     try:
-        with open('data/analysis_results.json', 'r', encoding='utf-8') as f:
-            analysis = json.load(f)
+        if action not in ("analyze", "compare"):
+            return render_template('index.html', error="Unknown action.")
+
+        if job_queue.ENABLED:
+            # A worker runs the job; the result page waits for it.
+            await jobs.enqueue(job_id, action, url, compare_urls, front_upload, side_upload)
+            if action == "compare":
+                return redirect(url_for('comparison', compare_id=job_id))
+            return redirect(url_for('output_job', job_id=job_id))
+
+        if action == "analyze":
+            with tracing.job(job_id):
+                analysis_results, analysis_json_path, dress_json_path = await jobs.analyze(job_id, url, front_upload, side_upload)
+
+                if STREAM_FIT:
+                    # The output page opens the conclusion stream for this job.
+                    save_job(job_id, {
+                        "front_image_path": front_image_path,
+                        "side_image_path": side_image_path,
+                        "analysis_json_path": analysis_json_path,
+                        "dress_json_path": dress_json_path,
+                    })
+                    keep_uploads = True
+                else:
+                    conclusion = await pipeline.arun_fit_analysis(front_image_path, side_image_path, analysis_json_path, dress_json_path)
+                    print("Fit analysis conclusion:", conclusion)
+                    results_store.set_conclusion(job_id, conclusion, status="failed" if isinstance(conclusion, dict) else "done")
+                    completed = True
+
+            return redirect(url_for('output_job', job_id=job_id))
+
+        else:
+            with tracing.job(job_id), tracing.span("job", urls=len(compare_urls)):
+                record = await compare.run(job_id, compare_urls, front_image_path, side_image_path)
+                compare.save(record)
+            completed = True
+            return redirect(url_for('comparison', compare_id=job_id))
+
+    except asyncio.CancelledError:
+        cancellation.cancelled(job_id)
+        results_store.set_conclusion(job_id, {"error": "Cancelled."}, status="cancelled")
+        raise
     except Exception as e:
-        print(f"[ERROR] Could not load output: {str(e)}")
-        analysis = {}
-    return render_template('output.html', analysis=analysis)
+        print(f"[ERROR] Exception: {str(e)} | analysis_json_path: {analysis_json_path}")
+        return render_template('index.html', error=f"Error: {str(e)}")
+    finally:
+        if keep_uploads:
+            cancellation.detach(job_id)
+        else:
+            uploads.release(job_id)
+            jobs.release_scrape(job_id)
+            cancellation.finish(job_id, completed=completed)
+        tracing.export(job_id)
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    return render_template('index.html', error=f"Upload too large: each image must be under {uploads.MAX_UPLOAD_BYTES // (1024 * 1024)} MB"), 413
+
+@app.route('/output')
+def output():
+    # Old links carried the job as a query parameter.
+    job_id = request.args.get('job')
+    if job_id:
+        return redirect(url_for('output_job', job_id=job_id), code=301)
+    return redirect(url_for('index'))
+
+@app.route('/output/<job_id>')
+def output_job(job_id):
+    record = results_store.get(job_id)
+    if record is None:
+        return render_template('output.html', analysis={}, job_id=None), 404
+    cancel_url = url_for('cancel_job', job_id=job_id)
+    if job_queue.ENABLED and record['status'] == 'queued':
+        queued = jobs.write_back(job_id)
+        if queued and queued['status'] in ('queued', 'running'):
+            return render_template('output.html', analysis={}, job_id=None, pending=queued, cancel_url=cancel_url)
+        record = results_store.get(job_id)
+    analysis = record['analysis']
+    stream_url = None
+    if not analysis.get('Conclusion') and load_job(job_id):
+        stream_url = url_for('conclusion_stream', job_id=job_id)
+    # Sections whose analyzers missed the job's latency budget; the page reloads until they arrive.
+    pending_sections = [key for key, state in (analysis.get('Missing') or {}).items() if state == 'pending']
+    return render_template('output.html', analysis=analysis, job_id=job_id, stream_url=stream_url, cancel_url=cancel_url,
+                           pending_sections=pending_sections)
+
+def sse(data, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+def fit_chunks(job_id, job):
+    """The job's fit conclusion as it is generated; stored, and the job's files released, when it ends."""
+    completed = False
+    with tracing.job(job_id):
+        try:
+            parts = []
+            for chunk in pipeline.stream_fit_analysis(job["front_image_path"], job["side_image_path"],
+                                                      job["analysis_json_path"], job.get("dress_json_path")):
+                # No task to cancel here; a cancelled job stops at the next chunk and closes the model stream.
+                if cancellation.is_cancelled(job_id):
+                    raise concurrent.futures.CancelledError()
+                parts.append(chunk)
+                yield chunk
+            results_store.set_conclusion(job_id, "".join(parts))
+            completed = True
+        except (concurrent.futures.CancelledError, GeneratorExit):
+            # GeneratorExit: every page following the fit has gone away (singleflight closes it).
+            cancellation.cancelled(job_id)
+            results_store.set_conclusion(job_id, {"error": "Cancelled."}, status="cancelled")
+            raise
+        except Exception as e:
+            print(f"[ERROR] Fit stream failed for job {job_id}: {e}")
+            raise
+        finally:
+            cancellation.finish(job_id, completed=completed)
+            uploads.release(job_id)
+            jobs.release_scrape(job_id)
+            tracing.export(job_id)
+
+def stored_events(job_id):
+    """SSE events for a job whose conclusion stream has nothing left to run, or None."""
+    record = results_store.get(job_id)
+    conclusion = record['analysis'].get('Conclusion') if record else None
+    if isinstance(conclusion, str) and conclusion:
+        # Already written (page reloaded after the stream finished).
+        return [sse({"text": conclusion}), sse({}, "done")]
+    if record and record['status'] == 'cancelled':
+        return [sse({"error": "Cancelled."}, "failed")]
+    return None
+
+@app.route('/jobs/<job_id>/conclusion')
+def conclusion_stream(job_id):
+    job = load_job(job_id)
+    if not job:
+        return Response(sse({"error": "Unknown job."}, "failed"), mimetype='text/event-stream', status=404)
+
+    def events():
+        written = stored_events(job_id)
+        if written:
+            yield from written
+            return
+        try:
+            # Closed with this response; the fit stops once no page follows it (STREAM_GRACE).
+            with contextlib.closing(_fits.stream(job_id, fit_chunks, job_id, job)) as chunks:
+                for chunk in chunks:
+                    yield sse({"text": chunk})
+        except concurrent.futures.CancelledError:
+            yield sse({"error": "Cancelled."}, "failed")
+            return
+        except Exception as e:
+            yield sse({"error": str(e)}, "failed")
+            return
+        yield sse({}, "done")
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Stop a job on request: the output page's Stop buttons."""
+    record = results_store.get(job_id)
+    queued = job_queue.ENABLED and job_queue.default_queue().cancel(job_id)
+    if record is None and not queued and not cancellation.is_registered(job_id):
+        return {"error": "Unknown job."}, 404
+    cancelled = cancellation.cancel(job_id, "request") or queued
+    if cancelled and record is not None and not record['analysis'].get('Conclusion'):
+        results_store.set_conclusion(job_id, {"error": "Cancelled."}, status="cancelled")
+    return {"cancelled": bool(cancelled)}
+
+@app.route('/compare/<compare_id>')
+def comparison(compare_id):
+    record = compare.load(secure_filename(compare_id))
+    if not record and job_queue.ENABLED:
+        queued = jobs.write_back(compare_id)
+        if queued and queued['status'] in ('queued', 'running'):
+            return render_template('output.html', analysis={}, job_id=None, pending=queued)
+        if queued and queued['status'] == 'failed':
+            return render_template('index.html', error=f"Error: {queued['error']}")
+        record = compare.load(secure_filename(compare_id))
+    if not record:
+        return render_template('index.html', error="Unknown comparison."), 404
+    return render_template('compare.html', record=record, dresses=record["dresses"])
+
+@app.route('/compare/<compare_id>/<int:index>/image')
+def comparison_image(compare_id, index):
+    record = compare.load(secure_filename(compare_id))
+    dress = next((d for d in (record or {}).get("dresses", []) if d["index"] == index), None)
+    # Only the copy the comparison kept of the dress's image is served, never the recorded path itself.
+    path = compare.image_file(secure_filename(compare_id), index)
+    if not dress or not dress.get("image_path") or not os.path.isfile(path):
+        abort(404)
+    width = request.args.get('w', type=int)
+    if not width:
+        return send_file(path, mimetype='image/jpeg')
+    from scraper import image_variants
+    # Thumbnail in the best format the browser accepts; the URL stays the same, hence Vary.
+    fmt = image_variants.negotiate(request.headers.get('Accept'))
+    variant = image_variants.get(path, static_cache.fingerprint(path), image_variants.snap_width(width), fmt)
+    response = send_file(variant, mimetype=image_variants.mime_type(fmt), conditional=True)
+    response.vary.add('Accept')
+    return response
+
+RESULT_JSON = os.path.join('data', 'result.json')
+DOWNLOADED_DIR = os.path.join(app.root_path, 'static', 'images', 'downloaded')
+RESULT_CACHE = os.getenv("RESULT_CACHE", "1") == "1"
+_pages = static_cache.VersionedCache()
+
+def asset_url(filename):
+    """Static URL with the file's content hash in the path, so it can be cached forever."""
+    path = os.path.join(app.static_folder, filename)
+    return url_for('fingerprinted_asset', digest=static_cache.fingerprint(path), filename=filename)
+
+def variant_url(filename, width, fmt):
+    path = os.path.join(app.static_folder, filename)
+    return url_for('image_variant', digest=static_cache.fingerprint(path), width=width, fmt=fmt, filename=filename)
+
+def picture(filename):
+    """<picture> sources for a static image: an AVIF/WebP/JPEG srcset over the variant widths."""
+    from scraper import image_variants
+    width, height = image_variants.image_size(os.path.join(app.static_folder, filename))
+    widths = image_variants.widths_for(width)
+    sources = [
+        {"type": image_variants.mime_type(fmt),
+         "srcset": ", ".join(f"{variant_url(filename, w, fmt)} {min(w, width)}w" for w in widths)}
+        for fmt in ("avif", "webp") if fmt in image_variants.FORMATS
+    ]
+    return {
+        "sources": sources,
+        "srcset": ", ".join(f"{variant_url(filename, w, 'jpeg')} {min(w, width)}w" for w in widths),
+        "src": variant_url(filename, widths[-1], 'jpeg'),
+        "original": asset_url(filename),
+        "width": width,
+        "height": height,
+    }
+
+def result_images():
+    os.makedirs(DOWNLOADED_DIR, exist_ok=True)
+    return sorted(os.listdir(DOWNLOADED_DIR))
+
+def build_result_page(names):
+    with open(RESULT_JSON, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    images = [picture(f'images/downloaded/{img}') for img in names]
+    html = render_template('result.html', data=data, images=images)
+    return {"html": html, "etag": hashlib.sha256(html.encode('utf-8')).hexdigest()[:32]}
 
 @app.route('/result')
 def result():
     try:
-        with open('data/result.json', 'r', encoding='utf-8') as f:
-            data = json.load(f)
-
-        image_dir = 'static/images/downloaded'
-        os.makedirs(image_dir, exist_ok=True)
-
-        images = os.listdir(image_dir)
-        images = [url_for('static', filename=f'images/downloaded/{img}') for img in images]
+        # Rebuilt only when result.json or one of the listed images changes (their fingerprints are in the page).
+        names = result_images()
+        version = static_cache.file_version(RESULT_JSON, *(os.path.join(DOWNLOADED_DIR, name) for name in names))
+        build = lambda: build_result_page(names)
+        page = _pages.get('result', version, build) if RESULT_CACHE else build()
     except Exception as e:
         return f"Error loading result: {str(e)}"
 
-    return render_template('result.html', data=data, images=images)
+    response = make_response(page["html"])
+    response.set_etag(page["etag"])
+    response.last_modified = static_cache.last_modified(version)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@app.route('/assets/<digest>/<path:filename>')
+def fingerprinted_asset(digest, filename):
+    path = safe_join(app.static_folder, filename)
+    # An old fingerprint must not be served the new content under an immutable header.
+    if not path or not os.path.isfile(path) or static_cache.fingerprint(path) != digest:
+        abort(404)
+    response = send_from_directory(app.static_folder, filename, conditional=True)
+    response.headers['Cache-Control'] = static_cache.IMMUTABLE
+    return response
+
+@app.route('/variants/<digest>/<int:width>/<fmt>/<path:filename>')
+def image_variant(digest, width, fmt, filename):
+    from scraper import image_variants
+    path = safe_join(app.static_folder, filename)
+    if (width not in image_variants.WIDTHS or fmt not in image_variants.FORMATS
+            or not path or not os.path.isfile(path) or static_cache.fingerprint(path) != digest):
+        abort(404)
+    response = send_file(image_variants.get(path, digest, width, fmt),
+                         mimetype=image_variants.mime_type(fmt), conditional=True)
+    response.headers['Cache-Control'] = static_cache.IMMUTABLE
+    return response
+
+@app.route('/jobs/<job_id>/timeline')
+def job_timeline(job_id):
+    spans = tracing.load(job_id)
+    if not spans:
+        return render_template('timeline.html', job_id=job_id, error="No trace recorded for this job."), 404
+    return render_template('timeline.html', job_id=job_id, timeline=tracing.waterfall(spans),
+                           prompt_cache=tracing.prompt_cache(spans))
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
     app.run(threaded=True, debug=True)
@@ -0,0 +1,83 @@
+import os
+import asyncio
+import contextvars
+import concurrent.futures
+
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+import app as web
+
+# ASGI entry point (the Dockerfile default):
+#
+#     gunicorn asgi:app --worker-class uvicorn.workers.UvicornWorker --workers 1 --timeout 300
+#     uvicorn asgi:app
+#
+# The Flask app runs behind asgiref's WSGI adapter, with two changes:
+#
+# - asgiref hands every request to one shared thread, so a single open
+#   conclusion stream would hold up the whole site. Here each request gets
+#   a thread from a pool of ASGI_THREADS. A request waiting on its job or
+#   on a model stream only waits on a future there; scraping, downloads
+#   and model calls are awaited on the pipeline's own loop
+#   (pipeline.run_coroutine).
+# - uvicorn drops what is sent after the client has gone without telling
+#   the app. The response is closed at its next chunk once the client has
+#   disconnected, which ends that page's share of the fit (the fit itself
+#   stops after STREAM_RECONNECT_GRACE if no page reconnects).
+
+THREADS = int(os.getenv("ASGI_THREADS", "64"))
+_executor = concurrent.futures.ThreadPoolExecutor(THREADS, thread_name_prefix="asgi")
+
+
+class ClientDisconnected(OSError):
+    """The client went away while its response was being sent."""
+
+
+class _Request(WsgiToAsgiInstance):
+    async def __call__(self, scope, receive, send):
+        self.receive = receive
+        self.disconnected = False
+        await super().__call__(scope, receive, send)
+
+    async def run_wsgi_app(self, body):
+        watcher = asyncio.ensure_future(self.watch_disconnect())
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(_executor, contextvars.copy_context().run, self.respond, body)
+        except ClientDisconnected:
+            pass
+        finally:
+            watcher.cancel()
+
+    async def watch_disconnect(self):
+        # The body has been read; the next message is the disconnect.
+        while (await self.receive())["type"] != "http.disconnect":
+            pass
+        self.disconnected = True
+
+    def respond(self, body):
+        """asgiref's run_wsgi_app(), stopping once the client is gone and always closing the response."""
+        result = self.wsgi_application(self.build_environ(self.scope, body), self.start_response)
+        try:
+            for output in result:
+                if self.disconnected:
+                    raise ClientDisconnected()
+                if not self.response_started:
+                    self.response_started = True
+                    self.sync_send(self.response_start)
+                self.sync_send({"type": "http.response.body", "body": output, "more_body": True})
+            if not self.response_started:
+                self.response_started = True
+                self.sync_send(self.response_start)
+            self.sync_send({"type": "http.response.body"})
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+
+
+class _App(WsgiToAsgi):
+    async def __call__(self, scope, receive, send):
+        await _Request(self.wsgi_application)(scope, receive, send)
+
+
+app = _App(web.app)
@@ -0,0 +1,160 @@
+"""Cost, latency and agreement of the analyzer tier with the model cascade.
+
+The analyzers are run on a stored scrape (scraper/tag_store.py, as the
+nightly refresh does) against bench/llm_stub.py, once per configuration,
+each in its own process so the worker pool starts with that
+configuration's environment:
+
+    off      LLM_CASCADE=0 (every question to the analyzer's model)
+    cascade  LLM_CASCADE=1 (LLM_CASCADE_MODEL first, threshold --threshold)
+
+    python bench/cascade_report.py [--runs 10] [--threshold 0.9] [--audit 0.2] [--target 0.95]
+        [--latency gpt-4.1=lognormal:1.2,0.4 --latency gpt-4.1-mini=lognormal:0.4,0.4]
+
+Reports per configuration: p50/p95/p99 of one full analyzer pass, model
+cost and calls to the large model per pass. For the cascade, per analyzer:
+share of answers accepted from the small model, escalated and audited, and
+how often the two models agreed; then agreement per confidence band over
+all analyzers, with the lowest band that reaches --target, a starting
+point for LLM_CASCADE_THRESHOLD. The stub's small model is wrong with
+probability 1 - confidence, so the bands come out calibrated; against the
+real models they are what there is to measure.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from e2e import percentile, PERCENTILES  # noqa: E402
+
+CONFIGS = {
+    "off": {"LLM_CASCADE": "0"},
+    "cascade": {"LLM_CASCADE": "1"},
+}
+LATENCY = ["gpt-4.1=lognormal:1.2,0.4", "gpt-4.1-mini=lognormal:0.4,0.4"]
+
+
+def child(runs, latency, seed):
+    """One configuration, in this process; prints its numbers as JSON."""
+    import llm_stub
+    import serve_load
+
+    workdir = tempfile.mkdtemp(prefix="cascade-")
+    stub, url = llm_stub.start(latency, seed=seed)
+    os.environ.update(OPENAI_API_KEY="stub", OPENAI_BASE_URL=url, OPENAI_API_BASE=url, TAG_STORE_DIR=os.path.join(workdir, "tags"),
+                      TRACE_DIR=os.path.join(workdir, "traces"))
+    from scraper import metrics, pipeline, tag_store, llm_client
+
+    serve_load.seed_tag_store(workdir)
+    json_path = tag_store.dress_json_path(tag_store.lookup(serve_load.PRODUCT_URL)[0])
+    pipeline.warm_up()
+    metrics.drain()
+
+    async def passes():
+        seconds = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            await pipeline.run_analyzers(json_path)
+            seconds.append(time.perf_counter() - started)
+        return seconds
+
+    seconds = asyncio.run(passes())
+    counters = [[name, dict(labels), value] for (name, labels), value in metrics.drain()["counters"]
+                if name in ("llm_cost_usd_total", "llm_calls_total", "llm_cascade_total", "llm_cascade_agreement_total")]
+    stub.shutdown()
+    print(json.dumps({"seconds": seconds, "counters": counters, "small_model": llm_client.CASCADE_MODEL}))
+
+
+def run_config(name, args):
+    env = dict(os.environ, PIPELINE_WARMUP="0", LLM_CASCADE_THRESHOLD=str(args.threshold),
+               LLM_CASCADE_AUDIT=str(args.audit), **CONFIGS[name])
+    command = [sys.executable, __file__, "--child", "--runs", str(args.runs), "--seed", str(args.seed)]
+    for spec in args.latency or LATENCY:
+        command += ["--latency", spec]
+    out = subprocess.run(command, env=env, cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def _share(part, whole):
+    return f"{100 * part / whole:.0f}%" if whole else "-"
+
+
+def cascade_tables(counters, target):
+    outcomes, agreement, bands = {}, {}, {}
+    for name, labels, value in counters:
+        if name == "llm_cascade_total":
+            outcomes.setdefault(labels["analyzer"], {})[labels["outcome"]] = value
+        elif name == "llm_cascade_agreement_total":
+            agreed = labels["agree"] == "true"
+            for table, key in ((agreement, labels["analyzer"]), (bands, labels["band"])):
+                row = table.setdefault(key, [0, 0])
+                row[0] += value if agreed else 0
+                row[1] += value
+
+    print(f"\n{'analyzer':<24}{'questions':>10}{'accepted':>10}{'escalated':>10}{'audited':>9}{'agree':>8}")
+    for analyzer in sorted(outcomes):
+        row = outcomes[analyzer]
+        total = sum(row.values())
+        agreed, compared = agreement.get(analyzer, (0, 0))
+        print(f"{analyzer:<24}{int(total):>10}{_share(row.get('accepted', 0), total):>10}"
+              f"{_share(row.get('escalated', 0), total):>10}{_share(row.get('audited', 0), total):>9}{_share(agreed, compared):>8}")
+
+    print(f"\n{'confidence':<12}{'compared':>10}{'agree':>8}")
+    suggested, reaching = None, True
+    for band in sorted(bands, reverse=True):
+        agreed, compared = bands[band]
+        print(f"{'>= ' + band:<12}{int(compared):>10}{_share(agreed, compared):>8}")
+        # The threshold can go down to a band only if every band above it reaches the target too.
+        reaching = reaching and agreed / compared >= target
+        if reaching:
+            suggested = band
+    if suggested is not None:
+        print(f"Bands from {suggested} up agree at least {target:.0%} of the time; LLM_CASCADE_THRESHOLD={suggested} is a place to start.")
+    else:
+        print(f"No band agrees {target:.0%} of the time; audit more answers (--audit) or lower the target.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--threshold", type=float, default=0.9)
+    parser.add_argument("--audit", type=float, default=0.2)
+    parser.add_argument("--target", type=float, default=0.95)
+    parser.add_argument("--latency", action="append", default=[], help="[model=]kind:params, repeatable")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--configs", default=",".join(CONFIGS))
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.runs, args.latency, args.seed)
+        return
+
+    print(f"{args.runs} analyzer passes per configuration, stub latency {' '.join(args.latency or LATENCY)}")
+    header = "".join(f"{'p' + str(p):>8}" for p in PERCENTILES)
+    print(f"{'config':<10}{header}{'$/pass':>10}{'large calls/pass':>18}")
+    cascade = None
+    for name in args.configs.split(","):
+        result = run_config(name, args)
+        seconds, counters = result["seconds"], result["counters"]
+        cells = "".join(f"{percentile(seconds, p):>8.2f}" for p in PERCENTILES)
+        cost = sum(value for n, _, value in counters if n == "llm_cost_usd_total")
+        large = sum(value for n, labels, value in counters
+                    if n == "llm_calls_total" and labels["model"] != result["small_model"])
+        print(f"{name:<10}{cells}{cost / len(seconds):>10.4f}{large / len(seconds):>18.1f}")
+        if name == "cascade":
+            cascade = counters
+    if cascade:
+        cascade_tables(cascade, args.target)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""End-to-end pipeline benchmark, fully offline.
+
+The retailer is replaced by bench/fixture_server.py and OpenAI by
+bench/llm_stub.py; jobs are posted to app.index() with the Flask test
+client, so everything from the upload to the fit step is exercised.
+
+    python bench/e2e.py single [--runs 5]
+    python bench/e2e.py warm [--runs 5]            # same product and photos repeated, first run kept apart
+    python bench/e2e.py concurrent --users 4 [--runs 2]
+
+    --latency lognormal:0.8,0.5 --latency gpt-4o=fixed:2   stub latency (see bench/llm_stub.py)
+    --compare bench/results/single-<timestamp>.json        diff against an earlier run
+
+Per-stage numbers come from each job's trace (scraper/tracing.py); end to
+end and time to the first conclusion token from the client side. Results are written to
+bench/results/<scenario>-<timestamp>.json.
+
+Needs Playwright with Firefox installed, like the app itself.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import defaultdict
+from urllib.parse import urlparse
+
+import cv2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fixture_server  # noqa: E402
+import llm_stub  # noqa: E402
+
+RESULTS_DIR = os.path.join(ROOT, "bench", "results")
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = (len(ordered) - 1) * p / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(samples):
+    return {
+        name: {"n": len(values), **{f"p{p}": round(percentile(values, p), 4) for p in PERCENTILES}}
+        for name, values in sorted(samples.items()) if values
+    }
+
+
+def stage_samples(spans):
+    """Span durations keyed by stage; model calls are split per analyzer."""
+    samples = defaultdict(list)
+    for span in spans:
+        if span.get("end") is None:
+            continue
+        name = span["name"]
+        if name == "llm":
+            name = f"llm:{span.get('attributes', {}).get('analyzer', '?')}"
+        samples[name].append(span["end"] - span["start"])
+    return samples
+
+
+def write_body_photos(directory):
+    front = os.path.join(directory, "front.jpg")
+    side = os.path.join(directory, "side.jpg")
+    cv2.imwrite(front, fixture_server._dress_image(colour=(120, 150, 190)))
+    cv2.imwrite(side, fixture_server._dress_image(width=600, colour=(120, 150, 190), back=True))
+    return front, side
+
+
+def run_job(client, url, front, side):
+    start = time.perf_counter()
+    with open(front, "rb") as f, open(side, "rb") as s:
+        response = client.post("/", data={
+            "dress_url": url,
+            "action": "analyze",
+            "front_image": (f, "front.jpg"),
+            "side_image": (s, "side.jpg"),
+        }, content_type="multipart/form-data")
+    location = urlparse(response.headers.get("Location", "")).path
+    job_id = location.rsplit("/", 1)[-1] if location.startswith("/output/") else None
+    outcome = {"ok": response.status_code == 302 and job_id is not None, "job_id": job_id}
+
+    # With STREAM_FIT the conclusion arrives on the output page's event stream.
+    first_token = None
+    if outcome["ok"] and os.environ.get("STREAM_FIT", "1") == "1":
+        stream = client.get(f"/jobs/{job_id}/conclusion", buffered=False)
+        for line in stream.response:
+            if first_token is None and line.startswith(b"data:"):
+                first_token = time.perf_counter() - start
+            if line.startswith(b"event: failed"):
+                outcome["ok"] = False
+        stream.close()
+    outcome["seconds"] = time.perf_counter() - start
+    outcome["first_token_seconds"] = first_token
+    return outcome
+
+
+def run_scenario(app_module, scenario, url, front, side, users, runs):
+    """Returns the list of job outcomes; the warm scenario marks its first job."""
+    outcomes = []
+    lock = threading.Lock()
+
+    def user(count):
+        client = app_module.app.test_client()
+        for _ in range(count):
+            outcome = run_job(client, url, front, side)
+            with lock:
+                outcomes.append(outcome)
+
+    if scenario == "warm":
+        first = run_job(app_module.app.test_client(), url, front, side)
+        first["cold"] = True
+        outcomes.append(first)
+        user(runs)
+    elif scenario == "concurrent":
+        threads = [threading.Thread(target=user, args=(runs,)) for _ in range(users)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    else:
+        user(runs)
+    return outcomes
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def print_table(stages):
+    print(f"{'stage':32} {'n':>4} " + " ".join(f"{'p' + str(p):>9}" for p in PERCENTILES))
+    for name, row in stages.items():
+        print(f"{name:32} {row['n']:>4} " + " ".join(f"{row['p' + str(p)]:>8.3f}s" for p in PERCENTILES))
+
+
+def compare(current, baseline_path, threshold):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {os.path.basename(baseline_path)} ({baseline.get('git')}):")
+    regressions = 0
+    for name, row in current["stages"].items():
+        before = baseline.get("stages", {}).get(name)
+        if not before:
+            continue
+        cells = []
+        for p in (50, 95):
+            old, new = before[f"p{p}"], row[f"p{p}"]
+            change = (new - old) / old if old else 0.0
+            flag = " !" if change > threshold else ""
+            regressions += bool(flag)
+            cells.append(f"p{p} {old:.3f}s -> {new:.3f}s ({change:+.0%}){flag}")
+        print(f"  {name:30} " + "   ".join(cells))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("scenario", choices=["single", "warm", "concurrent"])
+    parser.add_argument("--runs", type=int, default=5, help="jobs per user")
+    parser.add_argument("--users", type=int, default=4, help="concurrent scenario only")
+    parser.add_argument("--latency", action="append", default=[], help="stub latency, [model=]kind:params")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--product", default=None, help="fixture product directory (default: generated demo)")
+    parser.add_argument("--compare", help="earlier results file")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative slowdown flagged by --compare")
+    args = parser.parse_args()
+
+    product = args.product or fixture_server.synthesize()
+    site, site_url = fixture_server.start()
+    stub, stub_url = llm_stub.start(args.latency or ["lognormal:0.6,0.4"], seed=args.seed)
+
+    workdir = tempfile.mkdtemp(prefix="fitapp-bench-")
+    os.environ.update({
+        "OPENAI_API_KEY": "stub",
+        "OPENAI_BASE_URL": stub_url,
+        "OPENAI_API_BASE": stub_url,
+        "SCRAPER_PREFLIGHT_URL": "",
+        "SCRAPER_HEADLESS": "1",
+        "TRACE_DIR": os.path.join(workdir, "traces"),
+        "UPLOAD_DB": os.path.join(workdir, "uploads.db"),
+        "PIPELINE_WARMUP": "0",
+    })
+    os.chdir(ROOT)
+    import app as app_module
+    from scraper import pipeline, tracing
+
+    pipeline.warm_up()
+    front, side = write_body_photos(workdir)
+    url = f"{site_url}/{product}/"
+
+    started = time.time()
+    outcomes = run_scenario(app_module, args.scenario, url, front, side, args.users, args.runs)
+    wall = time.time() - started
+
+    samples = defaultdict(list)
+    hit_rates = []
+    cold = None
+    for outcome in outcomes:
+        if outcome.get("cold"):
+            cold = outcome["seconds"]
+            continue
+        if not outcome["ok"]:
+            continue
+        samples["end_to_end"].append(outcome["seconds"])
+        if outcome.get("first_token_seconds") is not None:
+            samples["first_token"].append(outcome["first_token_seconds"])
+        spans = tracing.load(outcome["job_id"])
+        for name, values in stage_samples(spans).items():
+            samples[name].extend(values)
+        cache = tracing.prompt_cache(spans)
+        if cache["prompt_tokens"]:
+            hit_rates.append(cache["hit_rate"])
+
+    jobs = [o for o in outcomes if not o.get("cold")]
+    result = {
+        "scenario": args.scenario,
+        "git": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {"runs": args.runs, "users": args.users if args.scenario == "concurrent" else 1,
+                   "latency": args.latency or ["lognormal:0.6,0.4"], "seed": args.seed, "product": product},
+        "jobs": len(jobs),
+        "errors": sum(1 for o in jobs if not o["ok"]),
+        "throughput_jobs_per_min": round(60.0 * len(jobs) / wall, 2) if wall else None,
+        "cold_seconds": cold,
+        "stub_requests": stub.RequestHandlerClass.stats["requests"],
+        "stages": summarize(samples),
+        "prompt_cache_hit_rate": summarize({"jobs": hit_rates}).get("jobs"),
+    }
+
+    print(f"{args.scenario}: {result['jobs']} jobs, {result['errors']} errors, "
+          f"{result['throughput_jobs_per_min']} jobs/min, {result['stub_requests']} model calls")
+    if cold is not None:
+        print(f"cold first run: {cold:.3f}s")
+    print_table(result["stages"])
+    if result["prompt_cache_hit_rate"]:
+        print("prompt cache hit rate per job: " + ", ".join(f"p{p} {result['prompt_cache_hit_rate'][f'p{p}']:.0%}" for p in PERCENTILES))
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{args.scenario}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nSaved {path}")
+
+    regressions = compare(result, args.compare, args.threshold) if args.compare else 0
+    site.shutdown()
+    stub.shutdown()
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
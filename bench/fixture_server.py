@@ -0,0 +1,145 @@
+"""Local stand-in for the retailer: serves saved product pages and their images.
+
+Layout (one directory per product):
+
+    bench/fixtures/site/<product>/index.html
+    bench/fixtures/site/<product>/images/...
+
+Image URLs inside a page are written as "{{BASE}}/<product>/images/<file>"
+and rewritten to this server's address when served, so a page saved from
+the retailer only needs its srcset hosts replaced once.
+
+    python bench/fixture_server.py [--port 8765] [--synthesize]
+
+--synthesize writes a generated "demo" product when the directory is empty,
+with the same markup the scraper's selectors expect.
+"""
+import io
+import os
+import argparse
+import threading
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SITE = os.path.join(ROOT, "bench", "fixtures", "site")
+
+DEMO_PAGE = """<!DOCTYPE html>
+<html><head><title>Demo twill mini dress</title></head>
+<body>
+<div id="EDITORS_NOTES"><div class="EditorialAccordion88__accordionContent--editors_notes">
+<p>Cut from structured cotton-twill, this mini dress has a fitted bodice and a softly flared skirt.</p>
+</div></div>
+<div id="SIZE_AND_FIT"><div class="EditorialAccordion88__accordionContent--size_and_fit"><ul>
+<li>Fits true to size, take your normal size</li>
+<li>Designed for a slim fit through the waist</li>
+<li>Model is 177cm/ 5'10" and is wearing a UK 8</li>
+</ul></div></div>
+<div id="DETAILS_AND_CARE"><div class="EditorialAccordion88__accordionContent--details_and_care"><ul>
+<li>Concealed zip fastening along back</li>
+<li>97% cotton, 3% elastane</li>
+<li>Machine wash</li>
+</ul></div></div>
+<div class="Overlay9 SizeChart88__sizeGuide"><table class="SizeTable88__table">
+<thead><tr><th></th><th>Bust</th><th>Waist</th><th>Hip</th></tr></thead>
+<tbody>
+<tr><td>xs</td><td>80</td><td>62</td><td>88</td></tr>
+<tr><td>s</td><td>84</td><td>66</td><td>92</td></tr>
+<tr><td>m</td><td>88</td><td>70</td><td>96</td></tr>
+</tbody></table></div>
+<ul class="ImageCarousel88__track">
+{images}
+</ul>
+</body></html>
+"""
+
+DEMO_IMAGE = '<li><noscript><img srcset="{{{{BASE}}}}/demo/images/w920_q60/{name} 920w"></noscript></li>'
+
+
+def _dress_image(width=920, height=1380, colour=(60, 40, 150), back=False):
+    """A flat dress silhouette on a light backdrop, enough for the pixel-level analyzers."""
+    image = np.full((height, width, 3), 238, np.uint8)
+    cx = width // 2
+    shoulder, waist, hem = int(height * 0.18), int(height * 0.45), int(height * 0.82)
+    body = np.array([
+        [cx - 150, shoulder], [cx + 150, shoulder],
+        [cx + 110, waist], [cx + 260, hem],
+        [cx - 260, hem], [cx - 110, waist],
+    ], np.int32)
+    cv2.fillPoly(image, [body], colour)
+    if not back:
+        cv2.ellipse(image, (cx, shoulder), (60, 40), 0, 0, 180, (238, 238, 238), -1)
+    noise = np.random.default_rng(7).normal(0, 4, image.shape)
+    return np.clip(image + noise, 0, 255).astype(np.uint8)
+
+
+def synthesize(site_dir=DEFAULT_SITE):
+    """Write the generated "demo" product if it is missing; returns its product id."""
+    product_dir = os.path.join(site_dir, "demo")
+    images_dir = os.path.join(product_dir, "images", "w920_q60")
+    if os.path.isfile(os.path.join(product_dir, "index.html")):
+        return "demo"
+    os.makedirs(images_dir, exist_ok=True)
+    names = []
+    for idx, (colour, back) in enumerate([((60, 40, 150), False), ((60, 40, 150), True), ((70, 50, 160), False)]):
+        name = f"image_{idx}.jpg"
+        cv2.imwrite(os.path.join(images_dir, name), _dress_image(colour=colour, back=back))
+        names.append(name)
+    # A fabric close-up.
+    swatch = np.clip(np.random.default_rng(3).normal(0, 10, (920, 920, 3)) + (60, 40, 150), 0, 255).astype(np.uint8)
+    cv2.imwrite(os.path.join(images_dir, "image_3.jpg"), swatch)
+    names.append("image_3.jpg")
+
+    with open(os.path.join(product_dir, "index.html"), "w", encoding="utf-8") as f:
+        f.write(DEMO_PAGE.format(images="\n".join(DEMO_IMAGE.format(name=n) for n in names)))
+    return "demo"
+
+
+class FixtureHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            path = os.path.join(path, "index.html")
+        if not path.endswith(".html") or not os.path.isfile(path):
+            return super().send_head()
+        with open(path, "r", encoding="utf-8") as f:
+            body = f.read().replace("{{BASE}}", f"http://{self.headers.get('Host')}").encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        return io.BytesIO(body)
+
+
+def start(site_dir=DEFAULT_SITE, port=0):
+    """Serve `site_dir` on a background thread; returns (server, base_url)."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), partial(FixtureHandler, directory=site_dir))
+    threading.Thread(target=server.serve_forever, name="fixture-server", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--site", default=DEFAULT_SITE)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--synthesize", action="store_true")
+    args = parser.parse_args()
+
+    if args.synthesize:
+        synthesize(args.site)
+    server, base_url = start(args.site, args.port)
+    print(f"Serving {args.site} at {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Tail latency of the analyzer tier with and without hedged model calls.
+
+The analyzers are run on a stored scrape (scraper/tag_store.py, as the
+nightly refresh does) against bench/llm_stub.py with heavy-tailed
+latency, once per configuration, each in its own process so the worker
+pool starts with that configuration's environment:
+
+    off       LLM_HEDGE=0
+    hedge     LLM_HEDGE=1 (p95 delay, 5% budget)
+    hedge-20  LLM_HEDGE=1, LLM_HEDGE_BUDGET=0.2
+
+    python bench/hedge_report.py [--runs 60] [--warmup 20] [--latency pareto:0.05,1.5] [--timeout 30]
+
+Reports per configuration: p50/p95/p99/max of one full analyzer pass,
+requests sent to the stub per pass, hedges won/lost/denied and calls cut
+off at their deadline. The warm-up passes fill the latency windows the
+hedge delay is taken from and are not counted.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from e2e import percentile, PERCENTILES  # noqa: E402
+
+CONFIGS = {
+    "off": {"LLM_HEDGE": "0"},
+    "hedge": {"LLM_HEDGE": "1"},
+    "hedge-20": {"LLM_HEDGE": "1", "LLM_HEDGE_BUDGET": "0.2"},
+}
+
+
+def child(runs, warmup, latency, seed):
+    """One configuration, in this process; prints its numbers as JSON."""
+    import llm_stub
+    import serve_load
+
+    workdir = tempfile.mkdtemp(prefix="hedge-")
+    stub, url = llm_stub.start([latency], seed=seed)
+    os.environ.update(OPENAI_API_KEY="stub", OPENAI_BASE_URL=url, OPENAI_API_BASE=url, TAG_STORE_DIR=os.path.join(workdir, "tags"),
+                      TRACE_DIR=os.path.join(workdir, "traces"))
+    from scraper import metrics, pipeline, tag_store
+
+    serve_load.seed_tag_store(workdir)
+    json_path = tag_store.dress_json_path(tag_store.lookup(serve_load.PRODUCT_URL)[0])
+    pipeline.warm_up()
+
+    async def passes():
+        seconds = []
+        for i in range(warmup + runs):
+            if i == warmup:
+                metrics.drain()
+                stub.RequestHandlerClass.stats["requests"] = 0
+            started = time.perf_counter()
+            await pipeline.run_analyzers(json_path)
+            if i >= warmup:
+                seconds.append(time.perf_counter() - started)
+        return seconds
+
+    seconds = asyncio.run(passes())
+    counters = {}
+    for (name, labels), value in metrics.drain()["counters"]:
+        if name in ("llm_hedges_total", "llm_timeouts_total", "llm_calls_total"):
+            key = name if name != "llm_hedges_total" else f"hedges_{dict(labels)['outcome']}"
+            counters[key] = counters.get(key, 0) + value
+    stub.shutdown()
+    print(json.dumps({"seconds": seconds, "requests": stub.RequestHandlerClass.stats["requests"], "counters": counters}))
+
+
+def run_config(name, args):
+    env = dict(os.environ, PIPELINE_WARMUP="0", LLM_HEDGE_MIN_SAMPLES="5", LLM_TIMEOUT=str(args.timeout), **CONFIGS[name])
+    out = subprocess.run([sys.executable, __file__, "--child", "--runs", str(args.runs), "--warmup", str(args.warmup),
+                          "--latency", args.latency, "--seed", str(args.seed)],
+                         env=env, cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=60)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--latency", default="pareto:0.05,1.5")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--configs", default=",".join(CONFIGS))
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.runs, args.warmup, args.latency, args.seed)
+        return
+
+    print(f"{args.runs} analyzer passes per configuration, stub latency {args.latency}")
+    header = "".join(f"{'p' + str(p):>8}" for p in PERCENTILES)
+    print(f"{'config':<10}{header}{'max':>8}{'req/pass':>10}  hedges won/lost/denied  timeouts")
+    for name in args.configs.split(","):
+        result = run_config(name, args)
+        seconds, counters = result["seconds"], result["counters"]
+        cells = "".join(f"{percentile(seconds, p):>8.2f}" for p in PERCENTILES)
+        hedges = "/".join(str(int(counters.get(f"hedges_{k}", 0))) for k in ("won", "lost", "denied"))
+        print(f"{name:<10}{cells}{max(seconds):>8.2f}{result['requests'] / len(seconds):>10.1f}  {hedges:>22}"
+              f"  {int(counters.get('llm_timeouts_total', 0)):>8}")
+
+
+if __name__ == "__main__":
+    main()
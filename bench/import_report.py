@@ -0,0 +1,81 @@
+"""Per-module import cost, measured in a fresh interpreter for each module.
+
+    python bench/import_report.py [module ...]
+"""
+import os
+import sys
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MODULES = [
+    "app",
+    "flask",
+    "scraper.pipeline",
+    "scraper.upd_1",
+    "scraper.upd_structure",
+    "scraper.Scripts.Script",
+    "scraper.Scripts.upd_fabric_analysis",
+    "scraper.Scripts.upd_flare_analysis",
+    "scraper.Scripts.upd_waist_analysis",
+    "scraper.Scripts.upd_hip_analysis",
+    "scraper.Scripts.upd_skirt_analysis",
+    "scraper.Scripts.upd_bodice",
+    "scraper.Scripts.upd_back",
+    "scraper.Scripts.upd_oneShoulder",
+    "scraper.Scripts.upd_seleeves",
+    "scraper.Scripts.upd_Neckline",
+    "scraper.Scripts.upd_hemline",
+    "cv2",
+    "PIL.Image",
+    "pillow_avif",
+    "bs4",
+    "playwright.async_api",
+    "openai",
+    "langchain_openai",
+    "langchain.memory",
+]
+
+
+def import_time(module):
+    """Return (seconds, heaviest direct dependencies) for importing `module` cold."""
+    env = dict(os.environ, PIPELINE_WARMUP="0")
+    code = (
+        "import time; t = time.perf_counter(); "
+        f"import {module}; "
+        "print(time.perf_counter() - t)"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        return None, []
+
+    children = []
+    for line in proc.stderr.splitlines():
+        parts = line.split("|")
+        if not line.startswith("import time:") or len(parts) != 3 or "cumulative" in line:
+            continue
+        name = parts[2][1:]
+        level = (len(name) - len(name.lstrip())) // 2
+        if level == 1:
+            children.append((int(parts[1]), name.strip()))
+
+    heaviest = sorted(children, reverse=True)[:3]
+    return float(proc.stdout.strip().splitlines()[-1]), heaviest
+
+
+def main(modules):
+    print(f"{'module':45} {'cold import (s)':>16}  heaviest top-level dependencies")
+    for module in modules:
+        seconds, heaviest = import_time(module)
+        if seconds is None:
+            print(f"{module:45} {'not importable':>16}")
+            continue
+        children = ", ".join(f"{name} {cumulative / 1e6:.2f}s" for cumulative, name in heaviest)
+        print(f"{module:45} {seconds:16.3f}  {children}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or DEFAULT_MODULES)
@@ -0,0 +1,293 @@
+"""OpenAI-compatible stub for offline runs: POST /v1/chat/completions.
+
+Answers are canned but shaped like the real ones:
+  - the structure step gets an image classification for the images it was sent,
+  - analyzer questions get {"output": ..., "summary": ...}; a question
+    gets the same yes/no from every model,
+  - anything else (the fit step) gets a paragraph of prose.
+
+Requests with "stream": true are answered as server-sent chunks.
+
+Prompt caching is imitated: a request whose leading messages match an
+earlier, answered request to the same model reports that part as
+usage.prompt_tokens_details.cached_tokens (from 1024 tokens, in steps of
+128, as OpenAI does).
+
+Requests for logprobs (the small model of the cascade in
+scraper/llm_client.py) get a confidence drawn between 0.5 and 1, reported
+as the logprob of the answer, or in the JSON when the model is asked to
+report it; the answer is wrong with probability 1 - confidence.
+
+Latency is drawn per request from a distribution, optionally per model:
+
+    python bench/llm_stub.py --latency lognormal:0.8,0.5 --latency gpt-4o=fixed:3
+
+Distributions: fixed:S, uniform:A,B, normal:MEAN,SD, lognormal:MEDIAN,SIGMA,
+pareto:SCALE,ALPHA (heavy tail). All in seconds.
+"""
+import re
+import json
+import zlib
+import hashlib
+import math
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+FIT_TEXT = (
+    "The dress sits close through the bodice and waist, which follows the client's proportions well, "
+    "while the flared skirt adds ease over the hips. The structured fabric keeps its shape and the "
+    "neckline balances the shoulders. Overall the fit is flattering and practical. Verdict: recommended."
+)
+
+IMAGE_ROLES = ["fabric_close_image", "fabric_dress_image", "model_wearning_front_image", "model_wearning_back_image"]
+
+# Answers for the analyzers that ask for a word rather than yes/no.
+WORD_ANSWERS = {
+    "neckline type": "round",
+    "high-mid-low": "mid",
+    "back type": "closed",
+    "hemline": "straight",
+}
+
+
+def parse_latency(spec):
+    """'lognormal:0.8,0.5' -> callable returning seconds."""
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v]
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        mu = math.log(values[0])
+        return lambda: random.lognormvariate(mu, values[1])
+    if kind == "pareto":
+        return lambda: values[0] * random.paretovariate(values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class LatencyModel:
+    def __init__(self, specs=(), seed=None):
+        self.default = lambda: 0.0
+        self.per_model = {}
+        for spec in specs:
+            model, sep, rest = spec.partition("=")
+            if sep and ":" not in model:
+                self.per_model[model] = parse_latency(rest)
+            else:
+                self.default = parse_latency(spec)
+        if seed is not None:
+            random.seed(seed)
+
+    def sample(self, model):
+        return self.per_model.get(model, self.default)()
+
+
+def _texts(messages):
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            yield content
+        elif isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    yield part.get("text", "")
+
+
+def _image_count(messages):
+    return sum(
+        1 for m in messages if isinstance(m.get("content"), list)
+        for part in m["content"] if part.get("type") == "image_url"
+    )
+
+
+def _tokens(content, value, confidence):
+    """Logprobs for `content`: certain except the answer `value`, which has `confidence`."""
+    start = content.find(f'"{value}"') + 1 if value else -1
+    tokens = []
+    for match in re.finditer(r"\w+|\W", content):
+        chosen = value and match.start() == start
+        token = match.group()
+        tokens.append({"token": token, "logprob": math.log(confidence) if chosen else 0.0,
+                       "bytes": list(token.encode("utf-8")), "top_logprobs": []})
+    return tokens
+
+
+def answer(messages, confidence=None):
+    texts = list(_texts(messages))
+    joined = "\n".join(texts)
+    last = texts[-1] if texts else ""
+    self_report = '"confidence"' in last and len(texts) > 1
+    if self_report:
+        last = texts[-2]
+
+    if "structures product data" in joined:
+        ids = re.findall(r"This is image (img_\d+)", joined)
+        images = {role: ids[i % len(ids)] for i, role in enumerate(IMAGE_ROLES)} if ids else {}
+        return json.dumps({
+            "Fabric_charactericts": "Structured cotton-twill with a little stretch.",
+            "Model_Measurement": "Model is 177cm and wears a UK 8.",
+            "images": images,
+            "sizing_guide": {},
+        })
+
+    if '"output"' in last:
+        lowered = last.lower()
+        word = next((w for k, w in WORD_ANSWERS.items() if k in lowered), None)
+        output = word or ("yes" if zlib.crc32(last.encode("utf-8")) % 2 else "no")
+        if confidence is not None and random.random() > confidence:
+            output = "other" if word else {"yes": "no", "no": "yes"}[output]
+        reply = {"output": output, "summary": "Stub answer."}
+        if confidence is not None and self_report:
+            reply["confidence"] = round(confidence, 2)
+        return json.dumps(reply)
+
+    return FIT_TEXT
+
+
+def _message_tokens(message):
+    return sum(len(t) for t in _texts([message])) // 4 + 765 * _image_count([message])
+
+
+def _prefixes(body):
+    """(hash, tokens) of each leading run of messages, shortest first."""
+    digest = hashlib.sha256(body.get("model", "").encode("utf-8"))
+    tokens, prefixes = 0, []
+    for message in body.get("messages", []):
+        digest.update(json.dumps(message, sort_keys=True).encode("utf-8"))
+        tokens += _message_tokens(message)
+        prefixes.append((digest.hexdigest(), tokens))
+    return prefixes
+
+
+def completion(body, content, confidence=None, cached_tokens=0):
+    messages = body.get("messages", [])
+    prompt_tokens = sum(_message_tokens(m) for m in messages)
+    payload = {
+        "id": f"chatcmpl-stub-{random.getrandbits(32):08x}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": max(1, len(content) // 4),
+            "total_tokens": prompt_tokens + max(1, len(content) // 4),
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+        },
+    }
+    if body.get("logprobs"):
+        match = re.search(r'"output"\s*:\s*"([^"]*)"', content)
+        value = match.group(1) if match and confidence is not None else None
+        payload["choices"][0]["logprobs"] = {"content": _tokens(content, value, confidence)}
+    return payload
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    latency = LatencyModel()
+    # Pause between streamed chunks; the latency sample is time to first token.
+    token_delay = 0.02
+    stats = {"requests": 0}
+    # Prefix hashes of answered requests.
+    cache = set()
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        prefixes = _prefixes(body)
+        with self.lock:
+            self.stats["requests"] += 1
+            cached = max((tokens for digest, tokens in prefixes if digest in self.cache), default=0)
+        time.sleep(self.latency.sample(body.get("model", "")))
+        with self.lock:
+            self.cache.update(digest for digest, _ in prefixes)
+        cached = cached - cached % 128 if cached >= 1024 else 0
+        messages = body.get("messages", [])
+        small = body.get("logprobs") or any('"confidence"' in t for t in _texts(messages[-1:]))
+        confidence = 0.5 + 0.5 * random.betavariate(4, 1) if small else None
+        payload = completion(body, answer(messages, confidence), confidence, cached)
+        if body.get("stream"):
+            self._send_stream(payload, (body.get("stream_options") or {}).get("include_usage"))
+        else:
+            self._send_json(200, payload)
+
+    def _send_event(self, payload):
+        self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def _send_stream(self, payload, include_usage):
+        """Replay a completion as server-sent chunks, a few words at a time."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        content = payload["choices"][0]["message"]["content"]
+        words = re.findall(r"\S+\s*", content)
+        base = {k: payload[k] for k in ("id", "created", "model")}
+        base["object"] = "chat.completion.chunk"
+        for i in range(0, len(words), 3):
+            delta = {"content": "".join(words[i:i + 3])}
+            if i == 0:
+                delta["role"] = "assistant"
+            self._send_event(dict(base, choices=[{"index": 0, "delta": delta, "finish_reason": None}]))
+            time.sleep(self.token_delay)
+        self._send_event(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+        if include_usage:
+            self._send_event(dict(base, choices=[], usage=payload["usage"]))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def start(latency_specs=(), port=0, seed=None):
+    """Serve the stub on a background thread; returns (server, base_url ending in /v1)."""
+    handler = type("Handler", (StubHandler,), {
+        "latency": LatencyModel(latency_specs, seed),
+        "stats": {"requests": 0},
+        "cache": set(),
+        "lock": threading.Lock(),
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, name="llm-stub", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", action="append", default=[], help="[model=]kind:params, repeatable")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    server, base_url = start(args.latency, args.port, args.seed)
+    print(f"OpenAI stub at {base_url}  (export OPENAI_BASE_URL={base_url})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""/result page weight and image time, originals vs resized variants.
+
+Fetches /result through the Flask test client, picks the image a browser
+would pick from each <picture> for a few viewports (srcset width
+descriptors, first <source> whose type it accepts) and fetches it:
+
+    original    what the page used to reference: the full-size download
+    cold        the variant is rendered on this request
+    hot         the variant is served from the variant cache
+
+Reports bytes per page load and, per mode, server time plus decode time
+(PIL, as a stand-in for the browser's decoder) summed over the images.
+
+    python bench/page_weight.py [--repeat 3]
+
+Without data/result.json a synthetic one is written, plus eight 2000x2667
+images in static/images/downloaded if that directory is empty; both are
+removed afterwards, as is the variant cache built here.
+"""
+import io
+import os
+import re
+import sys
+import time
+import html
+import shutil
+import argparse
+import tempfile
+
+import cv2
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import result_rps  # noqa: E402
+
+# name -> (CSS width of the image slot, device pixel ratio)
+VIEWPORTS = {
+    "mobile": (375, 2),
+    "desktop": (1440 * 0.30, 1),
+    "desktop-hidpi": (1440 * 0.30, 2),
+}
+ACCEPT = {
+    "avif": "image/avif,image/webp,image/*,*/*;q=0.8",
+    "webp": "image/webp,image/*,*/*;q=0.8",
+    "jpeg": "image/*,*/*;q=0.8",
+}
+
+
+def pictures(page):
+    """[(original url, [(type, srcset)], fallback srcset)] for each <picture> on the page."""
+    found = []
+    for link, block in re.findall(r'<a href="([^"]+)"[^>]*>\s*<picture>(.*?)</picture>', page, re.S):
+        sources = re.findall(r'<source type="([^"]+)" srcset="([^"]+)"', block)
+        fallback = re.search(r'<img src="[^"]+" srcset="([^"]+)"', block).group(1)
+        found.append((html.unescape(link), sources, fallback))
+    return found
+
+
+def pick(srcset, slot, dpr):
+    """The candidate a browser takes: the narrowest one covering slot * dpr, else the widest."""
+    candidates = sorted((int(w[:-1]), html.unescape(url)) for url, w in (c.strip().split() for c in srcset.split(",")))
+    need = slot * dpr
+    return next((url for width, url in candidates if width >= need), candidates[-1][1])
+
+
+def fetch(client, url, accept):
+    start = time.perf_counter()
+    response = client.get(url, headers={"Accept": accept})
+    served = time.perf_counter() - start
+    assert response.status_code == 200, (url, response.status_code)
+    start = time.perf_counter()
+    with Image.open(io.BytesIO(response.data)) as image:
+        image.load()
+    return len(response.data), served, time.perf_counter() - start
+
+
+def load_page(client, urls, accept):
+    total = served = decoded = 0
+    for url in urls:
+        size, s, d = fetch(client, url, accept)
+        total, served, decoded = total + size, served + s, decoded + d
+    return total, served, decoded
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    os.environ.setdefault("PIPELINE_WARMUP", "0")
+    os.environ.setdefault("UPLOAD_GC", "0")
+    variant_dir = tempfile.mkdtemp(prefix="variants-")
+    os.environ["IMAGE_VARIANT_DIR"] = variant_dir
+    image_dir = os.path.join("static", "images", "downloaded")
+    if not os.path.isdir(image_dir) or not os.listdir(image_dir):
+        os.makedirs(image_dir, exist_ok=True)
+        for i in range(8):
+            cv2.imwrite(os.path.join(image_dir, f"image_{i}.jpeg"),
+                        cv2.resize(result_rps.fixture_server._dress_image(back=i % 2 == 1), (2000, 2667)))
+        created = [image_dir]
+    else:
+        created = []
+    created += result_rps.write_fixture()
+    try:
+        import app as app_module
+        from scraper import image_variants
+
+        client = app_module.app.test_client()
+        page = client.get("/result").get_data(as_text=True)
+        found = pictures(page)
+        print(f"/result: {len(page) / 1024:.1f}KB HTML, {len(found)} images, formats {', '.join(image_variants.FORMATS)}")
+
+        originals = [link for link, _, _ in found]
+        size, served, decoded = load_page(client, originals, ACCEPT["jpeg"])
+        print(f"\n{'viewport':14} {'format':6} {'mode':9} {'image KB':>9} {'serve ms':>9} {'decode ms':>10}")
+        print(f"{'any':14} {'jpeg':6} {'original':9} {size / 1024:>9.0f} {served * 1000:>9.0f} {decoded * 1000:>10.0f}")
+
+        for viewport, (slot, dpr) in VIEWPORTS.items():
+            for fmt, accept in ACCEPT.items():
+                if fmt not in image_variants.FORMATS:
+                    continue
+                urls = []
+                for _, sources, fallback in found:
+                    srcset = next((s for t, s in sources if t == image_variants.mime_type(fmt)), fallback)
+                    urls.append(pick(srcset, slot, dpr))
+                image_variants.clear()
+                for mode in ("cold", "hot"):
+                    runs = [load_page(client, urls, accept) for _ in range(1 if mode == "cold" else args.repeat)]
+                    size = runs[0][0]
+                    served = min(r[1] for r in runs)
+                    decoded = min(r[2] for r in runs)
+                    print(f"{viewport:14} {fmt:6} {mode:9} {size / 1024:>9.0f} {served * 1000:>9.0f} {decoded * 1000:>10.0f}")
+    finally:
+        shutil.rmtree(variant_dir, ignore_errors=True)
+        for path in created:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
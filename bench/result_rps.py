@@ -0,0 +1,116 @@
+"""Requests/sec on a hot /result page.
+
+Drives app.result() through the Flask test client from several threads:
+
+    uncached   RESULT_CACHE=0 behaviour: read result.json, list images, render
+    cached     page served from the in-process cache (200 with body)
+    304        browser revalidation with If-None-Match
+
+    python bench/result_rps.py [--seconds 5] [--threads 4]
+
+Without data/result.json a synthetic one is written, plus eight images in
+static/images/downloaded if that directory is empty; both are removed
+afterwards.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import threading
+
+import cv2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fixture_server  # noqa: E402
+
+
+def write_fixture():
+    created = []
+    if not os.path.exists(os.path.join("data", "result.json")):
+        os.makedirs("data", exist_ok=True)
+        with open(os.path.join("data", "result.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "editors_notes": "A bias-cut slip dress in washed silk satin.\n" * 4,
+                "size_fit": ["Fits true to size", "Designed for a relaxed fit", "Mid-weight, non-stretchy fabric"],
+                "model_measurements": ["Model is 177cm and is wearing a FR36"],
+                "details_care": ["100% silk", "Dry clean", "Concealed zip fastening along side"],
+                "size_guide_popup": {f"Size {s}": {"bust": str(80 + 4 * i), "waist": str(62 + 4 * i), "hip": str(88 + 4 * i)}
+                                     for i, s in enumerate(["XS", "S", "M", "L", "XL"])},
+            }, f)
+        created.append(os.path.join("data", "result.json"))
+    image_dir = os.path.join("static", "images", "downloaded")
+    if not os.path.isdir(image_dir) or not os.listdir(image_dir):
+        os.makedirs(image_dir, exist_ok=True)
+        for i in range(8):
+            cv2.imwrite(os.path.join(image_dir, f"image_{i}.jpeg"), fixture_server._dress_image(back=i % 2 == 1))
+        created.append(image_dir)
+    return created
+
+
+def hammer(app_module, seconds, threads, headers=None, expect=200):
+    counts = [0] * threads
+    errors = [0] * threads
+    deadline = time.perf_counter() + seconds
+
+    def worker(slot):
+        client = app_module.app.test_client()
+        while time.perf_counter() < deadline:
+            response = client.get("/result", headers=headers or {})
+            if response.status_code != expect:
+                errors[slot] += 1
+            counts[slot] += 1
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    return sum(counts) / elapsed, sum(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    os.environ.setdefault("PIPELINE_WARMUP", "0")
+    os.environ.setdefault("UPLOAD_GC", "0")
+    created = write_fixture()
+    try:
+        import app as app_module
+
+        first = app_module.app.test_client().get("/result")
+        etag = first.headers.get("ETag")
+        print(f"/result: {len(first.data) / 1024:.0f}KB, ETag {etag}, Cache-Control {first.headers.get('Cache-Control')}")
+
+        app_module.RESULT_CACHE = False
+        uncached, e1 = hammer(app_module, args.seconds, args.threads)
+        app_module.RESULT_CACHE = True
+        cached, e2 = hammer(app_module, args.seconds, args.threads)
+        revalidated, e3 = hammer(app_module, args.seconds, args.threads, {"If-None-Match": etag}, expect=304)
+
+        print(f"{'mode':12} {'req/s':>9}")
+        print(f"{'uncached':12} {uncached:>9.0f}")
+        print(f"{'cached':12} {cached:>9.0f}   x{cached / uncached:.1f}")
+        print(f"{'304':12} {revalidated:>9.0f}   x{revalidated / uncached:.1f}")
+        if e1 or e2 or e3:
+            print(f"unexpected statuses: {e1 + e2 + e3}")
+    finally:
+        for path in created:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
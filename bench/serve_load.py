@@ -0,0 +1,219 @@
+"""Load comparison of the two serving modes.
+
+    gthread   gunicorn app:app --workers 1 --threads 2 --timeout 300 (the Dockerfile default before asgi)
+    asgi      gunicorn asgi:app --worker-class uvicorn.workers.UvicornWorker --workers 1 --timeout 300 (the default)
+
+Each server is started in turn against bench/llm_stub.py; N users then
+post an analysis job at the same moment and read its conclusion stream
+to the end. The product is served from a precomputed dress-tag entry
+(scraper/tag_store.py), so what is measured is the I/O-bound part every
+job has: the upload, the job bookkeeping and a streamed model call of
+--latency seconds. Scraping needs a browser per job and is left out.
+
+    python bench/serve_load.py [--users 50,200] [--latency fixed:3] [--modes gthread,asgi]
+
+Reports per mode and user count: completed jobs, errors, p50/p95/max
+time to the end of the stream, throughput and the server's peak thread
+count (Linux /proc).
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+import subprocess
+
+import aiohttp
+import cv2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fixture_server  # noqa: E402
+import llm_stub  # noqa: E402
+from e2e import percentile, write_body_photos  # noqa: E402
+
+PRODUCT_URL = "https://shop.test/en-us/shop/product/demo/clothing/dresses/bench-dress/1234567"
+
+MODES = {
+    "gthread": ["app:app", "--workers", "1", "--threads", "2"],
+    "asgi": ["asgi:app", "--worker-class", "uvicorn.workers.UvicornWorker", "--workers", "1"],
+}
+
+
+def seed_tag_store(workdir):
+    """A stored scrape and analyzer results for PRODUCT_URL, so jobs go straight to the fit step."""
+    from scraper import tag_store
+
+    scrape_dir = os.path.join(workdir, "scrape")
+    images_dir = os.path.join(scrape_dir, "images", "downloaded")
+    os.makedirs(images_dir, exist_ok=True)
+    images = {}
+    for idx, role in enumerate(llm_stub.IMAGE_ROLES):
+        path = os.path.join(images_dir, f"image_{idx}.jpeg")
+        cv2.imwrite(path, fixture_server._dress_image(back=role == "model_wearning_back_image"))
+        images[role] = path
+    with open(os.path.join(scrape_dir, "formatted_output.json"), "w", encoding="utf-8") as f:
+        json.dump({"Fabric_charactericts": "Mid-weight crepe", "images": images}, f)
+    results = {key: {"output": "yes", "summary": "bench"} for key in tag_store.pipeline.ANALYZER_KEYS}
+    tag_store.put(PRODUCT_URL, scrape_dir, results)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def thread_count(pid):
+    """Threads of `pid` and its direct children."""
+    total = 0
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            if int(entry) == pid or int(fields[1]) == pid:
+                total += int(fields[17])
+        except (OSError, IndexError, ValueError):
+            continue
+    return total
+
+
+def start_server(mode, port, env, workdir):
+    command = [sys.executable, "-m", "gunicorn", *MODES[mode], "--bind", f"127.0.0.1:{port}",
+               "--timeout", "300", "--chdir", workdir, "--pythonpath", ROOT]
+    server = subprocess.Popen(command, env=env, cwd=workdir,
+                              stdout=subprocess.DEVNULL, stderr=open(os.path.join(workdir, f"{mode}.log"), "ab"))
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f"{mode} server did not start; see {workdir}/{mode}.log")
+
+
+async def run_job(session, base_url, front, side):
+    start = time.perf_counter()
+    form = aiohttp.FormData()
+    form.add_field("dress_url", PRODUCT_URL)
+    form.add_field("action", "analyze")
+    form.add_field("front_image", open(front, "rb"), filename="front.jpg", content_type="image/jpeg")
+    form.add_field("side_image", open(side, "rb"), filename="side.jpg", content_type="image/jpeg")
+    try:
+        async with session.post(f"{base_url}/", data=form, allow_redirects=False) as response:
+            location = response.headers.get("Location", "")
+            if response.status != 302 or "/output/" not in location:
+                return {"ok": False, "error": f"POST {response.status}"}
+        job_id = location.rsplit("/", 1)[-1]
+        ok = False
+        async with session.get(f"{base_url}/jobs/{job_id}/conclusion") as stream:
+            async for line in stream.content:
+                if line.startswith(b"event: done"):
+                    ok = True
+                elif line.startswith(b"event: failed"):
+                    break
+        return {"ok": ok, "seconds": time.perf_counter() - start, "error": None if ok else "stream failed"}
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        return {"ok": False, "error": type(e).__name__}
+
+
+async def run_users(base_url, users, front, side):
+    timeout = aiohttp.ClientTimeout(total=300)
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        return await asyncio.gather(*[run_job(session, base_url, front, side) for _ in range(users)])
+
+
+def measure(mode, users, env, workdir, front, side):
+    port = free_port()
+    server = start_server(mode, port, env, workdir)
+    peak = [0]
+    stop = threading.Event()
+
+    def sample():
+        while not stop.is_set():
+            peak[0] = max(peak[0], thread_count(server.pid))
+            stop.wait(0.2)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        started = time.perf_counter()
+        outcomes = asyncio.run(run_users(f"http://127.0.0.1:{port}", users, front, side))
+        wall = time.perf_counter() - started
+    finally:
+        stop.set()
+        sampler.join()
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+    seconds = [o["seconds"] for o in outcomes if o["ok"]]
+    errors = {}
+    for o in outcomes:
+        if not o["ok"]:
+            errors[o["error"]] = errors.get(o["error"], 0) + 1
+    return {
+        "mode": mode,
+        "users": users,
+        "ok": len(seconds),
+        "errors": errors,
+        "p50": percentile(seconds, 50),
+        "p95": percentile(seconds, 95),
+        "max": max(seconds) if seconds else None,
+        "jobs_per_min": round(60.0 * len(seconds) / wall, 1),
+        "peak_threads": peak[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", default="50,200", help="comma separated concurrent user counts")
+    parser.add_argument("--latency", action="append", default=[], help="stub latency, [model=]kind:params")
+    parser.add_argument("--modes", default="gthread,asgi")
+    args = parser.parse_args()
+
+    latency = args.latency or ["fixed:3"]
+    stub, stub_url = llm_stub.start(latency)
+    workdir = tempfile.mkdtemp(prefix="fitapp-serve-")
+    env = dict(os.environ,
+               OPENAI_API_KEY="stub", OPENAI_BASE_URL=stub_url, OPENAI_API_BASE=stub_url,
+               PYTHONPATH=ROOT, PIPELINE_WARMUP="0", UPLOAD_GC="0",
+               TAG_STORE_DIR=os.path.join(workdir, "tags"),
+               RESULTS_DB=os.path.join(workdir, "results.db"),
+               UPLOAD_DB=os.path.join(workdir, "uploads.db"),
+               TRACE_DIR=os.path.join(workdir, "traces"))
+    os.environ["TAG_STORE_DIR"] = env["TAG_STORE_DIR"]
+    seed_tag_store(workdir)
+    front, side = write_body_photos(workdir)
+
+    print(f"stub latency {', '.join(latency)}; workdir {workdir}")
+    print(f"{'mode':8} {'users':>6} {'ok':>5} {'p50 s':>7} {'p95 s':>7} {'max s':>7} {'jobs/min':>9} {'threads':>8}  errors")
+    try:
+        for users in [int(u) for u in args.users.split(",")]:
+            for mode in args.modes.split(","):
+                r = measure(mode, users, env, workdir, front, side)
+                fmt = lambda v: f"{v:>7.1f}" if v is not None else f"{'-':>7}"
+                print(f"{mode:8} {users:>6} {r['ok']:>5} {fmt(r['p50'])} {fmt(r['p95'])} {fmt(r['max'])} "
+                      f"{r['jobs_per_min']:>9} {r['peak_threads']:>8}  {r['errors'] or ''}")
+    finally:
+        stub.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""Agreement between the local silhouette tags and the LLM answers.
+
+Fixture layout (one directory per product):
+
+    bench/fixtures/analyzers/<case>/dress.jpg              product shot (fabric_dress_image)
+    bench/fixtures/analyzers/<case>/analysis_results.json  analyzer output recorded with the LLM
+
+    python bench/silhouette_report.py [--fixtures DIR] [--min-confidence 0.8]
+    python bench/silhouette_report.py --record      # (re)record LLM answers, needs OPENAI_API_KEY
+    python bench/silhouette_report.py --synthesize  # rewrite the drawn fixture set
+
+Agreement is only reported for real product shots with recorded LLM
+answers. The checked-in fixtures are drawn dresses (synthesize()):
+sheath, shift, fit-and-flare, empire and A-line cuts, some with a
+high/low or asymmetric hem or one shoulder. Their analysis_results.json
+holds the answers they were drawn to have ("source": "drawn"). The
+drawing and its answers come from the same hand, so they only check that
+the measurement still reads the shapes it was written for; they say
+nothing about how often it agrees with the LLM on real photos.
+"""
+import os
+import sys
+import json
+import argparse
+from collections import defaultdict
+
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from scraper import silhouette  # noqa: E402
+
+DEFAULT_FIXTURES = os.path.join(ROOT, "bench", "fixtures", "analyzers")
+
+# Drawn cuts: (height fraction from shoulder to hem, half width as a fraction of the dress height) outline
+# points, and the answers a person gives about them.
+CUTS = {
+    "sheath": ([(0, 0.15), (0.12, 0.17), (0.22, 0.15), (0.33, 0.125), (0.45, 0.165), (1, 0.155)],
+               {"flare_under_bust": "no", "flare_waist": "no", "waist_tight": "yes", "waist_loose": "no"}),
+    "shift": ([(0, 0.15), (0.12, 0.17), (0.33, 0.165), (0.45, 0.17), (1, 0.18)],
+              {"flare_under_bust": "no", "flare_waist": "no", "waist_tight": "no", "waist_loose": "yes"}),
+    "fit-and-flare": ([(0, 0.15), (0.12, 0.17), (0.22, 0.15), (0.33, 0.12), (0.45, 0.22), (1, 0.34)],
+                      {"flare_under_bust": "no", "flare_waist": "yes", "waist_tight": "yes", "waist_loose": "no"}),
+    "empire": ([(0, 0.15), (0.12, 0.17), (0.2, 0.14), (0.4, 0.22), (1, 0.33)],
+               {"flare_under_bust": "yes", "flare_waist": "no", "waist_tight": "no", "waist_loose": "yes"}),
+    "a-line": ([(0, 0.15), (0.12, 0.17), (0.3, 0.14), (0.36, 0.14), (1, 0.30)],
+               {"flare_under_bust": "no", "flare_waist": "yes", "waist_tight": "yes", "waist_loose": "no"}),
+}
+HEMS = {"straight": "Straight", "high-low": "High/Low", "asymmetric": "Asymmetric"}
+
+
+def draw_dress(outline, hem="straight", one_shoulder=False, size=(920, 1380), seed=0):
+    """A flat dress on a light backdrop, shoulders at 18% and hem at 86% of the frame."""
+    width, height = size
+    top, bottom, cx = int(0.18 * height), int(0.86 * height), width // 2
+    span = bottom - top
+    fractions, halves = zip(*outline)
+    y, x = np.mgrid[0:height, 0:width]
+    across = (x - cx) / span
+    half = np.interp((y - top) / span, fractions, halves)
+    widest = max(halves)
+    upper = np.full(across.shape, float(top))
+    if one_shoulder:
+        # Straight across from one shoulder to under the other arm.
+        upper = top + 0.12 * span * np.clip((across + 0.17) / 0.34, 0, 1)
+    lower = np.full(across.shape, float(bottom))
+    if hem == "high-low":
+        lower = bottom - 0.10 * span * (1 - np.clip(np.abs(across) / widest, 0, 1) ** 2)
+    elif hem == "asymmetric":
+        lower = bottom - 0.12 * span * np.clip((across + widest) / (2 * widest), 0, 1)
+    mask = (np.abs(across) <= half) & (y >= upper) & (y <= lower)
+    if not one_shoulder:
+        mask &= ((x - cx) / 60.0) ** 2 + ((y - top) / 40.0) ** 2 > 1
+    image = np.full((height, width, 3), 238, np.uint8)
+    image[mask] = (60, 40, 150)
+    noise = np.random.default_rng(seed).normal(0, 2, image.shape)
+    return np.clip(image + noise, 0, 255).astype(np.uint8)
+
+
+def synthesize(fixtures_dir):
+    """Write the drawn fixture set (see the module docstring)."""
+    drawn = [(cut, "straight", False) for cut in CUTS]
+    drawn += [("sheath", "asymmetric", False), ("fit-and-flare", "high-low", False), ("a-line", "high-low", False),
+              ("empire", "asymmetric", False), ("sheath", "straight", True), ("shift", "straight", True),
+              ("fit-and-flare", "asymmetric", True)]
+    for index, (cut, hem, one_shoulder) in enumerate(drawn):
+        name = "-".join([cut] + ([hem] if hem != "straight" else []) + (["one-shoulder"] if one_shoulder else []))
+        case_dir = os.path.join(fixtures_dir, name)
+        os.makedirs(case_dir, exist_ok=True)
+        outline, answers = CUTS[cut]
+        cv2.imwrite(os.path.join(case_dir, "dress.jpg"), draw_dress(outline, hem, one_shoulder, seed=index),
+                    [cv2.IMWRITE_JPEG_QUALITY, 70])
+        results = {
+            "source": "drawn",
+            "flare_analysis": {k: answers[k] for k in ("flare_under_bust", "flare_waist")},
+            "waist_analysis": {k: answers[k] for k in ("waist_tight", "waist_loose")},
+            "hemline_analysis": {"Hemline": HEMS[hem]},
+            "one_shoulder_analysis": {"One_Shoulder": "yes" if one_shoulder else "no"},
+        }
+        with open(os.path.join(case_dir, "analysis_results.json"), "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    print(f"wrote {len(drawn)} drawn cases to {fixtures_dir}")
+
+
+def cases(fixtures_dir):
+    for name in sorted(os.listdir(fixtures_dir)):
+        case_dir = os.path.join(fixtures_dir, name)
+        image = os.path.join(case_dir, "dress.jpg")
+        if os.path.isfile(image):
+            yield name, case_dir, image
+
+
+def record(fixtures_dir):
+    """Run the geometric analyzers with local answers disabled and store their output."""
+    from scraper import pipeline
+
+    silhouette.MIN_CONFIDENCE = 2.0
+    keys = sorted(set(silhouette.TAG_SOURCES.values()))
+    for name, case_dir, image in cases(fixtures_dir):
+        formatted = os.path.join(case_dir, "formatted_output.json")
+        with open(formatted, "w", encoding="utf-8") as f:
+            json.dump({"images": {"fabric_dress_image": image}}, f)
+        results = {key: pipeline.run_analyzer(key, formatted) for key in keys}
+        with open(os.path.join(case_dir, "analysis_results.json"), "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"recorded {name}")
+
+
+def report(fixtures_dir, min_confidence):
+    # (source, tag) -> count; source is "drawn" or "llm".
+    compared = defaultdict(int)
+    agreed = defaultdict(int)
+    answered_locally = defaultdict(int)
+    agreed_locally = defaultdict(int)
+    total_cases = defaultdict(int)
+
+    for name, case_dir, image in cases(fixtures_dir):
+        results_path = os.path.join(case_dir, "analysis_results.json")
+        if not os.path.exists(results_path):
+            continue
+        with open(results_path, "r", encoding="utf-8") as f:
+            llm_results = json.load(f)
+        source = "drawn" if llm_results.get("source") == "drawn" else "llm"
+        total_cases[source] += 1
+        geometry = silhouette.analyze(image)
+
+        for tag, analyzer in silhouette.TAG_SOURCES.items():
+            llm_value = str(llm_results.get(analyzer, {}).get(tag, "")).lower()
+            estimate = geometry["tags"].get(tag)
+            if not estimate or llm_value in ("", "unknown", "error", "skipped"):
+                continue
+            match = estimate["value"] == llm_value
+            compared[source, tag] += 1
+            agreed[source, tag] += match
+            if estimate["confidence"] >= min_confidence:
+                answered_locally[source, tag] += 1
+                agreed_locally[source, tag] += match
+
+    print(f"min confidence {min_confidence}")
+    titles = {
+        "llm": f"Agreement with recorded LLM answers, {total_cases['llm']} product shots",
+        "drawn": f"Drawn cases, {total_cases['drawn']}: matches with the answers they were drawn to have "
+                 f"(a regression check, not an agreement figure)",
+    }
+    for source in ("llm", "drawn"):
+        if not total_cases[source]:
+            continue
+        print(f"\n{titles[source]}")
+        word = "agree" if source == "llm" else "match"
+        print(f"{'tag':18} {word + '(all)':>11} {'local':>6} {word + '(local)':>13}")
+        for tag in silhouette.TAG_SOURCES:
+            if not compared[source, tag]:
+                continue
+            overall = agreed[source, tag] / compared[source, tag]
+            local = answered_locally[source, tag]
+            local_rate = f"{agreed_locally[source, tag] / local:.0%}" if local else "-"
+            print(f"{tag:18} {overall:11.0%} {local:6d} {local_rate:>13}")
+        saved = sum(answered_locally[key] for key in answered_locally if key[0] == source)
+        asked = sum(compared[key] for key in compared if key[0] == source)
+        print(f"Answered locally: {saved} of {asked} geometric questions")
+    if not total_cases["llm"]:
+        print("\nNo product shots with recorded LLM answers: add real product photos and run --record "
+              "for an agreement figure.")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES)
+    parser.add_argument("--min-confidence", type=float, default=silhouette.MIN_CONFIDENCE)
+    parser.add_argument("--record", action="store_true")
+    parser.add_argument("--synthesize", action="store_true")
+    args = parser.parse_args()
+
+    if args.synthesize:
+        synthesize(args.fixtures)
+    if args.record:
+        record(args.fixtures)
+    report(args.fixtures, args.min_confidence)
+
+
+if __name__ == "__main__":
+    main()
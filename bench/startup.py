@@ -0,0 +1,61 @@
+"""Cold-start and first-request latency of the web app.
+
+Each run uses a fresh interpreter so nothing is cached in-process:
+
+    python bench/startup.py [--runs 5] [--warmup]
+
+--warmup keeps PIPELINE_WARMUP enabled and also reports how long the
+preloaded analyzer workers take to become ready.
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+client = app.app.test_client()
+response = client.get("/")
+t2 = time.perf_counter()
+workers = None
+if WARMUP:
+    from scraper import pipeline
+    pipeline.warm_up()
+    workers = time.perf_counter() - t0
+print(json.dumps({"import": t1 - t0, "first_request": t2 - t1, "status": response.status_code, "workers_ready": workers}))
+"""
+
+
+def run_once(warmup):
+    env = dict(os.environ, PIPELINE_WARMUP="1" if warmup else "0")
+    proc = subprocess.run(
+        [sys.executable, "-c", f"WARMUP = {warmup!r}\n" + PROBE],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warmup", action="store_true")
+    args = parser.parse_args()
+
+    samples = [run_once(args.warmup) for _ in range(args.runs)]
+    for metric in ("import", "first_request", "workers_ready"):
+        values = [s[metric] for s in samples if s[metric] is not None]
+        if values:
+            print(f"{metric:15} median {statistics.median(values) * 1000:8.1f} ms   max {max(values) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
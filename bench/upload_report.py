@@ -0,0 +1,139 @@
+"""What upload normalisation saves on the fit call.
+
+For each photo, compares what the fit prompt used to carry (the raw upload
+decoded and re-encoded at full size) with the normalised JPEG stored by
+scraper/uploads.py: bytes on the wire, estimated image tokens and, with
+--live, the latency of a vision call carrying a front/side pair.
+
+    python bench/upload_report.py photo1.jpg photo2.jpg [--max-dimension 1536]
+    python bench/upload_report.py                       # synthetic 12 MP phone photos
+    python bench/upload_report.py --live [--calls 3]    # needs OPENAI_API_KEY
+"""
+import os
+import sys
+import math
+import time
+import base64
+import argparse
+import statistics
+import tempfile
+
+import cv2
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from scraper import uploads  # noqa: E402
+
+
+def image_tokens(width, height):
+    """OpenAI's high-detail image cost: fit in 2048, shortest side to 768, 170 per 512px tile + 85."""
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+def legacy_b64(path):
+    """What Script.encode_image used to send: cv2 decode + default JPEG re-encode."""
+    image = cv2.imread(path)
+    _, buffer = cv2.imencode(".jpg", image)
+    return base64.b64encode(buffer).decode("utf-8"), image.shape[1], image.shape[0]
+
+
+def synthetic_photos(directory):
+    """Two 4032x3024 photos stored sideways with an EXIF rotation, like most phones write them."""
+    paths = []
+    rng = np.random.default_rng(11)
+    for name in ("front", "side"):
+        pixels = np.clip(rng.normal(150, 40, (3024, 4032, 3)), 0, 255).astype(np.uint8)
+        cv2.ellipse(pixels, (2016, 1512), (1400, 500), 0, 0, 360, (90, 120, 170), -1)
+        image = Image.fromarray(pixels)
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        path = os.path.join(directory, f"{name}.jpg")
+        image.save(path, format="JPEG", quality=92, exif=exif)
+        paths.append(path)
+    return paths
+
+
+def measure(path, directory, max_dimension):
+    original_bytes = os.path.getsize(path)
+    old_b64, old_w, old_h = legacy_b64(path)
+
+    out_path = os.path.join(directory, f"normalised_{os.path.basename(path)}.jpg")
+    start = time.perf_counter()
+    with open(path, "rb") as f, uploads.copy_limited(f) as buffer:
+        sizes = uploads.normalize(buffer, out_path, max_dimension)
+    seconds = time.perf_counter() - start
+    with open(out_path, "rb") as f:
+        new_b64 = base64.b64encode(f.read()).decode("utf-8")
+    new_w, new_h = sizes["stored_size"]
+
+    return {
+        "path": path,
+        "normalised_path": out_path,
+        "original_bytes": original_bytes,
+        "old_b64": len(old_b64),
+        "new_b64": len(new_b64),
+        "old_tokens": image_tokens(old_w, old_h),
+        "new_tokens": image_tokens(new_w, new_h),
+        "old_size": (old_w, old_h),
+        "new_size": (new_w, new_h),
+        "normalise_seconds": seconds,
+        "old_payload": old_b64,
+        "new_payload": new_b64,
+    }
+
+
+def time_calls(payloads, calls):
+    from langchain_openai import ChatOpenAI
+    from langchain_core.messages import HumanMessage
+
+    llm = ChatOpenAI(model="gpt-4.1", temperature=0, max_tokens=50)
+    content = [{"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{p}"}} for p in payloads]
+    content.append({"type": "text", "text": "Describe the person's posture in one sentence."})
+    samples = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        llm.invoke([HumanMessage(content=content)])
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("photos", nargs="*")
+    parser.add_argument("--max-dimension", type=int, default=uploads.MAX_DIMENSION)
+    parser.add_argument("--live", action="store_true")
+    parser.add_argument("--calls", type=int, default=3)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="upload-report-")
+    photos = args.photos or synthetic_photos(directory)
+    rows = [measure(path, directory, args.max_dimension) for path in photos]
+
+    print(f"{'photo':24} {'upload':>10} {'sent before':>12} {'sent after':>11} {'tokens':>13} {'size after':>12} {'normalise':>10}")
+    for r in rows:
+        print(f"{os.path.basename(r['path'])[:24]:24} {r['original_bytes'] / 1024:>8.0f}KB {r['old_b64'] / 1024:>10.0f}KB "
+              f"{r['new_b64'] / 1024:>9.0f}KB {r['old_tokens']:>6} -> {r['new_tokens']:<4} "
+              f"{r['new_size'][0]:>5}x{r['new_size'][1]:<5} {r['normalise_seconds'] * 1000:>8.0f}ms")
+
+    old_total = sum(r["old_b64"] for r in rows)
+    new_total = sum(r["new_b64"] for r in rows)
+    print(f"\nrequest bytes for these photos: {old_total / 1024:.0f}KB -> {new_total / 1024:.0f}KB "
+          f"({1 - new_total / old_total:.0%} less)")
+    print(f"image tokens: {sum(r['old_tokens'] for r in rows)} -> {sum(r['new_tokens'] for r in rows)}")
+
+    if args.live:
+        pair = rows[:2]
+        before = time_calls([r["old_payload"] for r in pair], args.calls)
+        after = time_calls([r["new_payload"] for r in pair], args.calls)
+        print(f"\nvision call with {len(pair)} photos, median of {args.calls}: {before:.2f}s -> {after:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
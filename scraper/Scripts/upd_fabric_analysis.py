@@ -1,15 +1,15 @@
-import base64
 import json
 import re
-import cv2
 from typing import Dict, Any, List, Tuple, Optional
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, AIMessage
 import os
+from scraper import fabric_appearance, llm_client, prompt_prefix
 
 api_key = os.getenv("OPENAI_API_KEY")
 
 OPENAI_MODEL = "gpt-4.1"
+ANALYZER = "fabric_analysis"
 
 def run_fabric_analysis_from_json(json_path=None):
     print("Running Fabric analysis...")
@@ -23,16 +23,8 @@ def run_fabric_analysis_from_json(json_path=None):
         print(f"Error loading scraped data: {e}")
         return None
 
-    fabric_characteristics = dress_data["Fabric_charactericts"]
     fabric_dress_image_path = dress_data["images"]["fabric_dress_image"]
 
-    def encode_image(image_path: str) -> str:
-        image = cv2.imread(image_path)
-        if image is None:
-            raise FileNotFoundError(f"Image not found: {image_path}")
-        _, buffer = cv2.imencode(".jpg", image)
-        return base64.b64encode(buffer).decode("utf-8")
-
     def extract_json_response(raw: str) -> Dict[str, Any]:
         try:
             match = re.search(r"\{.*?\"output\"\s*:\s*\"(yes|no)\".*?\}", raw, re.DOTALL)
@@ -66,27 +58,24 @@ Respond only in strict JSON format:
 }}"""
         })
         messages.append(HumanMessage(content=content))
-        response = llm.invoke(messages)
+        response = llm_client.invoke(llm, messages, ANALYZER)
         messages.append(AIMessage(content=response.content))
         parsed = extract_json_response(response.content)
+        llm_client.record_parse(ANALYZER, parsed["output"])
         return {
             tag: parsed["output"].lower(),
             f"{tag}_summary": parsed["summary"]
         }
 
-    def run_fabric_analysis(image_path: str, fabric_description: str):
-        image_b64 = encode_image(image_path)
-        llm = ChatOpenAI(model=OPENAI_MODEL, openai_api_key=api_key, temperature=0)
-        messages = []
+    def run_fabric_analysis(image_path: str):
+        appearance = fabric_appearance.analyze(image_path)
+        llm = ChatOpenAI(model=OPENAI_MODEL, openai_api_key=api_key, temperature=0,
+                         extra_body=prompt_prefix.extra_body(dress_data))
+        messages = prompt_prefix.messages(dress_data, "the fabric of this dress", focus="fabric_dress_image")
         state = {}
 
         intro_message = [
-            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_b64}"}},
-            {"type": "text", "text": f"""You're a senior specialist and a fashion expert on women's dresses. Your job is to help analyze this dress.
-I'm attaching an image and mentioning about the fabric of the dress. I will ask you a series of questions about this dress.
-
-Fabric Description:
-{fabric_description}
+            {"type": "text", "text": f"""{fabric_appearance.describe(appearance)}
 
 Give separate evaluations for bodice and skirt.
 
@@ -96,9 +85,10 @@ Respond only in JSON format:
 {{\n  \"output\": \"yes\" or \"no\",\n  \"summary\": \"short explanation\"\n}}"""}
         ]
         messages.append(HumanMessage(content=intro_message))
-        response = llm.invoke(messages)
+        response = llm_client.invoke(llm, messages, ANALYZER)
         messages.append(AIMessage(content=response.content))
         parsed = extract_json_response(response.content)
+        llm_client.record_parse(ANALYZER, parsed["output"])
         state["fabric_thick"] = parsed["output"].lower()
         state["fabric_thick_summary"] = parsed["summary"]
 
@@ -128,12 +118,16 @@ Respond only in JSON format:
                 state[tag] = "skipped"
                 continue
 
-            result = run_prompt(llm, messages, tag, question, image_b64)
+            local = fabric_appearance.confident(appearance, tag)
+            if local:
+                state.update(local)
+                continue
+
+            result = run_prompt(llm, messages, tag, question)
             state.update(result)
         print("Fabric analysis completed.")
         return state
 
-    fabric_description = f"""{fabric_characteristics}"""
     print("runing fabric analysis...")
-    fabric_results = run_fabric_analysis(fabric_dress_image_path, fabric_description)
+    fabric_results = run_fabric_analysis(fabric_dress_image_path)
     return fabric_results
\ No newline at end of file
@@ -6,10 +6,12 @@ import os
 from typing import Dict, Any, List, Tuple, Optional
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, AIMessage
+from scraper import silhouette, llm_client, tracing, prompt_prefix
 
 api_key = os.getenv("OPENAI_API_KEY")
 
 OPENAI_MODEL = "gpt-4.1"
+ANALYZER = "hemline_analysis"
 
 def run_Hemline_analysis_from_json(json_path=None) -> Dict[str, Any]:
     print("Running Hemline analysis...")
@@ -28,7 +30,7 @@ def run_Hemline_analysis_from_json(json_path=None) -> Dict[str, Any]:
         except Exception as e:
             return {"error": f"Error extracting image path: {e}"}
 
-        results = run_full_analysis(image_path)
+        results = run_full_analysis(image_path, dress_data)
         if not isinstance(results, dict):
             return {"error": "run_full_analysis did not return a dictionary"}
         return results
@@ -37,11 +39,14 @@ def run_Hemline_analysis_from_json(json_path=None) -> Dict[str, Any]:
 
 def encode_image(image_path: str) -> str:
     """Encode an image as base64 string."""
-    image = cv2.imread(image_path)
-    if image is None:
-        raise FileNotFoundError(f"Image not found: {image_path}")
-    _, buffer = cv2.imencode(".jpg", image)
-    return base64.b64encode(buffer).decode("utf-8")
+    with tracing.span("encode_image", image=os.path.basename(image_path)) as span:
+        image = cv2.imread(image_path)
+        if image is None:
+            raise FileNotFoundError(f"Image not found: {image_path}")
+        _, buffer = cv2.imencode(".jpg", image)
+        encoded = base64.b64encode(buffer).decode("utf-8")
+        span["bytes"] = len(encoded)
+    return encoded
 
 def extract_json_response(raw: str) -> Dict[str, Any]:
     """Extract JSON object from LLM text output."""
@@ -82,27 +87,34 @@ Respond only in strict JSON format:
         })
 
         messages.append(HumanMessage(content=content))
-        response = llm.invoke(messages)
+        response = llm_client.invoke(llm, messages, ANALYZER)
         messages.append(AIMessage(content=response.content))
 
         parsed = extract_json_response(response.content)
+        llm_client.record_parse(ANALYZER, parsed["output"])
         return {
             tag: parsed["output"].lower(),
             f"{tag}_summary": parsed["summary"]
         }
     except Exception as e:
+        llm_client.record_parse(ANALYZER, "error")
         return {
             tag: "error",
             f"{tag}_summary": f"Error in run_prompt: {e}"
         }
 
-def run_full_analysis(image_path: str) -> Dict[str, Any]:
+def run_full_analysis(image_path: str, dress_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     try:
-        image_b64 = encode_image(image_path)
         if api_key is None:
             return {"error": "OPENAI_API_KEY missing"}
-        llm = ChatOpenAI(model=OPENAI_MODEL, openai_api_key=api_key, temperature=0)
-        messages = []
+        llm = ChatOpenAI(model=OPENAI_MODEL, openai_api_key=api_key, temperature=0,
+                         extra_body=prompt_prefix.extra_body(dress_data))
+        if dress_data:
+            messages = prompt_prefix.messages(dress_data, "the hemline of this dress", focus="fabric_dress_image")
+            image_b64 = None
+        else:
+            messages = []
+            image_b64 = encode_image(image_path)
         
         state: Dict[str, Any] = {}
         prompts: List[Tuple[str, str, bool]] = [
@@ -111,7 +123,13 @@ def run_full_analysis(image_path: str) -> Dict[str, Any]:
         ]
 
 
+        geometry = silhouette.for_dress(dress_data, image_path)
+
         for tag, question, use_image in prompts:
+            local = silhouette.confident(geometry, tag)
+            if local:
+                state.update(local)
+                continue
             image = image_b64 if use_image else None
             result = run_prompt(llm, messages, tag, question, image_b64=image)
             state.update(result)
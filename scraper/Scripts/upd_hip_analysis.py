@@ -5,10 +5,19 @@ import cv2
 from typing import TypedDict, Optional, Callable, List
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 from langchain_openai import ChatOpenAI
+from scraper import llm_client, tracing
 
 api_key = os.getenv("OPENAI_API_KEY")
+ANALYZER = "hip_analysis"
 
-llm_model = ChatOpenAI(api_key=api_key)
+_llm_model = None
+
+def get_llm() -> ChatOpenAI:
+    # Built on first use so importing this module stays cheap.
+    global _llm_model
+    if _llm_model is None:
+        _llm_model = ChatOpenAI(api_key=api_key)
+    return _llm_model
 
 class HipState(TypedDict, total=False):
     images: List[str]
@@ -25,11 +34,14 @@ class HipState(TypedDict, total=False):
     low_hip_loose: Optional[str]
 
 def encode_image(image_path: str) -> str:
-    image = cv2.imread(image_path)
-    if image is None:
-        raise FileNotFoundError(f"Could not read image at path: {image_path}")
-    _, buffer = cv2.imencode(".jpg", image)
-    return base64.b64encode(buffer).decode("utf-8")
+    with tracing.span("encode_image", image=os.path.basename(image_path)) as span:
+        image = cv2.imread(image_path)
+        if image is None:
+            raise FileNotFoundError(f"Could not read image at path: {image_path}")
+        _, buffer = cv2.imencode(".jpg", image)
+        encoded = base64.b64encode(buffer).decode("utf-8")
+        span["bytes"] = len(encoded)
+    return encoded
 
 def create_prompt_node(question: str, key: str, with_image: bool = False, is_first: bool = False) -> Callable[[HipState], HipState]:
     def node(state: HipState) -> HipState:
@@ -52,7 +64,7 @@ def create_prompt_node(question: str, key: str, with_image: bool = False, is_fir
                 })
 
         messages.append(HumanMessage(content=content))
-        response = llm_model.invoke(messages)
+        response = llm_client.invoke(get_llm(), messages, ANALYZER)
         messages.append(AIMessage(content=response.content))
         state["messages"] = messages
 
@@ -62,6 +74,7 @@ def create_prompt_node(question: str, key: str, with_image: bool = False, is_fir
         except Exception:
             lowered = response.content.lower()
             state[key] = "yes" if "yes" in lowered else "no" if "no" in lowered else "unknown"
+        llm_client.record_parse(ANALYZER, state[key])
 
         return state
     return node
@@ -6,18 +6,23 @@ import asyncio
 from typing import Dict, Any, List, Optional
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, AIMessage
+from scraper import llm_client, tracing, prompt_prefix
 import os
 
 OPENAI_MODEL = "gpt-4.1"
+ANALYZER = "skirt_analysis"
 api_key = os.getenv("OPENAI_API_KEY")
 
 
 def encode_image(image_path: str) -> str:
-    image = cv2.imread(image_path)
-    if image is None:
-        raise FileNotFoundError(f"Image not found: {image_path}")
-    _, buffer = cv2.imencode(".jpg", image)
-    return base64.b64encode(buffer).decode("utf-8")
+    with tracing.span("encode_image", image=os.path.basename(image_path)) as span:
+        image = cv2.imread(image_path)
+        if image is None:
+            raise FileNotFoundError(f"Image not found: {image_path}")
+        _, buffer = cv2.imencode(".jpg", image)
+        encoded = base64.b64encode(buffer).decode("utf-8")
+        span["bytes"] = len(encoded)
+    return encoded
 
 def extract_json_response(raw: str) -> Dict[str, Any]:
     try:
@@ -39,14 +44,16 @@ async def run_prompt_async(
     content = []
     if image_b64:
         content.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_b64}"}})
+    measurements = f"Model's measurements:\n{model_measurements}\n\n" if model_measurements else ""
     content.append({
         "type": "text",
-        "text": f"Model's measurements:\n{model_measurements}\n\n{question}\n\nRespond only in strict JSON format:\n{{\n  \"output\": \"yes\" or \"no\",\n  \"summary\": \"very short explanation\"\n}}"
+        "text": f"{measurements}{question}\n\nRespond only in strict JSON format:\n{{\n  \"output\": \"yes\" or \"no\",\n  \"summary\": \"very short explanation\"\n}}"
     })
     messages.append(HumanMessage(content=content))
-    response = await llm.ainvoke(messages)
+    response = await llm_client.ainvoke(llm, messages, ANALYZER)
     messages.append(AIMessage(content=response.content))
     parsed = extract_json_response(response.content)
+    llm_client.record_parse(ANALYZER, parsed["output"])
     return {
         tag: parsed["output"].lower(),
         f"{tag}_summary": parsed["summary"]
@@ -80,15 +87,20 @@ async def analyze_skirt_section(
             state[f"skirt_{level}_{sub}"] = "skipped"
     return state
 
-async def run_skirt_analysis(image_path: str, model_measurements: str) -> Dict[str, Any]:
+async def run_skirt_analysis(image_path: str, model_measurements: str,
+                             dress_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     print("Starting skirt analysis...")
-    try:
-        image_b64 = encode_image(image_path)
-    except Exception as e:
-        return {"error": f"Image encoding error: {e}"}
-
-    llm = ChatOpenAI(model=OPENAI_MODEL, openai_api_key=api_key, temperature=0)
-    messages = []
+    llm = ChatOpenAI(model=OPENAI_MODEL, openai_api_key=api_key, temperature=0,
+                     extra_body=prompt_prefix.extra_body(dress_data))
+    if dress_data:
+        messages = prompt_prefix.messages(dress_data, "the skirt length of this dress", focus="model_wearning_front_image")
+        image_b64, model_measurements = None, ""
+    else:
+        try:
+            image_b64 = encode_image(image_path)
+        except Exception as e:
+            return {"error": f"Image encoding error: {e}"}
+        messages = []
 
     state = {}
     intro_result = await run_prompt_async(
@@ -127,7 +139,7 @@ def run_skirt_analysis_from_json(json_path=None) -> Dict[str, Any]:
         model_measurements = dress_data["Model_Measurement"]
         image_path = dress_data["images"]["model_wearning_front_image"]
 
-        results = asyncio.run(run_skirt_analysis(image_path, model_measurements))
+        results = asyncio.run(run_skirt_analysis(image_path, model_measurements, dress_data))
         if not isinstance(results, dict):
             return {"error": "run_skirt_analysis did not return a dictionary"}
         print("Skirt analysis completed")
@@ -0,0 +1,155 @@
+import os
+import math
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from scraper import metrics, tracing
+
+# Admission control for analysis submissions.
+#
+# At most MAX_ACTIVE jobs run at once; up to MAX_QUEUED more wait for a slot
+# in arrival order, for at most QUEUE_TIMEOUT seconds. A client (see
+# app.client_id) may hold PER_CLIENT jobs, running or queued. Anything
+# beyond that is refused at once, before the photos are stored: 429 when
+# the client is over its own limit, 503 when the queue is full or the wait
+# ran out, both with a Retry-After estimated from recent job durations.
+#
+# State is guarded by a threading lock rather than asyncio primitives, so
+# the gate works whichever loop a job runs on (the shared pipeline loop
+# behind the request threads, or worker.py's); a queued job's future is
+# resolved on its own loop.
+
+MAX_ACTIVE = int(os.getenv("ADMISSION_MAX_ACTIVE", "4"))
+MAX_QUEUED = int(os.getenv("ADMISSION_MAX_QUEUED", "16"))
+PER_CLIENT = int(os.getenv("ADMISSION_PER_CLIENT", "2"))
+QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "120"))
+# Expected job duration before any job has finished, for Retry-After.
+INITIAL_JOB_SECONDS = float(os.getenv("ADMISSION_INITIAL_JOB_SECONDS", "60"))
+MAX_RETRY_AFTER = 600
+
+
+class Rejected(Exception):
+    """The job was not admitted; `status` is the HTTP status to answer with."""
+
+    def __init__(self, status: int, reason: str, retry_after: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Gate:
+    def __init__(self, max_active: int, max_queued: int, per_client: int):
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.per_client = per_client
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiters = deque()
+        self._clients: Dict[str, int] = {}
+        self._job_seconds = INITIAL_JOB_SECONDS
+
+    def _gauges(self):
+        metrics.set_gauge("admission_active", self._active)
+        metrics.set_gauge("admission_queued", len(self._waiters))
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to free up for a new arrival."""
+        rounds = len(self._waiters) / max(1, self.max_active) + 1
+        return max(1, min(MAX_RETRY_AFTER, math.ceil(self._job_seconds * rounds)))
+
+    def _reject(self, status: int, reason: str, message: str) -> Rejected:
+        metrics.inc("admission_rejected_total", reason=reason)
+        return Rejected(status, reason, self.retry_after(), message)
+
+    def _enter(self, client: str) -> Optional[Dict]:
+        """Take a slot (None) or a place in the queue (the waiter); raises Rejected."""
+        with self._lock:
+            if self._clients.get(client, 0) >= self.per_client:
+                raise self._reject(429, "client_limit",
+                                   f"You already have {self.per_client} analyses in progress; please wait for one to finish.")
+            if self._active < self.max_active and not self._waiters:
+                self._active += 1
+                waiter = None
+            elif len(self._waiters) >= self.max_queued:
+                raise self._reject(503, "queue_full", "The service is busy; please try again shortly.")
+            else:
+                waiter = {"future": asyncio.get_running_loop().create_future(),
+                          "loop": asyncio.get_running_loop(), "granted": False}
+                self._waiters.append(waiter)
+            self._clients[client] = self._clients.get(client, 0) + 1
+            self._gauges()
+        return waiter
+
+    def _leave_queue(self, client: str, waiter: Dict) -> bool:
+        """Drop a waiter that gave up; True if it was granted a slot in the meantime."""
+        with self._lock:
+            if waiter["granted"]:
+                return True
+            self._waiters.remove(waiter)
+            self._drop_client(client)
+            self._gauges()
+        return False
+
+    def _drop_client(self, client: str):
+        count = self._clients.get(client, 0) - 1
+        if count > 0:
+            self._clients[client] = count
+        else:
+            self._clients.pop(client, None)
+
+    def release(self, client: str, seconds: Optional[float] = None):
+        """Give the slot back, straight to the next waiter if there is one."""
+        with self._lock:
+            self._drop_client(client)
+            if seconds is not None:
+                self._job_seconds = 0.8 * self._job_seconds + 0.2 * seconds
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                waiter["granted"] = True
+                waiter["loop"].call_soon_threadsafe(_resolve, waiter["future"])
+            else:
+                self._active -= 1
+            self._gauges()
+
+    @asynccontextmanager
+    async def slot(self, client: str, timeout: Optional[float] = None):
+        """Hold a job slot for the block; raises Rejected instead of entering when saturated."""
+        submitted = time.time()
+        waiter = self._enter(client)
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter["future"]), QUEUE_TIMEOUT if timeout is None else timeout)
+            except asyncio.TimeoutError:
+                if not self._leave_queue(client, waiter):
+                    raise self._reject(503, "queue_timeout", "The service is busy; please try again shortly.")
+            except asyncio.CancelledError:
+                if self._leave_queue(client, waiter):
+                    self.release(client)
+                raise
+        started = time.time()
+        metrics.observe("admission_queue_wait_seconds", started - submitted)
+        metrics.inc("admission_admitted_total", queued=waiter is not None)
+        parent = tracing.current()
+        if parent:
+            tracing.record(parent[0], "admission_wait", submitted, started, parent[1], queued=waiter is not None)
+        try:
+            yield
+        finally:
+            self.release(client, time.time() - started)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+gate = Gate(MAX_ACTIVE, MAX_QUEUED, PER_CLIENT)
+
+
+def slot(client: str, timeout: Optional[float] = None):
+    return gate.slot(client, timeout)
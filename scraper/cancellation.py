@@ -0,0 +1,205 @@
+import os
+import time
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+from scraper import metrics, tracing
+
+# Cancelling jobs nobody is waiting for any more.
+#
+# A job registers the task running it (the analysis POST, then the
+# conclusion stream). cancel() cancels that task from any thread. The
+# CancelledError unwinds every await in the job: the Playwright browser and
+# its context are closed, pending image downloads and in-flight model
+# calls are dropped (closing the HTTP stream stops generation), queued
+# analyzer jobs are taken out of the pool queue and the admission slot goes
+# to the next job. The conclusion stream has no task; it polls
+# is_cancelled() between chunks.
+#
+# An analyzer already running in a worker process cannot be interrupted;
+# its submission carries a token (watch()), and a flagged token makes the
+# process skip the model calls it has not made yet (check()).
+# Tokens are marker files in CANCEL_DIR, visible to every process.
+#
+# Jobs are cancelled by the explicit endpoint, by every page following a
+# conclusion stream going away (once none has reconnected to it within
+# STREAM_RECONNECT_GRACE) or by the same browser resubmitting the same
+# dress. Each cancellation is charged what the job would still have cost:
+# the average duration and tokens of completed jobs minus what it had
+# already spent.
+
+CANCEL_DIR = os.getenv("CANCEL_DIR", os.path.join("data", "cancel"))
+# Registered jobs that never finish (e.g. the output page was never opened) are dropped after this.
+JOB_TTL = float(os.getenv("CANCEL_JOB_TTL", "3600"))
+INITIAL_JOB_SECONDS = float(os.getenv("CANCEL_INITIAL_JOB_SECONDS", "60"))
+INITIAL_JOB_TOKENS = float(os.getenv("CANCEL_INITIAL_JOB_TOKENS", "20000"))
+
+
+class Cancelled(Exception):
+    """Raised in a worker process before a model call whose submission was cancelled."""
+
+
+class Job:
+    def __init__(self, job_id: str, key: Optional[tuple]):
+        self.job_id = job_id
+        self.key = key
+        self.started = time.time()
+        self.tokens = 0
+        self.task: Optional[asyncio.Task] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.reason: Optional[str] = None
+        self.accounted = False
+
+
+_lock = threading.Lock()
+_jobs: Dict[str, Job] = {}
+_keys: Dict[tuple, str] = {}
+_expected = {"seconds": INITIAL_JOB_SECONDS, "tokens": INITIAL_JOB_TOKENS}
+
+
+def _prune(now: float) -> None:
+    for job_id in [j for j, job in _jobs.items() if job.task is None and now - job.started > JOB_TTL]:
+        _forget(job_id)
+
+
+def _forget(job_id: str) -> Optional[Job]:
+    job = _jobs.pop(job_id, None)
+    if job is not None and job.key is not None and _keys.get(job.key) == job_id:
+        del _keys[job.key]
+    return job
+
+
+def register(job_id: str, key: Optional[tuple] = None) -> Optional[str]:
+    """Track `job_id` as run by the current task; an earlier job with the same `key` is cancelled (id returned)."""
+    task = asyncio.current_task()
+    now = time.time()
+    with _lock:
+        _prune(now)
+        job = _jobs.get(job_id)
+        if job is None:
+            job = _jobs[job_id] = Job(job_id, key)
+        job.task, job.loop = task, asyncio.get_running_loop()
+        replaced = _keys.get(key) if key is not None else None
+        if key is not None:
+            _keys[key] = job_id
+    if replaced and replaced != job_id:
+        cancel(replaced, "resubmitted")
+        return replaced
+    return None
+
+
+def detach(job_id: str) -> None:
+    """The task running the job is done but the job is not (its conclusion stream comes next)."""
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is not None:
+            job.task = job.loop = None
+
+
+def finish(job_id: str, completed: bool = True) -> None:
+    """Stop tracking the job; a completed one updates the averages cancellations are charged against."""
+    with _lock:
+        job = _forget(job_id)
+        if job is None or job.reason or not completed:
+            return
+        _expected["seconds"] = 0.8 * _expected["seconds"] + 0.2 * (time.time() - job.started)
+        _expected["tokens"] = 0.8 * _expected["tokens"] + 0.2 * job.tokens
+
+
+def cancel(job_id: str, reason: str = "request") -> bool:
+    """Cancel a registered job from any thread; False if it is not running here."""
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None or job.reason:
+            return False
+        job.reason = reason
+        task, loop = job.task, job.loop
+    if task is not None and not task.done():
+        loop.call_soon_threadsafe(task.cancel)
+    else:
+        # Between the analysis and its conclusion stream, or a synchronous stream: nothing to interrupt.
+        cancelled(job_id)
+    return True
+
+
+def is_registered(job_id: str) -> bool:
+    return job_id in _jobs
+
+
+def is_cancelled(job_id: str) -> bool:
+    job = _jobs.get(job_id)
+    return job is not None and job.reason is not None
+
+
+def cancelled(job_id: str, reason: str = "disconnect") -> Dict[str, Any]:
+    """Account for a cancelled job once; the job's CancelledError handler calls this too."""
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None or job.accounted:
+            return {}
+        job.reason = job.reason or reason
+        job.accounted = True
+        elapsed = time.time() - job.started
+        saved = {
+            "reason": job.reason,
+            "elapsed_seconds": round(elapsed, 3),
+            "saved_seconds": round(max(0.0, _expected["seconds"] - elapsed), 3),
+            "saved_tokens": int(max(0.0, _expected["tokens"] - job.tokens)),
+        }
+    metrics.inc("jobs_cancelled_total", reason=saved["reason"])
+    metrics.inc("cancel_saved_seconds_total", saved["saved_seconds"])
+    metrics.inc("cancel_saved_tokens_total", saved["saved_tokens"])
+    now = time.time()
+    tracing.record(job_id, "cancelled", now, now, **saved)
+    print(f"[DEBUG] Job {job_id} cancelled: {saved}")
+    return saved
+
+
+def charge(tokens: int, job_id: Optional[str] = None) -> None:
+    """Add model tokens to a job (default: the job being traced)."""
+    if job_id is None:
+        parent = tracing.current()
+        job_id = parent[0] if parent else None
+    job = _jobs.get(job_id) if job_id else None
+    if job is not None:
+        job.tokens += tokens
+
+
+# Cancellation tokens for work handed to other processes.
+
+_token: contextvars.ContextVar = contextvars.ContextVar("cancel_token", default=None)
+
+
+def _token_path(token: str) -> str:
+    return os.path.join(CANCEL_DIR, token)
+
+
+def flag(token: str) -> None:
+    os.makedirs(CANCEL_DIR, exist_ok=True)
+    open(_token_path(token), "w").close()
+
+
+def clear(token: str) -> None:
+    try:
+        os.remove(_token_path(token))
+    except FileNotFoundError:
+        pass
+
+
+@contextmanager
+def watch(token: Optional[str]):
+    """Make check() inside the block raise once `token` is flagged."""
+    reset = _token.set(token)
+    try:
+        yield
+    finally:
+        _token.reset(reset)
+
+
+def check() -> None:
+    token = _token.get()
+    if token and os.path.exists(_token_path(token)):
+        raise Cancelled("The job was cancelled")
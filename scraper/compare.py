@@ -0,0 +1,176 @@
+import os
+import re
+import json
+import shutil
+import asyncio
+from typing import Dict, Any, List, Optional
+
+from scraper import pipeline, fit_rules, tracing
+
+# Several dresses for the same client in one request.
+#
+# Each dress gets its tags as an analysis job would (jobs.dress_tags: the
+# tag store first, otherwise one shared scrape, structure and analyzer run
+# per product), under the job id <compare_id>-<index>. Every step of every
+# dress (scrape, structure, each analyzer, fit) holds a slot of one
+# per-request semaphore, so a comparison cannot take more than CONCURRENCY
+# slots of the shared worker pool. The client's photos are sent in one body
+# turn, asked once, and every dress's fit conversation starts from its
+# question and answer. The per-dress tag files live in data/compare/<id>/,
+# which is removed when the comparison finishes; the record keeps a copy
+# of each dress's front image next to it.
+
+MAX_DRESSES = int(os.getenv("COMPARE_MAX_DRESSES", "5"))
+CONCURRENCY = int(os.getenv("COMPARE_CONCURRENCY", "8"))
+COMPARE_DIR = os.path.join("data", "compare")
+
+# Ranking order of the fit step's final verdict; unparsed verdicts sit in between.
+VERDICT_ORDER = {"recommended": 0, None: 1, "not recommended": 2}
+
+
+def parse_urls(*fields: Optional[str]) -> List[str]:
+    """http(s) URLs from form fields (one per line, or comma separated), first occurrence kept."""
+    urls = []
+    for field in fields:
+        for token in re.split(r"[\s,]+", field or ""):
+            if token.startswith(("http://", "https://")) and token not in urls:
+                urls.append(token)
+    return urls
+
+
+def verdict(conclusion: Any) -> Optional[str]:
+    """'recommended' / 'not recommended' from the last verdict the conclusion mentions."""
+    if not isinstance(conclusion, str):
+        return None
+    found = re.findall(r"(not\s+)?recommended", conclusion.lower())
+    if not found:
+        return None
+    return "not recommended" if found[-1] else "recommended"
+
+
+def image_file(compare_id: str, index: int) -> str:
+    """Where the comparison keeps dress `index`'s front image."""
+    return os.path.join(COMPARE_DIR, f"{compare_id}-{index}.jpg")
+
+
+async def _step(budget: asyncio.Semaphore, func, *args):
+    async with budget:
+        return await func(*args)
+
+
+def _keep_image(dress_json_path: str, target: str) -> Optional[str]:
+    try:
+        with open(dress_json_path, "r", encoding="utf-8") as f:
+            shutil.copyfile(json.load(f)["images"]["model_wearning_front_image"], target)
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return target
+
+
+async def analyze_dress(compare_id: str, index: int, url: str, work_dir: str, budget: asyncio.Semaphore,
+                        front_image_path: str, side_image_path: str, body: "asyncio.Future") -> Dict[str, Any]:
+    """Tag and fit one dress, its tags file inside `work_dir`; errors end up in the result.
+
+    `body` resolves to the shared body turn (None: each fit asks it itself).
+    """
+    # Imported here: jobs imports this module.
+    from scraper import jobs
+
+    job_id = f"{compare_id}-{index}"
+    dress: Dict[str, Any] = {"index": index, "url": url, "image_path": None}
+    tags_json_path = os.path.join(work_dir, f"{index}_analysis.json")
+
+    with tracing.span("dress", index=index, url=url) as span:
+        try:
+            results, dress_json_path, state, _ = await jobs.dress_tags(url, job_id, budget=budget)
+            span["tag_store"] = state
+            analysis = {k: v for k, v in results.items() if v}
+            if not analysis:
+                raise Exception("No analysis results produced!")
+            analysis["Implications"] = fit_rules.evaluate(analysis)
+            with open(tags_json_path, "w", encoding="utf-8") as f:
+                json.dump(analysis, f, ensure_ascii=False, indent=2)
+
+            conclusion = await _step(budget, pipeline.arun_fit_analysis, front_image_path, side_image_path,
+                                     tags_json_path, dress_json_path, await body)
+            if isinstance(conclusion, dict):
+                raise Exception(conclusion.get("error", "Fit analysis failed"))
+            dress["image_path"] = await asyncio.to_thread(_keep_image, dress_json_path, image_file(compare_id, index))
+        except Exception as e:
+            print(f"[ERROR] Comparison dress {index} ({url}) failed: {e}")
+            dress["error"] = str(e)
+            span["error"] = str(e)
+            return dress
+        finally:
+            jobs.release_scrape(job_id)
+
+        analysis["Conclusion"] = conclusion
+        dress["analysis"] = analysis
+        dress["verdict"] = verdict(conclusion)
+        dress["analyzer_errors"] = sum(1 for v in results.values() if isinstance(v, dict) and "error" in v)
+        span["verdict"] = dress["verdict"]
+    return dress
+
+
+def rank(dresses: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Recommended first, then dresses with fewer failed analyzers; failed dresses last, input order otherwise."""
+    def key(dress):
+        if "error" in dress:
+            return (len(VERDICT_ORDER), 0, dress["index"])
+        return (VERDICT_ORDER.get(dress.get("verdict"), 1), dress.get("analyzer_errors", 0), dress["index"])
+
+    ranked = sorted(dresses, key=key)
+    for position, dress in enumerate(ranked, 1):
+        dress["rank"] = position
+    return ranked
+
+
+async def run(compare_id: str, urls: List[str], front_image_path: str, side_image_path: str,
+              concurrency: Optional[int] = None) -> Dict[str, Any]:
+    """Analyze `urls` concurrently for one client; returns the ranked comparison record."""
+    concurrency = concurrency or CONCURRENCY
+    budget = asyncio.Semaphore(concurrency)
+    work_dir = os.path.abspath(os.path.join(COMPARE_DIR, compare_id))
+    os.makedirs(work_dir, exist_ok=True)
+
+    async def body_turn():
+        try:
+            return await _step(budget, pipeline.abody_history, front_image_path, side_image_path)
+        except Exception as e:
+            print(f"[ERROR] Comparison body turn failed; each fit asks it again: {e}")
+            return None
+
+    try:
+        with tracing.span("compare", dresses=len(urls), concurrency=concurrency):
+            # Asked while the dresses are tagged; each fit waits for it.
+            body = asyncio.ensure_future(body_turn())
+            try:
+                dresses = await asyncio.gather(*[
+                    analyze_dress(compare_id, index, url, work_dir, budget, front_image_path, side_image_path, body)
+                    for index, url in enumerate(urls)
+                ])
+            finally:
+                body.cancel()
+    finally:
+        await asyncio.to_thread(shutil.rmtree, work_dir, True)
+
+    return {
+        "compare_id": compare_id,
+        "dresses": rank(list(dresses)),
+    }
+
+
+def save(record: Dict[str, Any]) -> str:
+    os.makedirs(COMPARE_DIR, exist_ok=True)
+    path = os.path.join(COMPARE_DIR, f"{record['compare_id']}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(record, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def load(compare_id: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(COMPARE_DIR, f"{compare_id}.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
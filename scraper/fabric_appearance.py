@@ -0,0 +1,142 @@
+import os
+import cv2
+import numpy as np
+from typing import Dict, Any, Optional
+
+from scraper import silhouette
+
+# Tags below this confidence are left to the LLM.
+MIN_CONFIDENCE = float(os.getenv("FABRIC_MIN_CONFIDENCE", "0.8"))
+
+LOCAL_TAGS = ["fabric_light_colored", "fabric_shiny", "fabric_sheer"]
+
+
+def _margin(value: float, threshold: float, scale: float) -> float:
+    return float(np.clip(abs(value - threshold) / scale, 0, 1))
+
+
+def colour_clusters(lab_pixels: np.ndarray, min_share: float = 0.05) -> int:
+    """Number of coarse Lab bins that each hold at least `min_share` of the pixels."""
+    bins = (lab_pixels // np.array([32, 16, 16])).astype(np.int32)
+    keys = bins[:, 0] * 256 + bins[:, 1] * 16 + bins[:, 2]
+    _, counts = np.unique(keys, return_counts=True)
+    return int(np.sum(counts >= min_share * keys.size))
+
+
+def measure(image: np.ndarray, mask: np.ndarray, outline: np.ndarray) -> Dict[str, float]:
+    """Pixel statistics of the dress region.
+
+    `mask` is the filled silhouette, `outline` the same silhouette without
+    hole filling, so backdrop showing through the garment can be counted.
+    """
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (7, 7))
+    inner = cv2.erode(mask.astype(np.uint8), kernel).astype(bool)
+    if inner.sum() < 500:
+        inner = mask
+
+    bgr = image[inner].astype(np.float32)
+    luminance = (0.114 * bgr[:, 0] + 0.587 * bgr[:, 1] + 0.299 * bgr[:, 2]) / 255.0
+    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)[inner].astype(np.float32)
+    saturation, value = hsv[:, 1] / 255.0, hsv[:, 2] / 255.0
+    lab = cv2.cvtColor(image, cv2.COLOR_BGR2LAB)[inner].astype(np.float32)
+    ycrcb = cv2.cvtColor(image, cv2.COLOR_BGR2YCrCb)[inner]
+
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY).astype(np.float32) / 255.0
+    texture = np.abs(cv2.Laplacian(gray, cv2.CV_32F, ksize=3))[inner]
+
+    # Specular highlights: bright, desaturated pixels well above the fabric's own tone.
+    highlight_level = max(0.85, float(np.median(value)) + 0.30)
+    highlights = (value >= highlight_level) & (saturation < 0.25)
+
+    skin = (ycrcb[:, 1] >= 135) & (ycrcb[:, 1] <= 180) & (ycrcb[:, 2] >= 85) & (ycrcb[:, 2] <= 135)
+    see_through = mask & ~outline
+
+    p10, p50, p90 = np.percentile(luminance, [10, 50, 90])
+    return {
+        "luminance_median": round(float(p50), 3),
+        "luminance_spread": round(float(p90 - p10), 3),
+        "colour_clusters": colour_clusters(lab),
+        "chroma_std": round(float(np.std(lab[:, 1:], axis=0).mean()), 2),
+        "texture_energy": round(float(texture.mean()), 4),
+        "highlight_ratio": round(float(highlights.mean()), 4),
+        "skin_ratio": round(float(skin.mean()), 4),
+        "see_through_ratio": round(float(see_through.sum() / max(1, mask.sum())), 4),
+    }
+
+
+def classify(stats: Dict[str, float]) -> Dict[str, Dict[str, Any]]:
+    tags: Dict[str, Dict[str, Any]] = {}
+
+    light = stats["luminance_median"]
+    patterned = stats["colour_clusters"] >= 3 and stats["chroma_std"] > 6
+    if patterned:
+        tags["fabric_light_colored"] = {"value": "yes", "confidence": round(0.6 + 0.4 * _margin(stats["chroma_std"], 6, 10), 3)}
+    else:
+        tags["fabric_light_colored"] = {
+            "value": "yes" if light > 0.62 else "no",
+            "confidence": round(_margin(light, 0.62, 0.20), 3),
+        }
+
+    # Satin and similar fabrics: visible highlights on a smooth surface.
+    highlight = stats["highlight_ratio"]
+    smooth = stats["texture_energy"] < 0.04
+    shiny = highlight > 0.03 and smooth
+    if shiny:
+        confidence = _margin(highlight, 0.03, 0.05)
+    else:
+        few_highlights = _margin(highlight, 0.03, 0.03) if highlight <= 0.03 else 0.0
+        textured = _margin(stats["texture_energy"], 0.04, 0.10) if not smooth else 0.0
+        confidence = max(few_highlights, textured)
+    tags["fabric_shiny"] = {"value": "yes" if shiny else "no", "confidence": round(confidence, 3)}
+
+    # Only clear cases: skin or backdrop visible through the dress, or neither at all.
+    through = stats["skin_ratio"] + stats["see_through_ratio"]
+    if through > 0.10:
+        tags["fabric_sheer"] = {"value": "yes", "confidence": round(0.5 + 0.5 * _margin(through, 0.10, 0.15), 3)}
+    else:
+        tags["fabric_sheer"] = {"value": "no", "confidence": round(_margin(through, 0.10, 0.08), 3)}
+
+    return tags
+
+
+def analyze(image_path: str) -> Dict[str, Any]:
+    """Appearance tags for a product shot; never raises so the analyzer can fall back to the LLM."""
+    try:
+        image = silhouette.load_image(image_path)
+        outline = silhouette.segment(image, fill_holes=False)
+        mask = silhouette.fill(outline)
+        if mask.sum() < 500:
+            return {"tags": {}, "stats": {}, "error": "dress region not found"}
+        stats = measure(image, mask, outline)
+        return {"tags": classify(stats), "stats": stats}
+    except Exception as e:
+        return {"tags": {}, "stats": {}, "error": str(e)}
+
+
+def confident(appearance: Dict[str, Any], tag: str, min_confidence: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """Return {tag: value, tag_summary: ...} when the local estimate can replace the LLM."""
+    threshold = MIN_CONFIDENCE if min_confidence is None else min_confidence
+    estimate = appearance.get("tags", {}).get(tag)
+    if not estimate or estimate["confidence"] < threshold:
+        return None
+    return {
+        tag: estimate["value"],
+        f"{tag}_summary": f"Estimated from pixel statistics of the dress (confidence {estimate['confidence']:.2f}).",
+    }
+
+
+def describe(appearance: Dict[str, Any]) -> str:
+    """Short text block handed to the remaining fabric prompts as context."""
+    stats = appearance.get("stats")
+    if not stats:
+        return ""
+    lines = [
+        "Pixel measurements of the dress region (for context, not a substitute for looking at the image):",
+        f"- median luminance {stats['luminance_median']} (0 = black, 1 = white), spread {stats['luminance_spread']}",
+        f"- {stats['colour_clusters']} dominant colour group(s)",
+        f"- texture energy {stats['texture_energy']} (higher = more surface texture)",
+        f"- specular highlight ratio {stats['highlight_ratio']:.1%}",
+    ]
+    for tag, estimate in appearance.get("tags", {}).items():
+        lines.append(f"- {tag}: likely {estimate['value']} (confidence {estimate['confidence']:.2f})")
+    return "\n".join(lines)
@@ -0,0 +1,151 @@
+import fnmatch
+from typing import Dict, Any, List, Callable
+
+# The fit-guidance conditions table, keyed on analyzer output.
+#
+# "when" maps a path into analysis_results ("<analyzer key>.<tag>", nested
+# keys separated by dots, "*" allowed in the last segment) to what the
+# answer must be:
+#   "yes"                 exact answer (case-insensitive)
+#   ["a", "b"]            any of these answers
+#   {"contains": "x"}     answer contains the text
+#   {"all": "no"}         every tag matched by a wildcard has this answer
+# All entries of "when" must hold for the rule to fire. Several rules may
+# share an implication; it is reported once. Table rows with no analyzer
+# tag behind them (elasticized waist, hip darts, tight sleeves, boning,
+# plunging, sweetheart and off-shoulder necklines) are left out until an
+# analyzer asks about them.
+RULES: List[Dict[str, Any]] = [
+    # Fabric
+    {"section": "Fabric", "when": {"fabric_analysis.fabric_shiny": "yes"}, "then": "Calls attention to body"},
+    {"section": "Fabric", "when": {"fabric_analysis.fabric_light_colored": "yes"}, "then": "May show undergarments or highlight features"},
+    {"section": "Fabric", "when": {"fabric_analysis.fabric_stretchy": "yes"}, "then": "Increases comfort"},
+    {"section": "Fabric", "when": {"fabric_analysis.fabric_sheer": "yes"}, "then": "Not modest, requires layering"},
+    {"section": "Fabric", "when": {"fabric_analysis.fabric_retains_odor": "yes"}, "then": "Less desirable, harder to maintain"},
+    {"section": "Fabric", "when": {"fabric_analysis.fabric_machine_washable": "no"}, "then": "High maintenance"},
+
+    # Waist
+    {"section": "Waist", "when": {"waist_analysis.waist_tight": "yes"}, "then": "Accentuates waist, flatters hourglass shapes"},
+    {"section": "Waist", "when": {"waist_analysis.waist_loose": "yes"}, "then": "Can create a boxy silhouette"},
+
+    # Flare
+    {"section": "Flare", "when": {"flare_analysis.flare_*": "yes"}, "then": "Generally flatters most body types"},
+    {"section": "Flare", "when": {"flare_analysis.flare_*": {"all": "no"}}, "then": "May restrict movement, highlights hip/leg area"},
+
+    # Hips
+    {"section": "Hips", "when": {"hip_analysis.high_hip.high_hip_tight": "yes"}, "then": "Accentuates hips"},
+    {"section": "Hips", "when": {"hip_analysis.low_hip.low_hip_tight": "yes"}, "then": "Accentuates hips"},
+
+    # Skirt length
+    {"section": "Skirt Length", "when": {"skirt_analysis.skirt_high_thigh": "yes"}, "then": "Not work appropriate, Reveals legs"},
+    {"section": "Skirt Length", "when": {"skirt_analysis.skirt_mid_thigh": "yes"}, "then": "Accentuates legs, still not formal"},
+    {"section": "Skirt Length", "when": {"skirt_analysis.skirt_knee": "yes"}, "then": "Work appropriate, modest"},
+    {"section": "Skirt Length", "when": {"skirt_analysis.skirt_mid_thigh_tight": "yes"}, "then": "May ride up, accentuates body lines"},
+    {"section": "Skirt Length", "when": {"skirt_analysis.skirt_high_thigh_tight": "yes"}, "then": "May ride up, accentuates body lines"},
+    {"section": "Skirt Length", "when": {"skirt_analysis.skirt_mid_thigh_slits": "yes"}, "then": "Reveals more leg, not modest"},
+    {"section": "Skirt Length", "when": {"skirt_analysis.skirt_high_thigh_slits": "yes"}, "then": "Reveals more leg, not modest"},
+
+    # Hemline
+    {"section": "Hemline", "when": {"hemline_analysis.Hemline": ["high/low", "high-low", "asymmetric"]}, "then": "Draws attention to legs, adds movement"},
+    {"section": "Hemline", "when": {"hemline_analysis.Hemline": "straight"}, "then": "Balanced, formal"},
+    {"section": "Hemline", "when": {"skirt_analysis.skirt_high_thigh": "yes"}, "then": "Hemline too short: not work appropriate"},
+
+    # Neckline
+    {"section": "Neckline", "when": {"neckline_analysis.high-mid-low": "low"}, "then": "Not modest, draws attention to chest"},
+    {"section": "Neckline", "when": {"neckline_analysis.high-mid-low": "high"}, "then": "Brings attention to the face, modest"},
+    {"section": "Neckline", "when": {"neckline_analysis.Neckline Type": ["v-neck", "v-neck with collar"]}, "then": "May accentuate bust"},
+
+    # One shoulder
+    {"section": "One Shoulder", "when": {"one_shoulder_analysis.One_Shoulder": "yes", "one_shoulder_analysis.Tight": "yes"}, "then": "Accentuates larger upper body, not modest"},
+    {"section": "One Shoulder", "when": {"one_shoulder_analysis.One_Shoulder": "yes", "one_shoulder_analysis.Drape": "yes"}, "then": "Adds elegance, softens sharp body lines"},
+
+    # Sleeves
+    {"section": "Sleeves", "when": {"sleeves_analysis.Sleeveless": "yes"}, "then": "Shows arms, may not be modest"},
+    {"section": "Sleeves", "when": {"sleeves_analysis.Strapless": "yes"}, "then": "Shows arms, may not be modest"},
+    {"section": "Sleeves", "when": {"sleeves_analysis.Cap": "yes"}, "then": "Shows arms, may not be modest"},
+    {"section": "Sleeves", "when": {"sleeves_analysis.T-shirt": "yes"}, "then": "Shows arms, may not be modest"},
+    {"section": "Sleeves", "when": {"sleeves_analysis.Puffy-T-shirt": "yes"}, "then": "Adds volume, may hide arms"},
+    {"section": "Sleeves", "when": {"sleeves_analysis.Puffy-Long": "yes"}, "then": "Adds volume, may hide arms"},
+    {"section": "Sleeves", "when": {"sleeves_analysis.Armholes are high-set / close to the shoulders OR shoulder seam is dropped below the shoulder?": {"contains": "high-set"}}, "then": "Makes frame look slimmer"},
+
+    # Back
+    {"section": "Back", "when": {"back_analysis.Back Type": "open"}, "then": "Not work appropriate, Risk of undergarments showing"},
+    {"section": "Back", "when": {"back_analysis.Back Type": ["closed", "racerback"]}, "then": "Modest and structured"},
+    {"section": "Back", "when": {"back_analysis.Back Type": "cutout"}, "then": "Trendy but less conservative"},
+
+    # Bodice
+    {"section": "Bodice", "when": {"bodice_analysis.Built-in Chest Support": "yes"}, "then": "Good for larger bust"},
+    {"section": "Bodice", "when": {"bodice_analysis.Tight": "no"}, "then": "May create a boxy or shapeless look"},
+]
+
+
+def _normalise(value: Any) -> str:
+    return str(value).strip().strip(".").lower()
+
+
+def _lookup(results: Dict[str, Any], path: str) -> List[Any]:
+    """Values at `path`; the last segment may be a wildcard. Summaries are ignored."""
+    parts = path.split(".", 1)
+    node: Any = results.get(parts[0])
+    if len(parts) == 1:
+        return [] if node is None else [node]
+
+    keys = parts[1]
+    # Walk nested dicts; a tag whose own name contains dots is matched whole first.
+    while isinstance(node, dict) and "." in keys and keys not in node:
+        head, keys = keys.split(".", 1)
+        node = node.get(head)
+    if not isinstance(node, dict):
+        return []
+    if keys in node:
+        return [node[keys]]
+    if "*" in keys:
+        return [v for k, v in node.items() if fnmatch.fnmatchcase(k, keys) and not k.endswith("_summary")]
+    return []
+
+
+def _compile_condition(path: str, spec: Any) -> Callable[[Dict[str, Any]], bool]:
+    if isinstance(spec, dict) and "all" in spec:
+        expected = _normalise(spec["all"])
+
+        def check(results):
+            values = _lookup(results, path)
+            return bool(values) and all(_normalise(v) == expected for v in values)
+        return check
+
+    if isinstance(spec, dict) and "contains" in spec:
+        needle = _normalise(spec["contains"])
+        return lambda results: any(needle in _normalise(v) for v in _lookup(results, path))
+
+    accepted = frozenset(_normalise(v) for v in (spec if isinstance(spec, (list, tuple, set)) else [spec]))
+    return lambda results: any(_normalise(v) in accepted for v in _lookup(results, path))
+
+
+def compile_rules(rules: List[Dict[str, Any]]):
+    compiled = []
+    for rule in rules:
+        checks = [_compile_condition(path, spec) for path, spec in rule["when"].items()]
+        compiled.append((rule["section"], rule["then"], checks))
+    return compiled
+
+
+COMPILED_RULES = compile_rules(RULES)
+
+
+def evaluate(analysis_results: Dict[str, Any]) -> List[Dict[str, str]]:
+    """Implications that fire for these analyzer results, in table order."""
+    fired = []
+    seen = set()
+    for section, implication, checks in COMPILED_RULES:
+        if (section, implication) in seen:
+            continue
+        if all(check(analysis_results) for check in checks):
+            seen.add((section, implication))
+            fired.append({"section": section, "implication": implication})
+    return fired
+
+
+def format_implications(implications: List[Dict[str, str]]) -> str:
+    if not implications:
+        return "No fit guidance rules apply to this dress."
+    return "\n".join(f"- {item['section']}: {item['implication']}" for item in implications)
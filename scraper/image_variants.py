@@ -0,0 +1,182 @@
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+from PIL import Image, ImageOps, features
+
+from scraper import metrics, static_cache
+
+try:
+    import pillow_avif  # noqa: F401  (registers the AVIF codec on older Pillow)
+except ImportError:
+    pass
+
+# Resized WebP/AVIF renditions of page images, made on first request.
+#
+# A variant is named after the source's content hash, so its URL can be
+# cached forever; widths are snapped to WIDTHS so the cache holds a few
+# files per image at most. Variants live in VARIANT_DIR, which is kept
+# under MAX_CACHE_BYTES by evicting the least recently served ones.
+
+VARIANT_DIR = os.getenv("IMAGE_VARIANT_DIR", os.path.join("data", "variants"))
+MAX_CACHE_BYTES = int(float(os.getenv("IMAGE_VARIANT_CACHE_MB", "256")) * 1024 * 1024)
+WIDTHS = (320, 640, 960, 1280)
+
+# format -> (Pillow format, mime type, save options)
+FORMATS: Dict[str, Tuple[str, str, Dict[str, Any]]] = {
+    "avif": ("AVIF", "image/avif", {"quality": 55, "speed": 8}),
+    "webp": ("WEBP", "image/webp", {"quality": 78, "method": 4}),
+    "jpeg": ("JPEG", "image/jpeg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+if not features.check("avif") and "AVIF" not in Image.SAVE:
+    FORMATS.pop("avif")
+
+
+def negotiate(accept: str) -> str:
+    """Best format the client's Accept header allows, JPEG if it names none of ours."""
+    accept = (accept or "").lower()
+    for fmt in ("avif", "webp"):
+        if fmt in FORMATS and f"image/{fmt}" in accept:
+            return fmt
+    return "jpeg"
+
+
+def snap_width(width: int) -> int:
+    """Smallest allowed width at least `width` (the largest one beyond that)."""
+    return next((w for w in WIDTHS if w >= width), WIDTHS[-1])
+
+
+def widths_for(source_width: int):
+    """Allowed widths worth offering for a source: no upscaled copies beyond the first."""
+    return [w for w in WIDTHS if w <= source_width] or [WIDTHS[0]]
+
+
+_sizes = static_cache.VersionedCache()
+
+
+def image_size(path: str) -> Tuple[int, int]:
+    """(width, height) from the image header, cached until the file changes."""
+    def build():
+        with Image.open(path) as image:
+            width, height = image.size
+            # EXIF orientations 5-8 are rotated by 90 degrees.
+            return (height, width) if image.getexif().get(0x0112, 1) >= 5 else (width, height)
+    return _sizes.get(path, static_cache.file_version(path), build)
+
+
+class VariantCache:
+    """Size-bounded directory of variants with least-recently-served eviction."""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._bytes = 0
+        self._loaded = False
+
+    def _load(self):
+        # Once per process: oldest first, so eviction order survives restarts roughly.
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    st = entry.stat()
+                    entries.append((st.st_mtime, entry.name, st.st_size))
+        for _, name, size in sorted(entries):
+            self._index[name] = size
+            self._bytes += size
+        self._loaded = True
+
+    def lookup(self, name: str) -> Optional[str]:
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            if name not in self._index:
+                return None
+            self._index.move_to_end(name)
+        path = os.path.join(self.directory, name)
+        return path if os.path.isfile(path) else None
+
+    def add(self, name: str, size: int) -> None:
+        evicted = []
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            self._bytes += size - self._index.pop(name, 0)
+            self._index[name] = size
+            while self._bytes > self.max_bytes and len(self._index) > 1:
+                old, old_size = self._index.popitem(last=False)
+                self._bytes -= old_size
+                evicted.append(old)
+            total = self._bytes
+        for old in evicted:
+            try:
+                os.remove(os.path.join(self.directory, old))
+            except FileNotFoundError:
+                pass
+        if evicted:
+            metrics.inc("image_variant_evictions_total", len(evicted))
+        metrics.set_gauge("image_variant_cache_bytes", total)
+
+
+    def clear(self) -> None:
+        with self._lock:
+            names = list(self._index)
+            self._index.clear()
+            self._bytes = 0
+        for name in names:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+        metrics.set_gauge("image_variant_cache_bytes", 0)
+
+
+_cache = VariantCache(VARIANT_DIR, MAX_CACHE_BYTES)
+
+
+def render(source_path: str, width: int, fmt: str, dest_path: str) -> int:
+    """Write `source_path` resized to `width` (never upscaled) in `fmt`; returns the file size."""
+    pil_format, _, options = FORMATS[fmt]
+    with Image.open(source_path) as image:
+        # Let the JPEG decoder downscale by a power of two before we resize.
+        image.draft("RGB", (width, max(1, image.height * width // image.width)))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA") or (fmt == "jpeg" and image.mode != "RGB"):
+            image = image.convert("RGB")
+        if image.width > width:
+            image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+        tmp_path = f"{dest_path}.{uuid.uuid4().hex}.tmp"
+        image.save(tmp_path, format=pil_format, **options)
+    os.replace(tmp_path, dest_path)
+    return os.path.getsize(dest_path)
+
+
+def get(source_path: str, digest: str, width: int, fmt: str) -> str:
+    """Path of the cached variant, rendering it first if needed."""
+    name = f"{digest}-{width}.{fmt}"
+    path = _cache.lookup(name)
+    if path:
+        metrics.inc("image_variant_requests_total", fmt=fmt, outcome="hit")
+        return path
+    path = os.path.join(VARIANT_DIR, name)
+    start = time.perf_counter()
+    size = render(source_path, width, fmt, path)
+    metrics.observe("image_variant_render_seconds", time.perf_counter() - start, fmt=fmt)
+    metrics.inc("image_variant_requests_total", fmt=fmt, outcome="rendered")
+    _cache.add(name, size)
+    return path
+
+
+def mime_type(fmt: str) -> str:
+    return FORMATS[fmt][1]
+
+
+def clear() -> None:
+    """Drop every cached variant."""
+    _cache.clear()
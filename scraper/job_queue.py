@@ -0,0 +1,343 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from typing import Dict, Any, Optional
+
+from scraper import metrics
+
+# Durable job queue between the web tier and worker.py.
+#
+# JOB_QUEUE selects the backend; empty keeps jobs in the web process.
+#     sqlite:///data/queue.db     embedded, for tests and single-host setups
+#     redis://host:6379/0         Redis or any server speaking its protocol
+#
+# A claimed job is leased to one worker for VISIBILITY seconds; the worker
+# extends the lease while it runs. A worker that dies stops extending, and
+# once the lease runs out the job becomes claimable again. Failed attempts
+# are retried with exponential backoff until MAX_ATTEMPTS, after which the
+# job stays "failed" with its error. The worker writes the result back to
+# the job record; the web tier copies it into its own stores when the
+# result page asks for it. Finished records are kept for RESULT_TTL.
+# cancel() takes a queued job out of the queue; a running one is marked and
+# its worker, which polls the record, stops it and loses the lease.
+#
+# Job records are plain dicts: job_id, kind, payload, status (queued,
+# running, done, failed, cancelled), attempts, result, error, created, updated.
+
+JOB_QUEUE = os.getenv("JOB_QUEUE", "")
+VISIBILITY = float(os.getenv("JOB_QUEUE_VISIBILITY", "300"))
+MAX_ATTEMPTS = int(os.getenv("JOB_QUEUE_MAX_ATTEMPTS", "3"))
+RETRY_BACKOFF = float(os.getenv("JOB_QUEUE_RETRY_BACKOFF", "10"))
+RESULT_TTL = float(os.getenv("JOB_QUEUE_RESULT_TTL_HOURS", "24")) * 3600
+
+ENABLED = bool(JOB_QUEUE)
+
+
+def backoff(attempts: int) -> float:
+    return RETRY_BACKOFF * 2 ** max(0, attempts - 1)
+
+
+class SQLiteQueue:
+    """The queue in one SQLite table; every state change is one guarded UPDATE."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease TEXT,
+                visible_at REAL NOT NULL,
+                result TEXT,
+                error TEXT,
+                created REAL NOT NULL,
+                updated REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, visible_at);
+            CREATE INDEX IF NOT EXISTS jobs_updated ON jobs (updated);
+        """)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, job_id: str, kind: str, payload: Dict[str, Any]) -> None:
+        now = time.time()
+        self._connect().execute(
+            "INSERT INTO jobs (job_id, kind, payload, status, visible_at, created, updated) VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+            (job_id, kind, json.dumps(payload), now, now, now))
+
+    def claim(self, visibility: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Lease the oldest claimable job (queued, or running with an expired lease)."""
+        visibility = VISIBILITY if visibility is None else visibility
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("UPDATE jobs SET status = 'failed', lease = NULL, error = 'lease expired', updated = ? "
+                         "WHERE status = 'running' AND visible_at <= ? AND attempts >= ?", (now, now, MAX_ATTEMPTS))
+            row = conn.execute("SELECT job_id, kind, payload, attempts FROM jobs "
+                               "WHERE status IN ('queued', 'running') AND visible_at <= ? "
+                               "ORDER BY visible_at LIMIT 1", (now,)).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            lease = uuid.uuid4().hex
+            conn.execute("UPDATE jobs SET status = 'running', lease = ?, attempts = attempts + 1, visible_at = ?, updated = ? "
+                         "WHERE job_id = ?", (lease, now + visibility, now, row[0]))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return {"job_id": row[0], "kind": row[1], "payload": json.loads(row[2]), "attempts": row[3] + 1, "lease": lease}
+
+    def extend(self, job_id: str, lease: str, visibility: Optional[float] = None) -> bool:
+        """Push the lease deadline out; False if the job was lost to another worker."""
+        visibility = VISIBILITY if visibility is None else visibility
+        now = time.time()
+        return self._connect().execute(
+            "UPDATE jobs SET visible_at = ?, updated = ? WHERE job_id = ? AND lease = ? AND status = 'running'",
+            (now + visibility, now, job_id, lease)).rowcount > 0
+
+    def complete(self, job_id: str, lease: str, result: Dict[str, Any]) -> bool:
+        now = time.time()
+        conn = self._connect()
+        done = conn.execute(
+            "UPDATE jobs SET status = 'done', lease = NULL, result = ?, error = NULL, updated = ? "
+            "WHERE job_id = ? AND lease = ? AND status = 'running'",
+            (json.dumps(result, ensure_ascii=False), now, job_id, lease)).rowcount > 0
+        conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed', 'cancelled') AND updated < ?", (now - RESULT_TTL,))
+        return done
+
+    def cancel(self, job_id: str) -> bool:
+        """Mark a queued or running job cancelled; False if it already finished or is unknown."""
+        now = time.time()
+        return self._connect().execute(
+            "UPDATE jobs SET status = 'cancelled', lease = NULL, error = 'cancelled', updated = ? "
+            "WHERE job_id = ? AND status IN ('queued', 'running')", (now, job_id)).rowcount > 0
+
+    def fail(self, job_id: str, lease: str, error: str) -> Optional[str]:
+        """Record a failed attempt: "retry" (queued again after a backoff), "failed", or None if the lease was lost."""
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT attempts FROM jobs WHERE job_id = ? AND lease = ? AND status = 'running'",
+                               (job_id, lease)).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            outcome = "retry" if row[0] < MAX_ATTEMPTS else "failed"
+            conn.execute("UPDATE jobs SET status = ?, lease = NULL, visible_at = ?, error = ?, updated = ? WHERE job_id = ?",
+                         ("queued" if outcome == "retry" else "failed", now + backoff(row[0]), error, now, job_id))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return outcome
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            "SELECT job_id, kind, payload, status, attempts, result, error, created, updated FROM jobs WHERE job_id = ?",
+            (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {"job_id": row[0], "kind": row[1], "payload": json.loads(row[2]), "status": row[3], "attempts": row[4],
+                "result": json.loads(row[5]) if row[5] else None, "error": row[6], "created": row[7], "updated": row[8]}
+
+    def depth(self) -> int:
+        """Jobs waiting to be claimed."""
+        return self._connect().execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+
+# KEYS: ready list, delayed zset, leases zset. ARGV: now, visibility, lease, max attempts, job key prefix, ttl.
+_CLAIM = """
+local now = tonumber(ARGV[1])
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now)) do
+    redis.call('ZREM', KEYS[2], id)
+    redis.call('LPUSH', KEYS[1], id)
+end
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', now)) do
+    redis.call('ZREM', KEYS[3], id)
+    local key = ARGV[5] .. id
+    if tonumber(redis.call('HGET', key, 'attempts') or '0') >= tonumber(ARGV[4]) then
+        redis.call('HSET', key, 'status', 'failed', 'lease', '', 'error', 'lease expired', 'updated', now)
+        redis.call('EXPIRE', key, ARGV[6])
+    else
+        redis.call('HSET', key, 'status', 'queued', 'lease', '')
+        redis.call('RPUSH', KEYS[1], id)
+    end
+end
+local id = redis.call('RPOP', KEYS[1])
+if not id then
+    return false
+end
+local key = ARGV[5] .. id
+redis.call('HINCRBY', key, 'attempts', 1)
+redis.call('HSET', key, 'status', 'running', 'lease', ARGV[3], 'updated', now)
+redis.call('ZADD', KEYS[3], now + tonumber(ARGV[2]), id)
+return id
+"""
+
+# KEYS: job hash, leases zset. ARGV: job id, lease, now, visibility.
+_EXTEND = """
+if redis.call('HGET', KEYS[1], 'lease') ~= ARGV[2] or redis.call('HGET', KEYS[1], 'status') ~= 'running' then
+    return 0
+end
+redis.call('ZADD', KEYS[2], tonumber(ARGV[3]) + tonumber(ARGV[4]), ARGV[1])
+redis.call('HSET', KEYS[1], 'updated', ARGV[3])
+return 1
+"""
+
+# KEYS: job hash, leases zset. ARGV: job id, lease, now, result, ttl.
+_COMPLETE = """
+if redis.call('HGET', KEYS[1], 'lease') ~= ARGV[2] or redis.call('HGET', KEYS[1], 'status') ~= 'running' then
+    return 0
+end
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('HSET', KEYS[1], 'status', 'done', 'lease', '', 'result', ARGV[4], 'error', '', 'updated', ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+return 1
+"""
+
+# KEYS: job hash, leases zset, delayed zset. ARGV: job id, lease, now, error, max attempts, backoff base, ttl.
+_FAIL = """
+if redis.call('HGET', KEYS[1], 'lease') ~= ARGV[2] or redis.call('HGET', KEYS[1], 'status') ~= 'running' then
+    return false
+end
+redis.call('ZREM', KEYS[2], ARGV[1])
+local attempts = tonumber(redis.call('HGET', KEYS[1], 'attempts'))
+if attempts >= tonumber(ARGV[5]) then
+    redis.call('HSET', KEYS[1], 'status', 'failed', 'lease', '', 'error', ARGV[4], 'updated', ARGV[3])
+    redis.call('EXPIRE', KEYS[1], ARGV[7])
+    return 'failed'
+end
+redis.call('HSET', KEYS[1], 'status', 'queued', 'lease', '', 'error', ARGV[4], 'updated', ARGV[3])
+redis.call('ZADD', KEYS[3], tonumber(ARGV[3]) + tonumber(ARGV[6]) * 2 ^ (attempts - 1), ARGV[1])
+return 'retry'
+"""
+
+# KEYS: job hash, ready list, delayed zset, leases zset. ARGV: job id, now, ttl.
+_CANCEL = """
+local status = redis.call('HGET', KEYS[1], 'status')
+if status ~= 'queued' and status ~= 'running' then
+    return 0
+end
+redis.call('LREM', KEYS[2], 0, ARGV[1])
+redis.call('ZREM', KEYS[3], ARGV[1])
+redis.call('ZREM', KEYS[4], ARGV[1])
+redis.call('HSET', KEYS[1], 'status', 'cancelled', 'lease', '', 'error', 'cancelled', 'updated', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+
+
+class RedisQueue:
+    """The queue in Redis: a ready list, a delayed set for retries and a lease set, all moved by Lua scripts."""
+
+    def __init__(self, url: str, prefix: str = "fitapp:queue:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self.ready, self.delayed, self.leases = prefix + "ready", prefix + "delayed", prefix + "leases"
+        self._claim = self.client.register_script(_CLAIM)
+        self._extend = self.client.register_script(_EXTEND)
+        self._complete = self.client.register_script(_COMPLETE)
+        self._fail = self.client.register_script(_FAIL)
+        self._cancel = self.client.register_script(_CANCEL)
+
+    def _job_key(self, job_id: str) -> str:
+        return f"{self.prefix}job:{job_id}"
+
+    def enqueue(self, job_id: str, kind: str, payload: Dict[str, Any]) -> None:
+        now = time.time()
+        with self.client.pipeline() as pipe:
+            pipe.hset(self._job_key(job_id), mapping={
+                "kind": kind, "payload": json.dumps(payload), "status": "queued", "attempts": 0,
+                "lease": "", "result": "", "error": "", "created": now, "updated": now,
+            })
+            pipe.lpush(self.ready, job_id)
+            pipe.execute()
+
+    def claim(self, visibility: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        visibility = VISIBILITY if visibility is None else visibility
+        lease = uuid.uuid4().hex
+        job_id = self._claim(keys=[self.ready, self.delayed, self.leases],
+                             args=[time.time(), visibility, lease, MAX_ATTEMPTS, self._job_key(""), int(RESULT_TTL)])
+        if not job_id:
+            return None
+        kind, payload, attempts = self.client.hmget(self._job_key(job_id), "kind", "payload", "attempts")
+        return {"job_id": job_id, "kind": kind, "payload": json.loads(payload), "attempts": int(attempts), "lease": lease}
+
+    def extend(self, job_id: str, lease: str, visibility: Optional[float] = None) -> bool:
+        visibility = VISIBILITY if visibility is None else visibility
+        return bool(self._extend(keys=[self._job_key(job_id), self.leases], args=[job_id, lease, time.time(), visibility]))
+
+    def complete(self, job_id: str, lease: str, result: Dict[str, Any]) -> bool:
+        return bool(self._complete(keys=[self._job_key(job_id), self.leases],
+                                   args=[job_id, lease, time.time(), json.dumps(result, ensure_ascii=False), int(RESULT_TTL)]))
+
+    def fail(self, job_id: str, lease: str, error: str) -> Optional[str]:
+        return self._fail(keys=[self._job_key(job_id), self.leases, self.delayed],
+                          args=[job_id, lease, time.time(), error, MAX_ATTEMPTS, RETRY_BACKOFF, int(RESULT_TTL)]) or None
+
+    def cancel(self, job_id: str) -> bool:
+        return bool(self._cancel(keys=[self._job_key(job_id), self.ready, self.delayed, self.leases],
+                                 args=[job_id, time.time(), int(RESULT_TTL)]))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self.client.hgetall(self._job_key(job_id))
+        if not row:
+            return None
+        return {"job_id": job_id, "kind": row["kind"], "payload": json.loads(row["payload"]), "status": row["status"],
+                "attempts": int(row["attempts"]), "result": json.loads(row["result"]) if row.get("result") else None,
+                "error": row.get("error") or None, "created": float(row["created"]), "updated": float(row["updated"])}
+
+    def depth(self) -> int:
+        return self.client.llen(self.ready) + self.client.zcard(self.delayed)
+
+
+def open_queue(url: str):
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisQueue(url)
+    if url.startswith("sqlite:///"):
+        url = url[len("sqlite:///"):]
+    return SQLiteQueue(url)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def default_queue():
+    """The JOB_QUEUE queue, opened once per process."""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = open_queue(JOB_QUEUE)
+    return _queue
+
+
+def enqueue(job_id: str, kind: str, payload: Dict[str, Any]) -> None:
+    queue = default_queue()
+    queue.enqueue(job_id, kind, payload)
+    metrics.inc("queue_jobs_total", kind=kind, outcome="enqueued")
+    metrics.set_gauge("queue_depth", queue.depth())
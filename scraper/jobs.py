@@ -0,0 +1,320 @@
+import os
+import json
+import time
+import base64
+import shutil
+import asyncio
+import threading
+import contextlib
+import concurrent.futures
+from typing import Dict, Any, Optional, Tuple
+
+from scraper import (pipeline, fit_rules, tracing, uploads, compare, tag_store, results_store, job_queue, singleflight,
+                     cancellation)
+
+# The work behind an analysis or comparison request, shared by the web
+# process (JOB_QUEUE unset) and worker.py (jobs taken from the queue).
+#
+# A web job has a latency budget: LATENCY_BUDGET seconds after it starts,
+# the fit step goes ahead with the analyzer results that have arrived. The
+# sections still missing are stored under "Missing" as "pending"; the late
+# analyzers keep running, and their results are attached to every job that
+# went without them ("unavailable" if they fail) and saved to the tag store.
+# The scrape and structure steps come out of the same budget; there is
+# nothing to go ahead with without them, so a job whose budget runs out
+# there fails with TimeoutError.
+#
+# A scrape goes into the directory of the job that started it,
+# data/jobs/<job_id>/, which the jobs sharing that scrape and its late
+# analyzers hold until they are done with it; the last one removes it.
+
+JOBS_DIR = os.path.join('data', 'jobs')
+LATENCY_BUDGET = float(os.getenv("JOB_LATENCY_BUDGET", "120"))
+
+_dress_tags = singleflight.Group("dress_tags")
+# Per product: how many jobs and late analyzer runs hold its scrapes, and the scrape directories.
+_scrape_lock = threading.Lock()
+_scrapes: Dict[str, Dict[str, Any]] = {}
+_job_scrapes: Dict[str, str] = {}
+_late_tasks = set()
+
+
+def _hold_scrapes(pid: str) -> None:
+    with _scrape_lock:
+        _scrapes.setdefault(pid, {"holds": 0, "dirs": set()})["holds"] += 1
+
+
+def _release_scrapes(pid: str) -> None:
+    with _scrape_lock:
+        scrape = _scrapes.get(pid)
+        if scrape is None:
+            return
+        scrape["holds"] -= 1
+        if scrape["holds"]:
+            return
+        del _scrapes[pid]
+    for directory in scrape["dirs"]:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _scrape_dir(pid: str, job_id: str) -> str:
+    directory = os.path.join(JOBS_DIR, job_id)
+    with _scrape_lock:
+        _scrapes[pid]["dirs"].add(directory)
+    return directory
+
+
+def release_scrape(job_id: str) -> None:
+    """The job is done with its dress files (fit step run, or given up); the last holder removes them."""
+    with _scrape_lock:
+        pid = _job_scrapes.pop(job_id, None)
+    if pid is not None:
+        _release_scrapes(pid)
+
+
+def _remaining(deadline: Optional[float]) -> Optional[float]:
+    return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+
+async def _within(deadline: Optional[float], stage: str, step):
+    """await `step`, cancelling it once the job's latency budget is spent."""
+    try:
+        return await asyncio.wait_for(step, _remaining(deadline))
+    except TimeoutError:
+        raise TimeoutError(f"The {stage} step did not finish within the job's latency budget") from None
+
+
+def _collect_late(url: str, entry: Optional[Dict[str, Any]], results: Dict[str, Any],
+                  late: Dict[str, asyncio.Task], data_dir: Optional[str]) -> Dict[str, Any]:
+    """Wait for analyzers that missed the budget in the background; {"keys", "future"} of their results."""
+    future = concurrent.futures.Future()
+    pid = tag_store.product_id(url)
+    _hold_scrapes(pid)
+
+    async def collect():
+        late_results = {}
+        try:
+            for key, task in late.items():
+                try:
+                    late_results[key] = await task
+                except Exception as e:
+                    print(f"[ERROR] Late analyzer {key} failed: {e}")
+                    late_results[key] = None
+            print(f"[DEBUG] Late analyzers done: {list(late_results)}")
+            if tag_store.ENABLED:
+                if entry is not None:
+                    await asyncio.to_thread(tag_store.update, entry, late_results)
+                elif any(late_results.values()):
+                    await asyncio.to_thread(tag_store.put, url, data_dir, {**results, **late_results})
+        except (OSError, ValueError) as e:
+            print(f"[DEBUG] Could not store late dress tags: {e}")
+        finally:
+            _release_scrapes(pid)
+            future.set_result(late_results)
+            parent = tracing.current()
+            if parent:
+                tracing.export(parent[0])
+
+    task = asyncio.ensure_future(collect())
+    _late_tasks.add(task)
+    task.add_done_callback(_late_tasks.discard)
+    return {"keys": list(late), "future": future}
+
+
+async def _holding(budget: Optional[asyncio.Semaphore], step):
+    """await `step` while holding a slot of the caller's `budget`, if it has one."""
+    async with budget or contextlib.nullcontext():
+        return await step
+
+
+async def _build_dress_tags(url: str, deadline: Optional[float], job_id: str,
+                            budget: Optional[asyncio.Semaphore]) -> Tuple[Dict[str, Any], str, str, Optional[Dict[str, Any]]]:
+    # Dress tags precomputed by the batch job skip straight to the fit step.
+    entry, stale = tag_store.lookup(url) if tag_store.ENABLED else (None, None)
+    state = "off" if not tag_store.ENABLED else "miss" if entry is None else "stale" if stale else "hit"
+    data_dir = None
+    late = {}
+
+    if entry is not None:
+        if stale:
+            print(f"[DEBUG] Stored tags found; rerunning stale analyzers: {stale}")
+            fresh, late = await pipeline.run_analyzers_within(_remaining(deadline), tag_store.dress_json_path(entry),
+                                                             keys=stale, budget=budget)
+            entry = await asyncio.to_thread(tag_store.update, entry, fresh)
+        results = dict(entry["results"])
+        dress_json_path = tag_store.dress_json_path(entry)
+    else:
+        data_dir = _scrape_dir(tag_store.product_id(url), job_id)
+        dress_json_path = os.path.join(data_dir, "formatted_output.json")
+        print("[DEBUG] Starting scrape...")
+        await _within(deadline, "scrape", _holding(budget, pipeline.arun_scrape_and_save(url, data_dir)))
+        print("[DEBUG] Scrape done. Starting structure...")
+        await _within(deadline, "structure", _holding(budget, pipeline.arun_structure(data_dir)))
+        print("[DEBUG] Structure done.")
+
+        results, late = await pipeline.run_analyzers_within(_remaining(deadline), dress_json_path, budget=budget)
+        # print(f"[DEBUG] Analysis tasks completed. Results: {results}")
+        if tag_store.ENABLED and any(results.values()):
+            try:
+                entry = await asyncio.to_thread(tag_store.put, url, data_dir, results)
+                dress_json_path = tag_store.dress_json_path(entry)
+            except (OSError, ValueError) as e:
+                print(f"[DEBUG] Could not store dress tags: {e}")
+    if late:
+        print(f"[DEBUG] Latency budget spent; going ahead without {list(late)}")
+    return results, dress_json_path, state, _collect_late(url, entry, results, late, data_dir) if late else None
+
+
+async def dress_tags(url: str, job_id: str, deadline: Optional[float] = None,
+                     budget: Optional[asyncio.Semaphore] = None) -> Tuple[Dict[str, Any], str, str, Optional[Dict[str, Any]]]:
+    """(analyzer results, dress JSON path, tag-store state, late analyzers) for `url`.
+
+    Concurrent jobs for the same product share one lookup, scrape,
+    structure and analyzer run (and the first job's deadline, budget and
+    scrape directory). Analyzers still running at `deadline`
+    (time.monotonic()) are left out of the results; the last item is then
+    {"keys", "future"} for their results. Each step holds a slot of
+    `budget`, if given. The dress files stay until release_scrape(job_id).
+    """
+    pid = tag_store.product_id(url)
+    # Held before joining, so the scrape cannot go with a job that finishes first.
+    _hold_scrapes(pid)
+    with _scrape_lock:
+        _job_scrapes[job_id] = pid
+    return await _dress_tags.run(pid, _build_dress_tags, url, deadline, job_id, budget)
+
+
+def attach_late(job_id: str, late_results: Dict[str, Any]) -> None:
+    """Put analyzer results that arrived after the job's fit step into its stored analysis."""
+    record = results_store.get(job_id)
+    if record is None:
+        return
+    analysis = record["analysis"]
+    missing = dict(analysis.get("Missing") or {})
+    sections = {}
+    for key, result in late_results.items():
+        if key not in missing:
+            continue
+        if result:
+            sections[key] = result
+            del missing[key]
+        else:
+            missing[key] = "unavailable"
+    tags = {k: v for k, v in analysis.items() if k not in ("Conclusion", "Implications", "Missing")}
+    sections["Implications"] = fit_rules.evaluate({**tags, **sections})
+    if missing:
+        sections["Missing"] = missing
+    results_store.set_sections(job_id, sections, remove=[] if missing else ["Missing"])
+
+
+async def analyze(job_id: str, url: str, front_upload: Dict[str, Any], side_upload: Dict[str, Any],
+                  latency_budget: Optional[float] = LATENCY_BUDGET) -> Tuple[Dict[str, Any], str, str]:
+    """Tags for the dress at `url`, stored for `job_id`: (analysis results, analysis JSON path, dress JSON path).
+
+    The fit step is left to the caller, which either streams it or runs it in
+    place, then calls release_scrape(job_id).
+    """
+    deadline = time.monotonic() + latency_budget if latency_budget else None
+    with tracing.span("job", url=url) as job_span:
+        results, dress_json_path, state, late = await dress_tags(url, job_id, deadline)
+        job_span["tag_store"] = state
+
+        analysis_results = {k: v for k, v in results.items() if v}
+        print(f"[DEBUG] Compiled analysis_results: {analysis_results}")
+
+        if not analysis_results and not late:
+            raise Exception("No analysis results produced!")
+
+        analysis_results["Implications"] = fit_rules.evaluate(analysis_results)
+        if late:
+            missing = {key: "pending" for key in late["keys"] if key not in analysis_results}
+            if missing:
+                analysis_results["Missing"] = missing
+                job_span["missing"] = len(missing)
+
+        results_store.save(job_id, analysis_results, url=url, product_id=tag_store.product_id(url),
+                           front_hash=front_upload['hash'], side_hash=side_upload['hash'])
+
+        # The fit step reads the tags from a file; one per job.
+        os.makedirs(JOBS_DIR, exist_ok=True)
+        analysis_json_path = os.path.join(JOBS_DIR, f"{job_id}_analysis.json")
+        with open(analysis_json_path, 'w', encoding='utf-8') as f:
+            json.dump(analysis_results, f, ensure_ascii=False, indent=2)
+
+        print(f"[DEBUG] Analysis results written to {analysis_json_path}")
+    if late and "Missing" in analysis_results:
+        late["future"].add_done_callback(lambda f: attach_late(job_id, f.result()))
+    return analysis_results, analysis_json_path, dress_json_path
+
+
+def photo_payload(upload: Dict[str, Any]) -> Dict[str, str]:
+    """A stored photo as it travels in a queued job; workers need not share the upload folder."""
+    with open(upload['path'], 'rb') as f:
+        return {"hash": upload['hash'], "data": base64.b64encode(f.read()).decode('ascii')}
+
+
+async def enqueue(job_id: str, kind: str, url: str, compare_urls, front_upload: Dict[str, Any], side_upload: Dict[str, Any]) -> None:
+    """Hand the job to the worker tier; the result page polls for it."""
+    payload = {
+        "url": url,
+        "compare_urls": compare_urls,
+        "front": await asyncio.to_thread(photo_payload, front_upload),
+        "side": await asyncio.to_thread(photo_payload, side_upload),
+    }
+    if kind == "analyze":
+        results_store.save(job_id, {}, url=url, product_id=tag_store.product_id(url),
+                           front_hash=front_upload['hash'], side_hash=side_upload['hash'], status="queued")
+    await asyncio.to_thread(job_queue.enqueue, job_id, kind, payload)
+
+
+async def run_queued(job: Dict[str, Any], upload_folder: str) -> Dict[str, Any]:
+    """Run a job claimed from the queue to the end, fit step included; returns the result to write back."""
+    job_id, payload = job["job_id"], job["payload"]
+    # worker.py cancels this task once the job's record says "cancelled".
+    cancellation.register(job_id)
+    completed = False
+    try:
+        with tracing.job(job_id):
+            front = await asyncio.to_thread(uploads.import_blob, base64.b64decode(payload["front"]["data"]),
+                                            payload["front"]["hash"], upload_folder, owner=job_id)
+            side = await asyncio.to_thread(uploads.import_blob, base64.b64decode(payload["side"]["data"]),
+                                           payload["side"]["hash"], upload_folder, owner=job_id)
+            if job["kind"] == "compare":
+                with tracing.span("job", urls=len(payload["compare_urls"])):
+                    record = await compare.run(job_id, payload["compare_urls"], front["path"], side["path"])
+                completed = True
+                return {"record": record}
+
+            # Nobody waits on a page for a queued job; it runs to the end.
+            analysis, analysis_json_path, dress_json_path = await analyze(job_id, payload["url"], front, side, latency_budget=None)
+            conclusion = await pipeline.arun_fit_analysis(front["path"], side["path"], analysis_json_path, dress_json_path)
+            analysis["Conclusion"] = conclusion
+            completed = True
+            return {"analysis": analysis, "status": "failed" if isinstance(conclusion, dict) else "done"}
+    except asyncio.CancelledError:
+        cancellation.cancelled(job_id, "request")
+        raise
+    finally:
+        cancellation.finish(job_id, completed=completed)
+        uploads.release(job_id)
+        release_scrape(job_id)
+        tracing.export(job_id)
+
+
+def write_back(job_id: str) -> Optional[Dict[str, Any]]:
+    """Copy a finished queued job's result into this process's stores; returns the queue record (None if unknown)."""
+    job = job_queue.default_queue().get(job_id)
+    if job is None or job["status"] not in ("done", "failed", "cancelled"):
+        return job
+    if job["status"] == "cancelled":
+        if job["kind"] == "analyze":
+            results_store.set_conclusion(job_id, {"error": "Cancelled."}, status="cancelled")
+    elif job["kind"] == "compare":
+        if job["status"] == "done":
+            compare.save(job["result"]["record"])
+    elif job["status"] == "done":
+        # Keeps the url and photo hashes of the placeholder saved at enqueue time.
+        results_store.save(job_id, job["result"]["analysis"], status=job["result"]["status"])
+    else:
+        results_store.set_conclusion(job_id, {"error": job["error"] or "The job failed."}, status="failed")
+    return job
@@ -0,0 +1,467 @@
+import os
+import re
+import math
+import time
+import random
+import asyncio
+import threading
+import contextvars
+import concurrent.futures
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from scraper import metrics, tracing, cancellation
+
+# Single choke point for model calls made by the structure step, the analyzers and the fit step,
+# so accounting (and anything else that has to wrap a call) lives in one place.
+# A call whose job was cancelled is not made (cancellation.check()).
+#
+# invoke() and ainvoke() have a deadline: a call that has not answered after
+# LLM_TIMEOUT seconds (per analyzer: LLM_TIMEOUTS="fit=180,fabric_analysis=60";
+# names are matched exactly, as passed to invoke())
+# raises TimeoutError, which the analyzer reports like any failed call,
+# instead of stalling the job behind it. With LLM_HEDGE=1 a call that has
+# not answered by the LLM_HEDGE_PERCENTILE latency of its analyzer's recent
+# calls is sent a second time and the first answer wins. Hedges are paid
+# for from a budget that grows by LLM_HEDGE_BUDGET per call (0.05: at most
+# about one extra request per twenty), so a slow provider is not hit with
+# twice the load. Sync calls wait in a thread pool; the attempt that lost,
+# or ran past its deadline, finishes in the background and is still
+# accounted. Async losers are cancelled. Streams are neither hedged nor cut
+# off: their text is already on its way to the reader.
+#
+# With LLM_CASCADE=1 an analyzer question goes to LLM_CASCADE_MODEL first.
+# Its answer stands when its confidence reaches the analyzer's threshold
+# (LLM_CASCADE_THRESHOLD; per analyzer LLM_CASCADE_THRESHOLDS=
+# "fabric_analysis=0.95"), otherwise the question is asked again of the
+# analyzer's own model. Confidence is the probability the small model gave
+# its "output" value (logprobs), or with LLM_CASCADE_CONFIDENCE=self the
+# "confidence" it is asked to add to its JSON. A share LLM_CASCADE_AUDIT of
+# accepted answers is escalated anyway, so agreement between the models is
+# known per confidence band above the threshold as well as below it. The
+# fit step writes prose and the structure step labels images; neither is
+# cascaded.
+
+
+def _per_analyzer(spec: str) -> Dict[str, float]:
+    """'fit=180,fabric_analysis=60' -> {"fit": 180.0, "fabric_analysis": 60.0}; malformed entries are skipped."""
+    values = {}
+    for item in filter(str.strip, spec.split(",")):
+        name, _, value = (part.strip() for part in item.partition("="))
+        try:
+            if not name:
+                raise ValueError("no name")
+            values[name] = float(value)
+        except ValueError:
+            print(f"[DEBUG] Ignoring malformed setting {item.strip()!r} (expected name=number)")
+    return values
+
+
+TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+TIMEOUTS = _per_analyzer(os.getenv("LLM_TIMEOUTS", ""))
+HEDGE = os.getenv("LLM_HEDGE", "0") == "1"
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+HEDGE_BUDGET = float(os.getenv("LLM_HEDGE_BUDGET", "0.05"))
+# Unused budget is capped so a quiet spell cannot fund a burst of hedges.
+HEDGE_BURST = float(os.getenv("LLM_HEDGE_BURST", "3"))
+# Until an analyzer has this many latencies, hedge after LLM_HEDGE_DELAY seconds (0: do not hedge yet).
+HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "0"))
+HEDGE_WINDOW = 200
+CALL_THREADS = int(os.getenv("LLM_CALL_THREADS", "8"))
+CASCADE = os.getenv("LLM_CASCADE", "0") == "1"
+CASCADE_MODEL = os.getenv("LLM_CASCADE_MODEL", "gpt-4.1-mini")
+CASCADE_THRESHOLD = float(os.getenv("LLM_CASCADE_THRESHOLD", "0.9"))
+CASCADE_THRESHOLDS = _per_analyzer(os.getenv("LLM_CASCADE_THRESHOLDS", ""))
+CASCADE_CONFIDENCE = os.getenv("LLM_CASCADE_CONFIDENCE", "logprob")
+CASCADE_AUDIT = float(os.getenv("LLM_CASCADE_AUDIT", "0.05"))
+CASCADE_EXCLUDE = {"fit", "structure"}
+
+
+def model_name(llm: Any) -> str:
+    return getattr(llm, "model_name", None) or getattr(llm, "model", None) or "unknown"
+
+
+def record_usage(analyzer: str, model: str, prompt_tokens: int, completion_tokens: int, seconds: float,
+                 cached_tokens: int = 0) -> None:
+    metrics.inc("llm_calls_total", analyzer=analyzer, model=model)
+    metrics.observe("llm_call_seconds", seconds, analyzer=analyzer)
+    metrics.inc("llm_prompt_tokens_total", prompt_tokens, analyzer=analyzer, model=model)
+    metrics.inc("llm_completion_tokens_total", completion_tokens, analyzer=analyzer, model=model)
+    metrics.inc("llm_cached_tokens_total", cached_tokens, analyzer=analyzer, model=model)
+    metrics.inc("llm_cost_usd_total", metrics.estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens),
+                analyzer=analyzer, model=model)
+    cancellation.charge(prompt_tokens + completion_tokens)
+
+
+def usage_from_message(message: Any) -> Dict[str, int]:
+    """Token counts from a langchain AIMessage (usage_metadata or the raw token_usage)."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    if usage:
+        details = usage.get("input_token_details") or {}
+        return {
+            "prompt_tokens": usage.get("input_tokens", 0) or 0,
+            "completion_tokens": usage.get("output_tokens", 0) or 0,
+            "cached_tokens": details.get("cache_read", 0) or 0,
+        }
+    raw = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+    details = raw.get("prompt_tokens_details") or {}
+    return {
+        "prompt_tokens": raw.get("prompt_tokens", 0) or 0,
+        "completion_tokens": raw.get("completion_tokens", 0) or 0,
+        "cached_tokens": details.get("cached_tokens", 0) or 0,
+    }
+
+
+def _span_usage(attributes: Dict[str, Any], usage: Dict[str, int]) -> None:
+    attributes.update(usage)
+    attributes["cache_hit"] = usage.get("cached_tokens", 0) > 0
+
+
+def timeout_for(analyzer: str) -> Optional[float]:
+    deadline = TIMEOUTS.get(analyzer, TIMEOUT)
+    return deadline if deadline > 0 else None
+
+
+_lock = threading.Lock()
+# (analyzer, model) -> recent latencies; a cascaded analyzer calls two models.
+_latencies: Dict[Tuple[str, str], deque] = {}
+_hedge_tokens = 1.0
+_threads: Optional[concurrent.futures.ThreadPoolExecutor] = None
+
+
+def _observe(analyzer: str, model: str, seconds: float) -> None:
+    """One answered attempt: its latency, and HEDGE_BUDGET more hedge budget."""
+    global _hedge_tokens
+    with _lock:
+        _latencies.setdefault((analyzer, model), deque(maxlen=HEDGE_WINDOW)).append(seconds)
+        _hedge_tokens = min(HEDGE_BURST, _hedge_tokens + HEDGE_BUDGET)
+
+
+def hedge_delay(analyzer: str, model: str) -> Optional[float]:
+    """Seconds to wait before hedging a call of `analyzer` to `model`; None for no hedge."""
+    if not HEDGE:
+        return None
+    with _lock:
+        samples = sorted(_latencies.get((analyzer, model), ()))
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return HEDGE_DELAY or None
+    return samples[min(len(samples) - 1, int(len(samples) * HEDGE_PERCENTILE / 100))]
+
+
+def _take_hedge(analyzer: str) -> bool:
+    global _hedge_tokens
+    with _lock:
+        allowed = _hedge_tokens >= 1
+        if allowed:
+            _hedge_tokens -= 1
+    if not allowed:
+        metrics.inc("llm_hedges_total", analyzer=analyzer, outcome="denied")
+    return allowed
+
+
+def _attempt(call: Callable, messages: List, analyzer: str, model: str) -> Tuple[Any, Dict[str, int]]:
+    """One request, accounted whether or not its answer is used."""
+    start = time.perf_counter()
+    try:
+        response = call(messages)
+    except Exception:
+        metrics.inc("llm_errors_total", analyzer=analyzer, model=model)
+        raise
+    seconds = time.perf_counter() - start
+    usage = usage_from_message(response)
+    _observe(analyzer, model, seconds)
+    record_usage(analyzer, model, usage["prompt_tokens"], usage["completion_tokens"], seconds, usage["cached_tokens"])
+    return response, usage
+
+
+async def _aattempt(call: Callable, messages: List, analyzer: str, model: str) -> Tuple[Any, Dict[str, int]]:
+    start = time.perf_counter()
+    try:
+        response = await call(messages)
+    except Exception:
+        metrics.inc("llm_errors_total", analyzer=analyzer, model=model)
+        raise
+    seconds = time.perf_counter() - start
+    usage = usage_from_message(response)
+    _observe(analyzer, model, seconds)
+    record_usage(analyzer, model, usage["prompt_tokens"], usage["completion_tokens"], seconds, usage["cached_tokens"])
+    return response, usage
+
+
+def _timed_out(analyzer: str, deadline: float) -> TimeoutError:
+    metrics.inc("llm_timeouts_total", analyzer=analyzer)
+    return TimeoutError(f"The {analyzer} model call did not answer within {deadline:g}s")
+
+
+def _submit(func: Callable, *args) -> concurrent.futures.Future:
+    global _threads
+    if _threads is None:
+        with _lock:
+            if _threads is None:
+                _threads = concurrent.futures.ThreadPoolExecutor(CALL_THREADS, thread_name_prefix="llm-call")
+    # In the caller's context, so the attempt is traced and charged to its job.
+    return _threads.submit(contextvars.copy_context().run, func, *args)
+
+
+def _hedged(llm: Any, messages: List, analyzer: str, model: str, span: Dict[str, Any]) -> Tuple[Any, Dict[str, int]]:
+    deadline, delay = timeout_for(analyzer), hedge_delay(analyzer, model)
+    if deadline is None and delay is None:
+        return _attempt(llm.invoke, messages, analyzer, model)
+    started = time.perf_counter()
+
+    def remaining():
+        return None if deadline is None else max(0.0, deadline - (time.perf_counter() - started))
+
+    attempts = [_submit(_attempt, llm.invoke, messages, analyzer, model)]
+    if delay is not None and (deadline is None or delay < deadline):
+        concurrent.futures.wait(attempts, timeout=delay)
+        if not attempts[0].done() and _take_hedge(analyzer):
+            span["hedged"] = True
+            attempts.append(_submit(_attempt, llm.invoke, messages, analyzer, model))
+    pending, error = set(attempts), None
+    while pending:
+        done, pending = concurrent.futures.wait(pending, timeout=remaining(), return_when=concurrent.futures.FIRST_COMPLETED)
+        if not done:
+            raise _timed_out(analyzer, deadline)
+        for future in done:
+            if future.exception() is None:
+                if len(attempts) > 1:
+                    metrics.inc("llm_hedges_total", analyzer=analyzer, outcome="won" if future is attempts[1] else "lost")
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+async def _ahedged(llm: Any, messages: List, analyzer: str, model: str, span: Dict[str, Any]) -> Tuple[Any, Dict[str, int]]:
+    deadline, delay = timeout_for(analyzer), hedge_delay(analyzer, model)
+    started = time.perf_counter()
+
+    def remaining():
+        return None if deadline is None else max(0.0, deadline - (time.perf_counter() - started))
+
+    attempts = [asyncio.ensure_future(_aattempt(llm.ainvoke, messages, analyzer, model))]
+    try:
+        if delay is not None and (deadline is None or delay < deadline):
+            await asyncio.wait(attempts, timeout=delay)
+            if not attempts[0].done() and _take_hedge(analyzer):
+                span["hedged"] = True
+                attempts.append(asyncio.ensure_future(_aattempt(llm.ainvoke, messages, analyzer, model)))
+        pending, error = set(attempts), None
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=remaining(), return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                raise _timed_out(analyzer, deadline)
+            for task in done:
+                if task.exception() is None:
+                    if len(attempts) > 1:
+                        metrics.inc("llm_hedges_total", analyzer=analyzer, outcome="won" if task is attempts[1] else "lost")
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        # The losing or late request is dropped (its connection closed).
+        for task in attempts:
+            task.cancel()
+
+
+def _call(llm: Any, messages: List, analyzer: str, model: str, **attributes):
+    cancellation.check()
+    with tracing.span("llm", analyzer=analyzer, model=model, **attributes) as span:
+        response, usage = _hedged(llm, messages, analyzer, model, span)
+        _span_usage(span, usage)
+    return response
+
+
+async def _acall(llm: Any, messages: List, analyzer: str, model: str, **attributes):
+    cancellation.check()
+    with tracing.span("llm", analyzer=analyzer, model=model, **attributes) as span:
+        response, usage = await _ahedged(llm, messages, analyzer, model, span)
+        _span_usage(span, usage)
+    return response
+
+
+def cascade_threshold(analyzer: str) -> Optional[float]:
+    """Confidence the small model needs for its answer to stand; None if `analyzer` is not cascaded."""
+    if not CASCADE or analyzer in CASCADE_EXCLUDE:
+        return None
+    return CASCADE_THRESHOLDS.get(analyzer, CASCADE_THRESHOLD)
+
+
+_SELF_REPORT = ('Also add a "confidence" field to the JSON: the probability, from 0 to 1, '
+                'that your "output" is correct.')
+_OUTPUT = re.compile(r'"output"\s*:\s*"([^"]*)"')
+_CONFIDENCE = re.compile(r'"confidence"\s*:\s*"?([0-9]*\.?[0-9]+)')
+
+
+def _small(llm: Any) -> Tuple[Any, str]:
+    small = llm.model_copy(update={"model_name": CASCADE_MODEL})
+    if CASCADE_CONFIDENCE == "logprob":
+        small = small.bind(logprobs=True)
+    return small, CASCADE_MODEL
+
+
+def _small_messages(messages: List) -> List:
+    return messages + [("human", _SELF_REPORT)] if CASCADE_CONFIDENCE == "self" else messages
+
+
+def _answer(response: Any) -> str:
+    match = _OUTPUT.search(response.content or "")
+    return match.group(1).strip().lower() if match else ""
+
+
+def answer_confidence(response: Any) -> float:
+    """Probability of the "output" value from the response's logprobs, else its self-reported confidence, else 0."""
+    text = response.content or ""
+    tokens = ((getattr(response, "response_metadata", None) or {}).get("logprobs") or {}).get("content") or []
+    match = _OUTPUT.search(text)
+    if tokens and match:
+        # The value's tokens: those overlapping its span in the text.
+        start, end = match.span(1)
+        offset, logprob, seen = 0, 0.0, False
+        for token in tokens:
+            length = len(token.get("token", ""))
+            if offset < end and offset + length > start:
+                logprob += token.get("logprob", 0.0)
+                seen = True
+            offset += length
+        if seen and offset == len(text):
+            return math.exp(logprob)
+    reported = _CONFIDENCE.search(text)
+    if reported:
+        return min(1.0, max(0.0, float(reported.group(1))))
+    return 0.0
+
+
+def _band(confidence: float) -> str:
+    return f"{min(0.9, math.floor(confidence * 10) / 10):.1f}"
+
+
+def _settle(analyzer: str, small: Optional[Any], large: Optional[Any], confidence: float, threshold: float,
+            started: float, span: Dict[str, Any]) -> None:
+    """Cascade accounting: outcome, confidence, time and, when both models answered, agreement."""
+    outcome = ("fallback" if small is None else "accepted" if large is None
+               else "escalated" if confidence < threshold else "audited")
+    span.update(outcome=outcome, confidence=round(confidence, 4))
+    metrics.inc("llm_cascade_total", analyzer=analyzer, outcome=outcome)
+    metrics.observe("llm_cascade_confidence", confidence, analyzer=analyzer)
+    metrics.observe("llm_cascade_seconds", time.perf_counter() - started, analyzer=analyzer, outcome=outcome)
+    if small is not None and large is not None:
+        agree = _answer(small) == _answer(large)
+        span["agree"] = agree
+        metrics.inc("llm_cascade_agreement_total", analyzer=analyzer, band=_band(confidence), agree=str(agree).lower())
+
+
+def _escalate(confidence: float, threshold: float) -> bool:
+    return confidence < threshold or random.random() < CASCADE_AUDIT
+
+
+def invoke(llm: Any, messages: List, analyzer: str):
+    """llm.invoke(messages) with latency, token and cost accounting, a deadline, optional hedging and the cascade."""
+    threshold = cascade_threshold(analyzer)
+    if threshold is None:
+        return _call(llm, messages, analyzer, model_name(llm))
+    started = time.perf_counter()
+    with tracing.span("cascade", analyzer=analyzer, threshold=threshold) as span:
+        small_llm, small_model = _small(llm)
+        try:
+            small = _call(small_llm, _small_messages(messages), analyzer, small_model, cascade="small")
+        except cancellation.Cancelled:
+            raise
+        except Exception as e:
+            print(f"[DEBUG] Cascade: {small_model} failed on a {analyzer} question ({e}); asking {model_name(llm)}")
+            small = None
+        confidence = answer_confidence(small) if small is not None else 0.0
+        large = None
+        if _escalate(confidence, threshold):
+            large = _call(llm, messages, analyzer, model_name(llm), cascade="large")
+        _settle(analyzer, small, large, confidence, threshold, started, span)
+    return large if large is not None else small
+
+
+async def ainvoke(llm: Any, messages: List, analyzer: str):
+    """Async counterpart of invoke()."""
+    threshold = cascade_threshold(analyzer)
+    if threshold is None:
+        return await _acall(llm, messages, analyzer, model_name(llm))
+    started = time.perf_counter()
+    with tracing.span("cascade", analyzer=analyzer, threshold=threshold) as span:
+        small_llm, small_model = _small(llm)
+        try:
+            small = await _acall(small_llm, _small_messages(messages), analyzer, small_model, cascade="small")
+        except cancellation.Cancelled:
+            raise
+        except Exception as e:
+            print(f"[DEBUG] Cascade: {small_model} failed on a {analyzer} question ({e}); asking {model_name(llm)}")
+            small = None
+        confidence = answer_confidence(small) if small is not None else 0.0
+        large = None
+        if _escalate(confidence, threshold):
+            large = await _acall(llm, messages, analyzer, model_name(llm), cascade="large")
+        _settle(analyzer, small, large, confidence, threshold, started, span)
+    return large if large is not None else small
+
+
+def stream(llm: Any, messages: List, analyzer: str):
+    """llm.stream(messages), yielding text as it arrives.
+
+    Usage is taken from the final chunk (the model needs stream_usage=True)
+    and recorded once the stream is exhausted, along with time to first token.
+    """
+    model = model_name(llm)
+    cancellation.check()
+    with tracing.span("llm", analyzer=analyzer, model=model, streamed=True) as span:
+        start = time.perf_counter()
+        first_token = None
+        usage = {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+        try:
+            for chunk in llm.stream(messages):
+                if getattr(chunk, "usage_metadata", None):
+                    usage = usage_from_message(chunk)
+                if not chunk.content:
+                    continue
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                    metrics.observe("llm_first_token_seconds", first_token, analyzer=analyzer)
+                    span["first_token_seconds"] = round(first_token, 3)
+                yield chunk.content
+        except Exception:
+            metrics.inc("llm_errors_total", analyzer=analyzer, model=model)
+            raise
+        _span_usage(span, usage)
+    record_usage(analyzer, model, usage["prompt_tokens"], usage["completion_tokens"], time.perf_counter() - start,
+                 usage["cached_tokens"])
+
+
+async def astream(llm: Any, messages: List, analyzer: str):
+    """Async counterpart of stream()."""
+    model = model_name(llm)
+    cancellation.check()
+    with tracing.span("llm", analyzer=analyzer, model=model, streamed=True) as span:
+        start = time.perf_counter()
+        first_token = None
+        usage = {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+        try:
+            async for chunk in llm.astream(messages):
+                if getattr(chunk, "usage_metadata", None):
+                    usage = usage_from_message(chunk)
+                if not chunk.content:
+                    continue
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                    metrics.observe("llm_first_token_seconds", first_token, analyzer=analyzer)
+                    span["first_token_seconds"] = round(first_token, 3)
+                yield chunk.content
+        except Exception:
+            metrics.inc("llm_errors_total", analyzer=analyzer, model=model)
+            raise
+        _span_usage(span, usage)
+    record_usage(analyzer, model, usage["prompt_tokens"], usage["completion_tokens"], time.perf_counter() - start,
+                 usage["cached_tokens"])
+
+
+def record_parse(analyzer: str, output: Optional[str]) -> None:
+    """Count how an extract_json_response() answer came back."""
+    value = (output or "").strip().lower()
+    outcome = "unknown" if value in ("", "unknown") else "error" if value == "error" else "ok"
+    metrics.inc("llm_parse_total", analyzer=analyzer, outcome=outcome)
@@ -0,0 +1,219 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Tuple
+
+# In-process metrics with Prometheus text exposition.
+#
+# Every update is a dict operation under one lock, cheap enough to leave on
+# under load. Analyzer worker processes record into their own registry and
+# hand a drain() snapshot back with the result; the web process merge()s it.
+
+PREFIX = "fitapp_"
+
+SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+HOURS = 3600
+AGE_BUCKETS = (1 * HOURS, 6 * HOURS, 24 * HOURS, 72 * HOURS, 168 * HOURS, 336 * HOURS, 720 * HOURS)
+CONFIDENCE_BUCKETS = (0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99, 0.999)
+
+# name -> (type, help, buckets)
+METRICS: Dict[str, Tuple[str, str, tuple]] = {
+    "stage_seconds": ("histogram", "Wall time of a pipeline stage.", SECONDS_BUCKETS),
+    "stage_errors_total": ("counter", "Pipeline stages that raised or returned an error.", ()),
+    "analyzers_late_total": ("counter", "Analyzer runs that missed their job's latency budget; the fit step went ahead without them.", ()),
+    "llm_calls_total": ("counter", "Model calls issued.", ()),
+    "llm_call_seconds": ("histogram", "Latency of a single model call.", SECONDS_BUCKETS),
+    "llm_first_token_seconds": ("histogram", "Time to the first streamed token of a model call.", SECONDS_BUCKETS),
+    "llm_errors_total": ("counter", "Model calls that raised.", ()),
+    "llm_prompt_tokens_total": ("counter", "Prompt tokens reported by the provider.", ()),
+    "llm_completion_tokens_total": ("counter", "Completion tokens reported by the provider.", ()),
+    "llm_cached_tokens_total": ("counter", "Prompt tokens the provider served from its prompt cache.", ()),
+    "llm_cost_usd_total": ("counter", "Estimated spend from token counts and list prices.", ()),
+    "llm_parse_total": ("counter", "Analyzer answers by parse outcome (ok, unknown, error).", ()),
+    "llm_timeouts_total": ("counter", "Model calls abandoned at their deadline.", ()),
+    "llm_hedges_total": ("counter", "Hedged model calls by outcome (won, lost, denied by the hedge budget).", ()),
+    "llm_cascade_total": ("counter", "Cascaded questions by outcome (accepted from the small model, escalated, audited, fallback after a small-model error).", ()),
+    "llm_cascade_confidence": ("histogram", "Confidence of the small model's answers in the cascade.", CONFIDENCE_BUCKETS),
+    "llm_cascade_seconds": ("histogram", "Time to answer a cascaded question, both models included.", SECONDS_BUCKETS),
+    "llm_cascade_agreement_total": ("counter", "Escalated and audited questions by whether the two models agreed, per confidence band.", ()),
+    "upload_bytes_total": ("counter", "Client photo bytes as received and as stored after normalisation.", ()),
+    "upload_dedup_total": ("counter", "Uploads that matched an already stored photo.", ()),
+    "upload_store_files": ("gauge", "Client photos currently stored.", ()),
+    "upload_store_bytes": ("gauge", "Bytes of client photos currently stored.", ()),
+    "upload_store_referenced_files": ("gauge", "Stored client photos referenced by a running or recent job.", ()),
+    "upload_gc_deleted_total": ("counter", "Stored photos deleted by the upload collector.", ()),
+    "upload_gc_freed_bytes_total": ("counter", "Bytes freed by the upload collector.", ()),
+    "executor_queue_depth": ("gauge", "Analyzer jobs submitted but not yet started.", ()),
+    "executor_inflight": ("gauge", "Analyzer jobs currently running.", ()),
+    "executor_queue_wait_seconds": ("histogram", "Time an analyzer job waited for a worker.", SECONDS_BUCKETS),
+    "tag_store_lookups_total": ("counter", "Precomputed dress-tag lookups by outcome (fresh, stale, expired, missing).", ()),
+    "tag_store_entry_age_seconds": ("histogram", "Age of the scrape behind a looked-up dress-tag entry.", AGE_BUCKETS),
+    "tag_store_entries": ("gauge", "Dress-tag entries by state, as of the last status scan.", ()),
+    "image_variant_requests_total": ("counter", "Image variant requests by format and outcome (hit, rendered).", ()),
+    "image_variant_render_seconds": ("histogram", "Time to decode, resize and encode one image variant.", SECONDS_BUCKETS),
+    "image_variant_evictions_total": ("counter", "Image variants evicted to keep the cache under its size limit.", ()),
+    "image_variant_cache_bytes": ("gauge", "Bytes of image variants currently cached on disk.", ()),
+    "admission_active": ("gauge", "Analysis jobs currently holding a slot.", ()),
+    "admission_queued": ("gauge", "Analysis jobs waiting for a slot.", ()),
+    "admission_queue_wait_seconds": ("histogram", "Time an admitted job waited for a slot.", SECONDS_BUCKETS),
+    "admission_admitted_total": ("counter", "Analysis jobs admitted, by whether they had to queue.", ()),
+    "admission_rejected_total": ("counter", "Analysis submissions refused (client_limit, queue_full, queue_timeout).", ()),
+    "queue_jobs_total": ("counter", "Queued jobs by kind and outcome (enqueued, done, retry, failed, lost, cancelled).", ()),
+    "queue_job_seconds": ("histogram", "Time a worker spent on one attempt of a queued job.", SECONDS_BUCKETS),
+    "queue_depth": ("gauge", "Jobs waiting in the durable queue, as last seen by this process.", ()),
+    "singleflight_calls_total": ("counter", "Coalesced calls by group and role (leader ran the work, follower shared it).", ()),
+    "singleflight_saved_seconds_total": ("counter", "Work time not repeated: the leader's run time once per follower.", ()),
+    "jobs_cancelled_total": ("counter", "Jobs cancelled before they finished, by reason (request, disconnect, resubmitted).", ()),
+    "cancel_saved_seconds_total": ("counter", "Estimated job time saved by cancellations, against the average completed job.", ()),
+    "cancel_saved_tokens_total": ("counter", "Estimated model tokens saved by cancellations, against the average completed job.", ()),
+}
+
+# USD per 1M tokens (input, output, cached input).
+PRICES = {
+    "gpt-4.1": (2.00, 8.00, 0.50),
+    "gpt-4.1-mini": (0.40, 1.60, 0.10),
+    "gpt-4.1-nano": (0.10, 0.40, 0.025),
+    "gpt-4o": (2.50, 10.00, 1.25),
+    "gpt-4o-mini": (0.15, 0.60, 0.075),
+    "gpt-3.5-turbo": (0.50, 1.50, 0.50),
+}
+
+_lock = threading.Lock()
+_counters: Dict[Tuple[str, tuple], float] = {}
+_gauges: Dict[Tuple[str, tuple], float] = {}
+# (name, labels) -> [bucket counts..., +Inf count, sum]
+_histograms: Dict[Tuple[str, tuple], list] = {}
+
+
+def _key(name: str, labels: Dict[str, Any]) -> Tuple[str, tuple]:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def add_gauge(name: str, delta: float, **labels) -> None:
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = _gauges.get(key, 0) + delta
+
+
+def observe(name: str, value: float, **labels) -> None:
+    buckets = METRICS[name][2]
+    key = _key(name, labels)
+    index = bisect.bisect_left(buckets, value)
+    with _lock:
+        row = _histograms.get(key)
+        if row is None:
+            row = _histograms[key] = [0] * (len(buckets) + 2)
+        row[index] += 1
+        row[-1] += value
+
+
+@contextmanager
+def timed(name: str, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+    """`cached_tokens` are the part of `prompt_tokens` read from the provider's prompt cache."""
+    prices = PRICES.get(model)
+    if prices is None:
+        # Dated snapshots ("gpt-4.1-2025-04-14") price like their base model.
+        base = max((m for m in PRICES if model.startswith(m)), key=len, default=None)
+        prices = PRICES.get(base, (0.0, 0.0, 0.0))
+    return ((prompt_tokens - cached_tokens) * prices[0] + cached_tokens * prices[2] + completion_tokens * prices[1]) / 1e6
+
+
+def drain() -> Dict[str, Any]:
+    """Return counters and histograms recorded so far and clear them (gauges stay local)."""
+    with _lock:
+        snapshot = {
+            "counters": list(_counters.items()),
+            "histograms": list(_histograms.items()),
+        }
+        _counters.clear()
+        _histograms.clear()
+    return snapshot
+
+
+def merge(snapshot: Dict[str, Any]) -> None:
+    if not snapshot:
+        return
+    with _lock:
+        for (name, labels), value in snapshot.get("counters", []):
+            key = (name, tuple(tuple(pair) for pair in labels))
+            _counters[key] = _counters.get(key, 0) + value
+        for (name, labels), row in snapshot.get("histograms", []):
+            key = (name, tuple(tuple(pair) for pair in labels))
+            current = _histograms.get(key)
+            if current is None:
+                _histograms[key] = list(row)
+            else:
+                for i, v in enumerate(row):
+                    current[i] += v
+
+
+def _number(value: float) -> str:
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: tuple, extra: Tuple[str, str] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    body = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+    return "{" + body + "}"
+
+
+def render() -> str:
+    """Prometheus text exposition format (version 0.0.4)."""
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        histograms = {k: list(v) for k, v in _histograms.items()}
+
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        full = PREFIX + name
+        lines.append(f"# HELP {full} {help_text}")
+        lines.append(f"# TYPE {full} {kind}")
+        if kind == "counter":
+            for (n, labels), value in sorted(counters.items()):
+                if n == name:
+                    lines.append(f"{full}{_format_labels(labels)} {_number(value)}")
+        elif kind == "gauge":
+            for (n, labels), value in sorted(gauges.items()):
+                if n == name:
+                    lines.append(f"{full}{_format_labels(labels)} {_number(value)}")
+        else:
+            for (n, labels), row in sorted(histograms.items()):
+                if n != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets, row):
+                    cumulative += count
+                    lines.append(f"{full}_bucket{_format_labels(labels, ('le', f'{bound:g}'))} {cumulative}")
+                cumulative += row[len(buckets)]
+                lines.append(f"{full}_bucket{_format_labels(labels, ('le', '+Inf'))} {cumulative}")
+                lines.append(f"{full}_sum{_format_labels(labels)} {_number(row[-1])}")
+                lines.append(f"{full}_count{_format_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
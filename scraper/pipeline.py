@@ -0,0 +1,278 @@
+import os
+import sys
+import time
+import uuid
+import asyncio
+import importlib
+import threading
+import contextlib
+import contextvars
+import concurrent.futures
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from scraper import metrics, tracing, cancellation
+
+# (result key, module, entry point). Modules are only imported when a job
+# actually needs them, or once inside the forkserver that spawns the workers.
+ANALYZERS = [
+    ("fabric_analysis", "scraper.Scripts.upd_fabric_analysis", "run_fabric_analysis_from_json"),
+    ("flare_analysis", "scraper.Scripts.upd_flare_analysis", "run_flare_analysis_from_json"),
+    ("waist_analysis", "scraper.Scripts.upd_waist_analysis", "run_waist_analysis_from_json"),
+    # ("hip_analysis", "scraper.Scripts.upd_hip_analysis", "run_hip_analysis_from_json"),
+    # ("skirt_analysis", "scraper.Scripts.upd_skirt_analysis", "run_skirt_analysis_from_json"),
+    ("bodice_analysis", "scraper.Scripts.upd_bodice", "run_Bodice_analysis_from_json"),
+    ("back_analysis", "scraper.Scripts.upd_back", "run_Back_analysis_from_json"),
+    ("one_shoulder_analysis", "scraper.Scripts.upd_oneShoulder", "run_One_Shoulder_analysis_from_json"),
+    ("sleeves_analysis", "scraper.Scripts.upd_seleeves", "run_Seleevs_analysis_from_json"),
+    ("neckline_analysis", "scraper.Scripts.upd_Neckline", "run_neckline_analysis_from_json"),
+    ("hemline_analysis", "scraper.Scripts.upd_hemline", "run_Hemline_analysis_from_json"),
+]
+
+ANALYZER_KEYS = [key for key, _, _ in ANALYZERS]
+_ANALYZER_ENTRIES = {key: (module, func) for key, module, func in ANALYZERS}
+
+MAX_WORKERS = int(os.getenv("ANALYZER_WORKERS", "5"))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def load(module_name, func_name):
+    """Import `module_name` on first use and return `func_name` from it."""
+    module = importlib.import_module(module_name)
+    return getattr(module, func_name)
+
+
+def run_stage(stage, func, *args):
+    """Run one pipeline stage with latency and error accounting."""
+    with metrics.timed("stage_seconds", stage=stage), tracing.span(stage):
+        try:
+            result = func(*args)
+        except Exception:
+            metrics.inc("stage_errors_total", stage=stage)
+            raise
+    if isinstance(result, dict) and "error" in result:
+        metrics.inc("stage_errors_total", stage=stage)
+    return result
+
+
+def stream_fit_analysis(front_image_path, side_image_path, tags_json_path, dress_json_path=None):
+    """The fit step as a generator of text chunks; the stage ends when the stream does."""
+    func = load("scraper.Scripts.Script", "stream_fit_analysis")
+    with metrics.timed("stage_seconds", stage="fit"), tracing.span("fit", streamed=True):
+        try:
+            yield from func(front_image_path, side_image_path, tags_json_path, dress_json_path)
+        except Exception:
+            metrics.inc("stage_errors_total", stage="fit")
+            raise
+
+
+async def arun_stage(stage, func, *args):
+    """run_stage() for a coroutine function: the stage is awaited on the caller's loop."""
+    with metrics.timed("stage_seconds", stage=stage), tracing.span(stage):
+        try:
+            result = await func(*args)
+        except Exception:
+            metrics.inc("stage_errors_total", stage=stage)
+            raise
+    if isinstance(result, dict) and "error" in result:
+        metrics.inc("stage_errors_total", stage=stage)
+    return result
+
+
+async def arun_scrape_and_save(url, data_dir=None):
+    return await arun_stage("scrape", load("scraper.upd_1", "scrape_and_save"), url, data_dir)
+
+
+async def arun_structure(data_dir=None):
+    return await arun_stage("structure", load("scraper.upd_structure", "run_structure_async"), data_dir)
+
+
+async def arun_fit_analysis(front_image_path, side_image_path, tags_json_path, dress_json_path=None, history=None):
+    return await arun_stage("fit", load("scraper.Scripts.Script", "run_fit_analysis_async"),
+                            front_image_path, side_image_path, tags_json_path, dress_json_path, history)
+
+
+async def abody_history(front_image_path, side_image_path):
+    """The fit step's body turn asked on its own, to share between fits for the same client."""
+    return await arun_stage("body_turn", load("scraper.Scripts.Script", "abody_history"),
+                            front_image_path, side_image_path)
+
+
+def run_analyzer(key, json_path=None):
+    """Resolve the analyzer by key and run it in this process."""
+    module_name, func_name = _ANALYZER_ENTRIES[key]
+    return run_stage(key, load(module_name, func_name), json_path)
+
+
+def _analyzer_job(key, json_path, submitted_at, trace_parent=None, cancel_token=None):
+    """Worker-side entry point: run one analyzer and ship its metrics and spans back."""
+    started_at = time.time()
+    metrics.drain()
+    with tracing.resume(trace_parent) as job_id, cancellation.watch(cancel_token):
+        result = run_analyzer(key, json_path)
+    return {
+        "result": result,
+        "metrics": metrics.drain(),
+        "spans": tracing.drain(job_id) if job_id else [],
+        "started": started_at,
+        "queue_wait": started_at - submitted_at,
+    }
+
+
+_pending = 0
+_pending_lock = threading.Lock()
+
+
+def _track_pending(delta):
+    global _pending
+    with _pending_lock:
+        _pending += delta
+        pending = _pending
+    metrics.set_gauge("executor_inflight", min(pending, MAX_WORKERS))
+    metrics.set_gauge("executor_queue_depth", max(0, pending - MAX_WORKERS))
+
+
+async def submit_analyzer(key, json_path=None, budget=None):
+    """Run one analyzer in the pool; `budget` is an optional asyncio.Semaphore shared by the request."""
+    async with budget or contextlib.nullcontext():
+        loop = asyncio.get_running_loop()
+        trace_parent = tracing.current()
+        submitted_at = time.time()
+        token = uuid.uuid4().hex
+        future = get_executor().submit(_analyzer_job, key, json_path, submitted_at, trace_parent, token)
+        _track_pending(1)
+        try:
+            outcome = await asyncio.wrap_future(future, loop=loop)
+        except asyncio.CancelledError:
+            # Still queued: wrap_future took it out of the pool. Running: skip its remaining model calls.
+            if not future.done():
+                cancellation.flag(token)
+                future.add_done_callback(lambda _: cancellation.clear(token))
+            raise
+        finally:
+            _track_pending(-1)
+    metrics.merge(outcome["metrics"])
+    metrics.observe("executor_queue_wait_seconds", max(0.0, outcome["queue_wait"]))
+    if trace_parent:
+        job_id, parent_id = trace_parent
+        tracing.record(job_id, "queue_wait", submitted_at, outcome["started"], parent_id, analyzer=key)
+        tracing.merge(job_id, outcome["spans"])
+        cancellation.charge(sum(span["attributes"].get("prompt_tokens", 0) + span["attributes"].get("completion_tokens", 0)
+                                for span in outcome["spans"] if span["name"] == "llm"), job_id)
+    return outcome["result"]
+
+
+async def run_analyzers(json_path=None, keys=None, budget=None):
+    """Run the analyzers in the worker pool; returns {key: result} in ANALYZERS order."""
+    keys = keys or ANALYZER_KEYS
+    with tracing.span("analyzers", count=len(keys)):
+        results = await asyncio.gather(*[submit_analyzer(key, json_path, budget) for key in keys])
+    return dict(zip(keys, results))
+
+
+async def run_analyzers_within(timeout, json_path=None, keys=None, budget=None):
+    """run_analyzers() that stops waiting after `timeout` seconds (None: no limit).
+
+    Returns ({key: result} of the analyzers that finished in time, {key: task}
+    of the ones still running). Those are left to finish; the caller collects them.
+    """
+    keys = keys or ANALYZER_KEYS
+    with tracing.span("analyzers", count=len(keys)) as span:
+        tasks = {key: asyncio.ensure_future(submit_analyzer(key, json_path, budget)) for key in keys}
+        try:
+            await asyncio.wait(tasks.values(), timeout=timeout)
+        except asyncio.CancelledError:
+            for task in tasks.values():
+                task.cancel()
+            raise
+        late = {key: task for key, task in tasks.items() if not task.done()}
+        span["late"] = len(late)
+    for key in late:
+        metrics.inc("analyzers_late_total", analyzer=key)
+    return {key: task.result() for key, task in tasks.items() if key not in late}, late
+
+
+def preload_modules():
+    return [module for _, module, _ in ANALYZERS]
+
+
+def _mp_context():
+    # forkserver imports the analyzer stack once and forks every worker from
+    # that warm parent; it is also safe to use from a threaded web process.
+    if sys.platform != "win32" and "forkserver" in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload(["scraper.pipeline"] + preload_modules())
+        return ctx
+    return multiprocessing.get_context()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(max_workers=MAX_WORKERS, mp_context=_mp_context())
+    return _executor
+
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_loop():
+    """Event loop running in a daemon thread, shared by callers that have no loop (the WSGI threads)."""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="pipeline-loop", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def run_coroutine(coro):
+    """Run `coro` on the shared loop in the caller's context (request, trace) and block for its result.
+
+    Unlike asyncio.run() per request, clients that pool connections per
+    loop (aiohttp, httpx under the async OpenAI client) keep working across
+    requests, and every in-flight job waits on the same loop.
+    """
+    loop = get_loop()
+    context = contextvars.copy_context()
+    done = concurrent.futures.Future()
+
+    def finish(task):
+        if task.cancelled():
+            done.cancel()
+        elif task.exception() is not None:
+            done.set_exception(task.exception())
+        else:
+            done.set_result(task.result())
+
+    def start():
+        loop.create_task(coro, context=context).add_done_callback(finish)
+
+    loop.call_soon_threadsafe(start)
+    return done.result()
+
+
+def _noop():
+    return os.getpid()
+
+
+def warm_up():
+    """Start the forkserver and all workers so the first job does not pay for it."""
+    executor = get_executor()
+    futures = [executor.submit(_noop) for _ in range(MAX_WORKERS)]
+    for future in futures:
+        future.result()
+    print(f"[DEBUG] Analyzer workers ready ({MAX_WORKERS})")
+
+
+def warm_up_in_background():
+    thread = threading.Thread(target=warm_up, name="pipeline-warmup", daemon=True)
+    thread.start()
+    return thread
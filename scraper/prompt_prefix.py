@@ -0,0 +1,107 @@
+import os
+import base64
+import hashlib
+from functools import lru_cache
+from typing import Dict, Any, List, Optional
+
+import cv2
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from scraper import tracing, static_cache
+
+# The opening every analyzer conversation shares.
+#
+# Providers cache prompt prefixes: the part of a request that repeats the
+# start of a recent one (1024 tokens at least, for OpenAI) is served from
+# cache, faster and at a fraction of the input price. The analyzers used
+# to open with their own preamble and image, so they had nothing in
+# common. They now all start with messages(): the same system text, the
+# dress images in a fixed order and the product text, byte for byte, and
+# only then their own topic, instructions and questions. The questions
+# leave the images and the product text to the prefix; an analyzer run
+# without dress data still attaches its image to every question. Calls
+# that go out together (the first question of every analyzer) may all miss; later
+# questions, and the next job for the same dress, read the prefix from
+# cache. cache_key() goes with the requests (prompt_cache_key) so calls
+# sharing a prefix are routed to the same cache.
+#
+# Hit rates are in the llm spans of each job's trace (cached_tokens) and in
+# llm_cached_tokens_total.
+
+SYSTEM_TEXT = """You're a senior specialist and a fashion expert on women's dresses. Your job is to help analyze one dress.
+You'll be shown the product images and the product text of the dress, then asked a series of questions about it.
+Each series says which image to look at. Answer every question in the JSON format it asks for."""
+
+# Image roles from the structure step, in the order they are shown, and how the questions refer to them.
+# Only roles some analyzer looks at: every image is paid for in every call, if mostly at the cached price.
+IMAGES = [
+    ("fabric_dress_image", "the dress image (the dress on its own)"),
+    ("model_wearning_front_image", "the front image (the dress worn by the model, from the front)"),
+    ("model_wearning_back_image", "the back image (the dress worn by the model, from the back)"),
+]
+LABELS = dict(IMAGES)
+
+
+def encode_image(image_path: str) -> str:
+    """An image as base64 JPEG; once per process and file version, so every conversation sends the same bytes."""
+    # The scraper saves every product to the same file names; the version tells them apart.
+    return _encode(static_cache.file_version(image_path))
+
+
+@lru_cache(maxsize=16)
+def _encode(version: tuple) -> str:
+    image_path = version[0][0]
+    with tracing.span("encode_image", image=os.path.basename(image_path)) as span:
+        image = cv2.imread(image_path)
+        if image is None:
+            raise FileNotFoundError(f"Image not found: {image_path}")
+        _, buffer = cv2.imencode(".jpg", image)
+        encoded = base64.b64encode(buffer).decode("utf-8")
+        span["bytes"] = len(encoded)
+    return encoded
+
+
+def _shown(dress_data: Dict[str, Any]) -> List[tuple]:
+    images = dress_data.get("images") or {}
+    shown, paths = [], set()
+    for role, label in IMAGES:
+        path = images.get(role)
+        if path and path not in paths and os.path.exists(path):
+            shown.append((label, path))
+            paths.add(path)
+    return shown
+
+
+def _product_text(dress_data: Dict[str, Any]) -> str:
+    return (f"Fabric description:\n{dress_data.get('Fabric_charactericts') or 'Not given.'}\n\n"
+            f"Model's measurements:\n{dress_data.get('Model_Measurement') or 'Not given.'}")
+
+
+def messages(dress_data: Dict[str, Any], topic: str, focus: Optional[str] = None) -> List:
+    """The shared prefix, then what the analyzer's questions are about and which image (`focus`, a role) to look at."""
+    shown = _shown(dress_data)
+    content = []
+    for label, path in shown:
+        content.append({"type": "text", "text": f"This is {label}:"})
+        content.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{encode_image(path)}"}})
+    content.append({"type": "text", "text": _product_text(dress_data)})
+    conversation = [SystemMessage(content=SYSTEM_TEXT), HumanMessage(content=content)]
+
+    # From here on the conversation is the analyzer's own.
+    look = f" Look at {LABELS[focus]}." if any(label == LABELS.get(focus) for label, _ in shown) else ""
+    conversation.append(HumanMessage(content=f"The next questions are about {topic}.{look}"))
+    return conversation
+
+
+def cache_key(dress_data: Dict[str, Any]) -> str:
+    """Same for every conversation that opens with the same prefix."""
+    digest = hashlib.sha256(_product_text(dress_data).encode("utf-8"))
+    for label, path in _shown(dress_data):
+        digest.update(label.encode("utf-8"))
+        digest.update(encode_image(path).encode("ascii"))
+    return f"dress-{digest.hexdigest()[:24]}"
+
+
+def extra_body(dress_data: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Extra request fields for an analyzer's ChatOpenAI(extra_body=...)."""
+    return {"prompt_cache_key": cache_key(dress_data)} if dress_data else None
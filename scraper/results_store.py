@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Dict, Any, List, Optional
+
+# Analysis results, one row per job, in SQLite (RESULTS_DB).
+#
+# The job id is the primary key, so /output/<job_id> is a single index
+# lookup however many jobs are stored. Secondary indexes cover the other
+# questions we ask: recent jobs for a product and jobs that used a given
+# upload. WAL mode lets readers run alongside a writer; every write is a
+# single statement, so concurrent web and worker processes need no extra
+# locking beyond SQLite's own.
+
+RESULTS_DB = os.getenv("RESULTS_DB", os.path.join("data", "results.db"))
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+
+def _connect() -> sqlite3.Connection:
+    """One connection per thread, kept open: most calls are a single primary-key read."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None and getattr(_local, "path", None) == RESULTS_DB:
+        return conn
+    directory = os.path.dirname(RESULTS_DB)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(RESULTS_DB, timeout=30, isolation_level=None)
+    with _schema_lock:
+        if RESULTS_DB not in _schema_ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS results (
+                    job_id TEXT PRIMARY KEY,
+                    product_id TEXT,
+                    url TEXT,
+                    front_hash TEXT,
+                    side_hash TEXT,
+                    status TEXT NOT NULL,
+                    analysis TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    updated REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS results_product ON results (product_id, created);
+                CREATE INDEX IF NOT EXISTS results_front ON results (front_hash, created);
+                CREATE INDEX IF NOT EXISTS results_side ON results (side_hash, created);
+                CREATE INDEX IF NOT EXISTS results_created ON results (created);
+            """)
+            _schema_ready.add(RESULTS_DB)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    _local.conn, _local.path = conn, RESULTS_DB
+    return conn
+
+
+def _row(row) -> Optional[Dict[str, Any]]:
+    if row is None:
+        return None
+    job_id, product_id, url, front_hash, side_hash, status, analysis, created, updated = row
+    return {
+        "job_id": job_id,
+        "product_id": product_id,
+        "url": url,
+        "front_hash": front_hash,
+        "side_hash": side_hash,
+        "status": status,
+        "analysis": json.loads(analysis),
+        "created": created,
+        "updated": updated,
+    }
+
+
+_COLUMNS = "job_id, product_id, url, front_hash, side_hash, status, analysis, created, updated"
+
+
+def save(job_id: str, analysis: Dict[str, Any], url: Optional[str] = None, product_id: Optional[str] = None,
+         front_hash: Optional[str] = None, side_hash: Optional[str] = None, status: str = "analyzed") -> None:
+    """Insert or replace the analysis of `job_id`."""
+    now = time.time()
+    _connect().execute(
+        f"INSERT INTO results ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT(job_id) DO UPDATE SET analysis = excluded.analysis, status = excluded.status, updated = excluded.updated",
+        (job_id, product_id, url, front_hash, side_hash, status, json.dumps(analysis, ensure_ascii=False), now, now))
+
+
+def set_conclusion(job_id: str, conclusion: Any, status: str = "done") -> bool:
+    """Attach the fit conclusion to a stored job in place; False if the job is unknown."""
+    cursor = _connect().execute(
+        "UPDATE results SET analysis = json_set(analysis, '$.Conclusion', json(?)), status = ?, updated = ? WHERE job_id = ?",
+        (json.dumps(conclusion, ensure_ascii=False), status, time.time(), job_id))
+    return cursor.rowcount > 0
+
+
+def set_sections(job_id: str, sections: Dict[str, Any], remove: List[str] = ()) -> bool:
+    """Set (and drop) top-level keys of a stored analysis in place, leaving the rest (e.g. the conclusion) as is."""
+    if not sections and not remove:
+        return False
+    expr, params = "analysis", []
+    if sections:
+        expr = f"json_set({expr}, " + ", ".join("?, json(?)" for _ in sections) + ")"
+        for key, value in sections.items():
+            params += [f'$."{key}"', json.dumps(value, ensure_ascii=False)]
+    if remove:
+        expr = f"json_remove({expr}, " + ", ".join("?" for _ in remove) + ")"
+        params += [f'$."{key}"' for key in remove]
+    cursor = _connect().execute(f"UPDATE results SET analysis = {expr}, updated = ? WHERE job_id = ?",
+                                (*params, time.time(), job_id))
+    return cursor.rowcount > 0
+
+
+def get(job_id: str) -> Optional[Dict[str, Any]]:
+    return _row(_connect().execute(f"SELECT {_COLUMNS} FROM results WHERE job_id = ?", (job_id,)).fetchone())
+
+
+def recent_for_product(product_id: str, limit: int = 10) -> List[Dict[str, Any]]:
+    """Newest jobs for a product, newest first."""
+    rows = _connect().execute(
+        f"SELECT {_COLUMNS} FROM results WHERE product_id = ? ORDER BY created DESC LIMIT ?", (product_id, limit))
+    return [_row(row) for row in rows]
+
+
+def for_upload(upload_hash: str, limit: int = 10) -> List[Dict[str, Any]]:
+    """Newest jobs that used this photo (front or side), newest first."""
+    rows = _connect().execute(
+        f"SELECT {_COLUMNS} FROM ("
+        f" SELECT {_COLUMNS} FROM results WHERE front_hash = ?"
+        f" UNION SELECT {_COLUMNS} FROM results WHERE side_hash = ?"
+        ") ORDER BY created DESC LIMIT ?", (upload_hash, upload_hash, limit))
+    return [_row(row) for row in rows]
@@ -0,0 +1,304 @@
+import os
+import cv2
+import numpy as np
+from typing import Dict, Any, Optional
+
+# Tags below this confidence are left to the LLM.
+MIN_CONFIDENCE = float(os.getenv("SILHOUETTE_MIN_CONFIDENCE", "0.8"))
+
+WORK_HEIGHT = 512
+PROFILE_POINTS = 100
+
+# silhouette tag -> analyzer result key it pre-answers
+TAG_SOURCES = {
+    "flare_under_bust": "flare_analysis",
+    "flare_waist": "flare_analysis",
+    "waist_tight": "waist_analysis",
+    "waist_loose": "waist_analysis",
+    "Hemline": "hemline_analysis",
+    "One_Shoulder": "one_shoulder_analysis",
+}
+
+
+def load_image(image_path: str) -> np.ndarray:
+    """Read an image and shrink it to WORK_HEIGHT rows; geometry is scale-free."""
+    image = cv2.imread(image_path)
+    if image is None:
+        raise FileNotFoundError(f"Image not found: {image_path}")
+    height, width = image.shape[:2]
+    if height > WORK_HEIGHT:
+        scale = WORK_HEIGHT / height
+        image = cv2.resize(image, (max(1, round(width * scale)), WORK_HEIGHT), interpolation=cv2.INTER_AREA)
+    return image
+
+
+def segment(image: np.ndarray, fill_holes: bool = True) -> np.ndarray:
+    """Boolean mask of the largest subject on a plain studio backdrop.
+
+    The backdrop colour is the median of the border pixels; anything far
+    enough from it in Lab space is foreground.
+    """
+    mask = _foreground(image)
+    return fill(mask) if fill_holes else mask
+
+
+def _foreground(image: np.ndarray) -> np.ndarray:
+    lab = cv2.cvtColor(image, cv2.COLOR_BGR2LAB).astype(np.float32)
+    border = np.concatenate([lab[0], lab[-1], lab[:, 0], lab[:, -1]])
+    background = np.median(border, axis=0)
+    border_spread = np.percentile(np.linalg.norm(border - background, axis=1), 95)
+    distance = np.linalg.norm(lab - background, axis=2)
+    mask = (distance > max(12.0, border_spread * 1.5)).astype(np.uint8)
+
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=2)
+
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    if count <= 1:
+        return np.zeros(mask.shape, dtype=bool)
+    largest = 1 + int(np.argmax(stats[1:, cv2.CC_STAT_AREA]))
+    return labels == largest
+
+
+def fill(mask: np.ndarray) -> np.ndarray:
+    """Fill interior holes, e.g. light print areas that match the backdrop."""
+    contours, _ = cv2.findContours(mask.astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    filled = np.zeros(mask.shape, dtype=np.uint8)
+    cv2.drawContours(filled, contours, -1, 1, thickness=cv2.FILLED)
+    return filled.astype(bool)
+
+
+def row_extents(mask: np.ndarray):
+    """Leftmost/rightmost foreground column and width for every row (0 where empty)."""
+    present = mask.any(axis=1)
+    left = mask.argmax(axis=1)
+    right = mask.shape[1] - 1 - mask[:, ::-1].argmax(axis=1)
+    widths = np.where(present, right - left + 1, 0)
+    return widths, left, right, present
+
+
+def central_extents(mask: np.ndarray):
+    """Like row_extents, but only the run of foreground that contains the body axis.
+
+    Keeps loose sleeves and arms that are separated from the torso by a gap
+    out of the width measurements.
+    """
+    height, width = mask.shape
+    columns = np.flatnonzero(mask.any(axis=0))
+    if columns.size == 0:
+        zeros = np.zeros(height, dtype=int)
+        return zeros, zeros, zeros, np.zeros(height, dtype=bool)
+    axis = int(np.median(np.nonzero(mask)[1]))
+    present = mask[:, axis]
+    left_gap = (~mask[:, :axis + 1])[:, ::-1]
+    left = np.where(left_gap.any(axis=1), axis + 1 - left_gap.argmax(axis=1), 0)
+    right_gap = ~mask[:, axis:]
+    right = np.where(right_gap.any(axis=1), axis + right_gap.argmax(axis=1) - 1, width - 1)
+    widths = np.where(present, right - left + 1, 0)
+    return widths, left, right, present
+
+
+def width_profile(mask: np.ndarray, points: int = PROFILE_POINTS):
+    """Torso width resampled to `points` steps from top (0) to bottom (1).
+
+    Returns (profile, top_row, bottom_row); widths are in pixels.
+    """
+    widths, _, _, present = central_extents(mask)
+    rows = np.flatnonzero(mask.any(axis=1))
+    if rows.size < 2:
+        return np.zeros(points), 0, 0
+    top, bottom = int(rows[0]), int(rows[-1])
+    section = widths[top:bottom + 1].astype(np.float64)
+    kernel = np.ones(5) / 5
+    section = np.convolve(np.pad(section, 2, mode="edge"), kernel, mode="valid")
+    positions = np.linspace(0, section.size - 1, points)
+    profile = np.interp(positions, np.arange(section.size), section)
+    return profile, top, bottom
+
+
+def _at(profile: np.ndarray, fraction: float) -> float:
+    index = int(round(np.clip(fraction, 0, 1) * (profile.size - 1)))
+    return float(profile[index])
+
+
+def _confidence(value: float, threshold: float, scale: float, quality: float) -> float:
+    return round(float(np.clip(abs(value - threshold) / scale, 0, 1)) * quality, 3)
+
+
+def _mask_quality(mask: np.ndarray, top: int, bottom: int) -> float:
+    """1.0 for a clean, fully framed subject; lower when segmentation looks off."""
+    height, width = mask.shape
+    coverage = mask.mean()
+    quality = 1.0
+    if not 0.05 <= coverage <= 0.85:
+        quality *= 0.3
+    if (bottom - top) < 0.5 * height:
+        quality *= 0.5
+    _, left, right, present = row_extents(mask)
+    touching = np.mean((left[present] == 0) | (right[present] == width - 1)) if present.any() else 1.0
+    if touching > 0.1:
+        quality *= 0.5
+    return quality
+
+
+def _arms_merged(profile: np.ndarray) -> bool:
+    """A sudden narrowing mid-body usually means hanging sleeves or arms end there."""
+    n = profile.size - 1
+    section = profile[int(0.25 * n):int(0.70 * n) + 1]
+    drops = (section[:-2] - section[2:]) / np.maximum(section[:-2], 1.0)
+    return bool(drops.size and drops.max() > 0.15)
+
+
+def _landmarks(profile: np.ndarray) -> Dict[str, float]:
+    n = profile.size - 1
+    bust_idx = int(np.argmax(profile[int(0.12 * n):int(0.30 * n) + 1])) + int(0.12 * n)
+    waist_lo = max(bust_idx + 3, int(0.25 * n))
+    waist_idx = int(np.argmin(profile[waist_lo:int(0.50 * n) + 1])) + waist_lo
+    hip_lo = min(waist_idx + int(0.08 * n), int(0.60 * n))
+    hip_idx = int(np.argmax(profile[hip_lo:int(0.65 * n) + 1])) + hip_lo
+    return {
+        "bust": bust_idx / n,
+        "waist": waist_idx / n,
+        "hip": hip_idx / n,
+    }
+
+
+def _hemline_shape(mask: np.ndarray, top: int, bottom: int):
+    """Fit the lowest foreground row per column across the hem with a parabola.
+
+    Returns (spread, slope, curvature) normalised by silhouette height.
+    """
+    height = max(1, bottom - top)
+    present = mask.any(axis=0)
+    lowest = mask.shape[0] - 1 - mask[::-1].argmax(axis=0)
+    columns = np.flatnonzero(present & (lowest >= bottom - 0.25 * height))
+    if columns.size < 5:
+        return None
+    x = (columns - columns.mean()) / max(1.0, (columns.max() - columns.min()) / 2)
+    y = (lowest[columns] - bottom) / height
+    curvature, slope, _ = np.polyfit(x, y, 2)
+    spread = float(y.max() - y.min())
+    return spread, float(slope), float(curvature)
+
+
+def _shoulder_asymmetry(mask: np.ndarray, top: int, bottom: int, bust_row: int) -> Optional[float]:
+    """Height difference between the highest point of each half of the upper body."""
+    _, left, right, present = row_extents(mask)
+    if not present[bust_row]:
+        return None
+    span_left, span_right = int(left[bust_row]), int(right[bust_row])
+    # Straps sit over the outer part of each shoulder; the neckline is in between.
+    outer = max(1, int(0.2 * (span_right - span_left)))
+    upper = mask[top:bust_row + 1]
+    column_present = upper.any(axis=0)
+    highest = upper.argmax(axis=0).astype(np.float64)
+    highest[~column_present] = np.inf
+    left_top = highest[span_left:span_left + outer].min(initial=np.inf)
+    right_top = highest[span_right + 1 - outer:span_right + 1].min(initial=np.inf)
+    if not np.isfinite(left_top) or not np.isfinite(right_top):
+        return None
+    return abs(left_top - right_top) / max(1, bottom - top)
+
+
+def analyze_mask(mask: np.ndarray) -> Dict[str, Any]:
+    profile, top, bottom = width_profile(mask)
+    if bottom - top < 10:
+        return {"tags": {}, "profile": {}, "quality": 0.0}
+
+    quality = _mask_quality(mask, top, bottom)
+    marks = _landmarks(profile)
+    bust = _at(profile, marks["bust"])
+    waist = _at(profile, marks["waist"])
+    hip = _at(profile, marks["hip"])
+    under_bust = marks["bust"] + 0.06
+    # Widths above the cuffs include the sleeves, so torso ratios are unreliable.
+    torso_quality = quality * (0.5 if _arms_merged(profile) else 1.0)
+
+    tags: Dict[str, Dict[str, Any]] = {}
+
+    waist_ratio = waist / max(bust, 1.0)
+    tags["waist_tight"] = {
+        "value": "yes" if waist_ratio < 0.80 else "no",
+        "confidence": _confidence(waist_ratio, 0.80, 0.12, torso_quality),
+    }
+    tags["waist_loose"] = {
+        "value": "yes" if waist_ratio > 0.92 else "no",
+        "confidence": _confidence(waist_ratio, 0.92, 0.06, torso_quality),
+    }
+
+    waist_gain = _at(profile, marks["waist"] + 0.12) / max(waist, 1.0)
+    tags["flare_waist"] = {
+        "value": "yes" if waist_gain > 1.25 else "no",
+        "confidence": _confidence(waist_gain, 1.25, 0.20, torso_quality),
+    }
+
+    under_bust_gain = _at(profile, under_bust + 0.15) / max(_at(profile, under_bust), 1.0)
+    tags["flare_under_bust"] = {
+        "value": "yes" if under_bust_gain > 1.20 else "no",
+        "confidence": _confidence(under_bust_gain, 1.20, 0.20, torso_quality),
+    }
+
+    hem = _hemline_shape(mask, top, bottom)
+    if hem is not None:
+        spread, slope, curvature = hem
+        if spread < 0.04:
+            tags["Hemline"] = {"value": "straight", "confidence": _confidence(spread, 0.04, 0.03, quality)}
+        else:
+            tilt = abs(slope) / (abs(slope) + abs(curvature) + 1e-9)
+            if tilt > 0.5:
+                value = "asymmetric"
+            elif curvature > 0:
+                value = "high/low"
+            else:
+                value = "other"
+            dominance = abs(tilt - 0.5) * 2
+            tags["Hemline"] = {
+                "value": value,
+                "confidence": round(min(1.0, spread / 0.10) * dominance * quality, 3),
+            }
+
+    bust_row = top + int(round(marks["bust"] * (bottom - top)))
+    asymmetry = _shoulder_asymmetry(mask, top, bottom, bust_row)
+    if asymmetry is not None:
+        tags["One_Shoulder"] = {
+            "value": "yes" if asymmetry > 0.07 else "no",
+            "confidence": _confidence(asymmetry, 0.07, 0.05, quality),
+        }
+
+    return {
+        "tags": tags,
+        "profile": {
+            "landmarks": {k: round(v, 3) for k, v in marks.items()},
+            "waist_to_bust": round(waist_ratio, 3),
+            "hip_to_bust": round(hip / max(bust, 1.0), 3),
+            "widths": [round(float(w), 1) for w in profile[::5]],
+        },
+        "quality": quality,
+    }
+
+
+def analyze(image_path: str) -> Dict[str, Any]:
+    """Geometric tags for a product shot; never raises so analyzers can fall back to the LLM."""
+    try:
+        return analyze_mask(segment(load_image(image_path)))
+    except Exception as e:
+        return {"tags": {}, "profile": {}, "quality": 0.0, "error": str(e)}
+
+
+def for_dress(dress_data: Optional[Dict[str, Any]], image_path: str) -> Dict[str, Any]:
+    """The geometry the structure step stored with the dress, or analyze(image_path) for data stored before it did."""
+    geometry = (dress_data or {}).get("silhouette")
+    return geometry if geometry is not None else analyze(image_path)
+
+
+def confident(geometry: Dict[str, Any], tag: str, min_confidence: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """Return {tag: value, tag_summary: ...} when the local estimate can replace the LLM."""
+    threshold = MIN_CONFIDENCE if min_confidence is None else min_confidence
+    estimate = geometry.get("tags", {}).get(tag)
+    if not estimate or estimate["confidence"] < threshold:
+        return None
+    return {
+        tag: estimate["value"],
+        f"{tag}_summary": f"Estimated from the dress silhouette (confidence {estimate['confidence']:.2f}).",
+    }
@@ -0,0 +1,203 @@
+import time
+import asyncio
+import contextlib
+import contextvars
+import threading
+import concurrent.futures
+from typing import Any, Dict, Hashable, Iterator, Tuple
+
+from scraper import metrics, tracing
+
+# Single-flight execution: concurrent calls with the same key share one run.
+#
+# The first caller for a key (the leader) does the work; callers arriving
+# while it runs (followers) wait for the leader's result or exception
+# instead of repeating the work. Nothing is cached: once the flight lands,
+# the next call starts a new one. The flight is a concurrent.futures.Future,
+# so threads (call) and coroutines on any loop (run) can share it. A
+# coroutine flight runs as its own task and is cancelled only when every
+# caller waiting on it has been cancelled, and with a `grace` period only
+# if nobody has joined it again by the end of it (a reloaded page).
+#
+# stream() does the same for generators: the generator runs in its own
+# thread and every caller, leader included, follows it: the chunks
+# produced so far, then the rest as they come.
+#
+# Per group: singleflight_calls_total{role} counts leaders and followers,
+# singleflight_saved_seconds_total adds the leader's run time once per
+# follower, i.e. the work that was not repeated.
+
+
+class Group:
+    def __init__(self, name: str, grace: float = 0.0):
+        self.name = name
+        self.grace = grace
+        self._lock = threading.Lock()
+        self._flights: Dict[Hashable, Dict[str, Any]] = {}
+
+    def _join(self, key: Hashable) -> Tuple[Dict[str, Any], bool]:
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight["followers"] += 1
+                flight["waiters"] += 1
+                metrics.inc("singleflight_calls_total", group=self.name, role="follower")
+                return flight, False
+            flight = self._flights[key] = {"future": concurrent.futures.Future(), "followers": 0, "waiters": 1,
+                                           "started": time.perf_counter(), "task": None, "loop": None,
+                                           "chunks": [], "changed": concurrent.futures.Future(), "abandoned": 0,
+                                           "stop": threading.Event()}
+        metrics.inc("singleflight_calls_total", group=self.name, role="leader")
+        return flight, True
+
+    def _land(self, key: Hashable, flight: Dict[str, Any]) -> None:
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            followers = flight["followers"]
+        if followers:
+            metrics.inc("singleflight_saved_seconds_total", (time.perf_counter() - flight["started"]) * followers,
+                        group=self.name)
+
+    def _leave(self, key: Hashable, flight: Dict[str, Any]) -> None:
+        """A waiter was cancelled; the work is cancelled with the last one, after the grace period."""
+        with self._lock:
+            flight["waiters"] -= 1
+            if flight["waiters"] > 0:
+                return
+            flight["abandoned"] += 1
+            abandoned = flight["abandoned"]
+        if self.grace > 0:
+            timer = threading.Timer(self.grace, self._abandon, (key, flight, abandoned))
+            timer.daemon = True
+            timer.start()
+        else:
+            self._abandon(key, flight, abandoned)
+
+    def _abandon(self, key: Hashable, flight: Dict[str, Any], abandoned: int) -> None:
+        with self._lock:
+            # Someone joined since (and may have left again, starting a new grace period).
+            if flight["waiters"] > 0 or flight["abandoned"] != abandoned:
+                return
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            task, loop = flight["task"], flight["loop"]
+        flight["stop"].set()
+        if task is not None:
+            loop.call_soon_threadsafe(task.cancel)
+
+    def _settle(self, key: Hashable, flight: Dict[str, Any], task: asyncio.Task) -> None:
+        self._land(key, flight)
+        if task.cancelled():
+            flight["future"].cancel()
+        elif task.exception() is not None:
+            flight["future"].set_exception(task.exception())
+        else:
+            flight["future"].set_result(task.result())
+        self._wake(flight)
+
+    def _emit(self, flight: Dict[str, Any], chunk: Any) -> None:
+        with self._lock:
+            flight["chunks"].append(chunk)
+            changed, flight["changed"] = flight["changed"], concurrent.futures.Future()
+        changed.set_result(None)
+
+    def _wake(self, flight: Dict[str, Any]) -> None:
+        """Streams: the flight has landed; followers waiting for the next chunk read the outcome instead."""
+        with self._lock:
+            changed = flight["changed"]
+        if not changed.done():
+            changed.set_result(None)
+
+    def _next(self, flight: Dict[str, Any], seen: int) -> Tuple[list, bool, concurrent.futures.Future]:
+        """Chunks after the first `seen`, whether the stream has ended, and what to wait on otherwise."""
+        with self._lock:
+            # Every chunk is emitted before the flight lands, so a landed flight's chunks are all here.
+            return flight["chunks"][seen:], flight["future"].done(), flight["changed"]
+
+    def call(self, key: Hashable, func, *args) -> Any:
+        """func(*args) in this thread, or the result of the same call already running in another."""
+        flight, leader = self._join(key)
+        if not leader:
+            with tracing.span("singleflight_wait", group=self.name):
+                return flight["future"].result()
+        try:
+            result = func(*args)
+        except BaseException as e:
+            self._land(key, flight)
+            flight["future"].set_exception(e)
+            raise
+        self._land(key, flight)
+        flight["future"].set_result(result)
+        return result
+
+    async def run(self, key: Hashable, func, *args) -> Any:
+        """await func(*args), or the result of the same call already in flight.
+
+        The work runs as its own task (in the leader's context), so the
+        leader going away does not cancel it for the followers; it is
+        cancelled once every caller waiting on it has been.
+        """
+        flight, leader = self._join(key)
+        if leader:
+            flight["loop"] = asyncio.get_running_loop()
+            flight["task"] = asyncio.ensure_future(func(*args))
+            flight["task"].add_done_callback(lambda task: self._settle(key, flight, task))
+        wait = contextlib.nullcontext() if leader else tracing.span("singleflight_wait", group=self.name)
+        try:
+            with wait:
+                return await asyncio.shield(asyncio.wrap_future(flight["future"]))
+        except asyncio.CancelledError:
+            self._leave(key, flight)
+            raise
+
+    def stream(self, key: Hashable, func, *args) -> Iterator[Any]:
+        """Iterate the generator func(*args), or follow the same stream already in flight.
+
+        As with run(), the work does not belong to the leader: the
+        generator is iterated by its own thread (in the leader's context),
+        and once every caller following it has gone away it is closed at
+        its next chunk.
+        """
+        flight, leader = self._join(key)
+        if leader:
+            def pump():
+                chunks = func(*args)
+                stopped = False
+                try:
+                    for chunk in chunks:
+                        if flight["stop"].is_set():
+                            stopped = True
+                            chunks.close()
+                            break
+                        self._emit(flight, chunk)
+                except BaseException as e:
+                    self._land(key, flight)
+                    flight["future"].set_exception(e)
+                else:
+                    self._land(key, flight)
+                    if stopped:
+                        flight["future"].cancel()
+                    else:
+                        flight["future"].set_result(None)
+                self._wake(flight)
+
+            context = contextvars.copy_context()
+            threading.Thread(target=context.run, args=(pump,), name=f"singleflight-{self.name}", daemon=True).start()
+        wait = contextlib.nullcontext() if leader else tracing.span("singleflight_wait", group=self.name)
+        try:
+            with wait:
+                seen = 0
+                while True:
+                    chunks, ended, changed = self._next(flight, seen)
+                    if chunks:
+                        seen += len(chunks)
+                        yield from chunks
+                    elif ended:
+                        flight["future"].result()
+                        return
+                    else:
+                        changed.result()
+        except GeneratorExit:
+            self._leave(key, flight)
+            raise
@@ -0,0 +1,74 @@
+import os
+import hashlib
+import threading
+from typing import Dict, Any, Callable, Optional, Tuple
+
+# In-process caching for pages and assets built from files on disk.
+#
+# A cached value is tied to a version: the (mtime, size) of the files it was
+# built from. Checking it costs one stat per file instead of re-reading
+# and re-rendering. A directory's own mtime only moves when an entry is
+# added, removed or renamed, not when a file in it is rewritten, so a value
+# built from a directory's files is versioned on each of those files.
+
+ONE_YEAR = 365 * 24 * 3600
+IMMUTABLE = f"public, max-age={ONE_YEAR}, immutable"
+
+
+def file_version(*paths: str) -> Tuple:
+    """(path, mtime_ns, size) for each path; missing paths are part of the version too."""
+    version = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            version.append((path, st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            version.append((path, None, None))
+    return tuple(version)
+
+
+def last_modified(version: Tuple) -> Optional[float]:
+    stamps = [mtime for _, mtime, _ in version if mtime is not None]
+    return max(stamps) / 1e9 if stamps else None
+
+
+class VersionedCache:
+    """One value per key, rebuilt when the caller's version for that key changes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[Any, Tuple[Tuple, Any]] = {}
+        self.hits = 0
+        self.builds = 0
+
+    def get(self, key: Any, version: Tuple, build: Callable[[], Any]) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self.hits += 1
+                return entry[1]
+        # Built outside the lock; two concurrent misses both build, the last one is kept.
+        value = build()
+        with self._lock:
+            self._entries[key] = (version, value)
+            self.builds += 1
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_fingerprints = VersionedCache()
+
+
+def fingerprint(path: str) -> str:
+    """Short content hash of a file, recomputed only when its mtime or size changes."""
+    def build():
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()[:16]
+
+    return _fingerprints.get(path, file_version(path), build)
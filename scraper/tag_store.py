@@ -0,0 +1,277 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import shutil
+import asyncio
+import hashlib
+import argparse
+import importlib.util
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from scraper import pipeline, metrics, tracing
+
+# Precomputed dress tags.
+#
+# Everything before the fit step (scrape, structure, the analyzers) depends
+# only on the product, so it can be computed offline for the catalog and
+# looked up at request time. Each product has a build directory holding the
+# scraped files, formatted_output.json and images, plus a small index file
+# TAG_DIR/<product_id>.json with the analyzer results and the versions they
+# were computed with.
+#
+# A version is a hash of the module source, so editing a question set or a
+# model name in an analyzer invalidates that analyzer's tags only. Scraped
+# data also expires after MAX_AGE (sizes and copy change on the retailer's
+# side); an expired or re-versioned scrape means a full recompute.
+#
+#     python -m scraper.tag_store build urls.txt [--concurrency 8] [--force]
+#     python -m scraper.tag_store status
+
+ENABLED = os.getenv("TAG_STORE", "1") == "1"
+TAG_DIR = os.getenv("TAG_STORE_DIR", os.path.join("data", "tags"))
+MAX_AGE = float(os.getenv("TAG_STORE_MAX_AGE_HOURS", "168")) * 3600
+CONCURRENCY = int(os.getenv("TAG_STORE_CONCURRENCY", "8"))
+
+# Version keys for the product-level stages, besides one per analyzer.
+SCRAPE_STAGES = {"scrape": "scraper.upd_1", "structure": "scraper.upd_structure"}
+
+
+def product_id(url: str) -> str:
+    """Retailer product id (the trailing number in the URL path), or a hash of the URL without query."""
+    parsed = urlparse(url.strip())
+    match = re.search(r"/(\d{6,})/?$", parsed.path)
+    if match:
+        return match.group(1)
+    canonical = f"{parsed.netloc.lower()}{parsed.path.rstrip('/')}"
+    return "u" + hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:24]
+
+
+@lru_cache(maxsize=None)
+def fingerprint(module_name: str) -> str:
+    """Hash of a module's source, read without importing it."""
+    spec = importlib.util.find_spec(module_name)
+    with open(spec.origin, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+
+def versions() -> Dict[str, str]:
+    current = {stage: fingerprint(module) for stage, module in SCRAPE_STAGES.items()}
+    for key, module, _ in pipeline.ANALYZERS:
+        current[key] = fingerprint(module)
+    return current
+
+
+def _index_path(pid: str) -> str:
+    return os.path.join(TAG_DIR, f"{pid}.json")
+
+
+def load(pid: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(_index_path(pid), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save(entry: Dict[str, Any]) -> None:
+    """Replace the index file atomically and drop build directories it no longer points to."""
+    os.makedirs(TAG_DIR, exist_ok=True)
+    path = _index_path(entry["product_id"])
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entry, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+    # Keep the previous build too: a request may still be reading its images.
+    product_dir = os.path.join(TAG_DIR, entry["product_id"])
+    builds = sorted((d for d in os.listdir(product_dir) if d != entry["build"]),
+                    key=lambda d: os.path.getmtime(os.path.join(product_dir, d)))
+    for old in builds[:-1]:
+        shutil.rmtree(os.path.join(product_dir, old), ignore_errors=True)
+
+
+def dress_json_path(entry: Dict[str, Any]) -> str:
+    return os.path.join(entry["dir"], "formatted_output.json")
+
+
+def check(entry: Optional[Dict[str, Any]], now: Optional[float] = None) -> Tuple[str, List[str]]:
+    """('fresh' | 'stale' | 'expired' | 'missing', analyzer keys to recompute)."""
+    if entry is None:
+        return "missing", list(pipeline.ANALYZER_KEYS)
+    now = time.time() if now is None else now
+    current = versions()
+    if now - entry["scraped_at"] > MAX_AGE or any(entry["versions"].get(s) != current[s] for s in SCRAPE_STAGES):
+        return "expired", list(pipeline.ANALYZER_KEYS)
+    stale = [
+        key for key in pipeline.ANALYZER_KEYS
+        if entry["versions"].get(key) != current[key]
+        or not entry["results"].get(key)
+        or "error" in entry["results"][key]
+    ]
+    return ("stale" if stale else "fresh"), stale
+
+
+def lookup(url: str) -> Tuple[Optional[Dict[str, Any]], List[str]]:
+    """Usable entry for `url` and the analyzers to rerun on it; (None, all keys) if it must be rebuilt."""
+    entry = load(product_id(url))
+    state, stale = check(entry)
+    metrics.inc("tag_store_lookups_total", outcome=state)
+    if entry is not None:
+        metrics.observe("tag_store_entry_age_seconds", time.time() - entry["scraped_at"])
+    if state in ("missing", "expired"):
+        return None, stale
+    return entry, stale
+
+
+def _new_build_dir(pid: str) -> Tuple[str, str]:
+    build = f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+    directory = os.path.abspath(os.path.join(TAG_DIR, pid, build))
+    os.makedirs(directory, exist_ok=True)
+    return build, directory
+
+
+def put(url: str, data_dir: str, results: Dict[str, Any]) -> Dict[str, Any]:
+    """Store a request's own scrape (`data_dir`, e.g. data/jobs/<job_id>) and analyzer results."""
+    pid = product_id(url)
+    build, directory = _new_build_dir(pid)
+    shutil.copytree(data_dir, directory, dirs_exist_ok=True)
+
+    # formatted_output.json points at the images by absolute path; point it at the copies.
+    source = os.path.abspath(data_dir)
+    with open(os.path.join(directory, "formatted_output.json"), "r", encoding="utf-8") as f:
+        structured = json.load(f)
+    for key, path in structured.get("images", {}).items():
+        if isinstance(path, str) and os.path.abspath(path).startswith(source + os.sep):
+            structured["images"][key] = os.path.join(directory, os.path.relpath(os.path.abspath(path), source))
+    with open(os.path.join(directory, "formatted_output.json"), "w", encoding="utf-8") as f:
+        json.dump(structured, f, indent=2)
+
+    entry = {
+        "product_id": pid,
+        "url": url,
+        "build": build,
+        "dir": directory,
+        "scraped_at": time.time(),
+        "versions": versions(),
+        "results": {k: v for k, v in results.items() if v},
+    }
+    save(entry)
+    return entry
+
+
+def update(entry: Dict[str, Any], results: Dict[str, Any]) -> Dict[str, Any]:
+    """Save new analyzer results into the entry, with the current versions of their analyzers."""
+    current = versions()
+    entry["results"].update({k: v for k, v in results.items() if v})
+    entry["versions"].update({k: current[k] for k in results})
+    save(entry)
+    return entry
+
+
+async def refresh(entry: Dict[str, Any], keys: List[str], budget: Optional[asyncio.Semaphore] = None) -> Dict[str, Any]:
+    """Rerun `keys` on the stored scrape and save the entry with their new versions."""
+    results = await pipeline.run_analyzers(dress_json_path(entry), keys=keys, budget=budget)
+    return update(entry, results)
+
+
+async def build(url: str, budget: asyncio.Semaphore) -> Dict[str, Any]:
+    """Full recompute of one product into a new build directory."""
+    pid = product_id(url)
+    build_name, directory = _new_build_dir(pid)
+    with tracing.span("tag_build", product=pid):
+        async with budget:
+            await pipeline.arun_scrape_and_save(url, directory)
+        async with budget:
+            await pipeline.arun_structure(directory)
+        results = await pipeline.run_analyzers(os.path.join(directory, "formatted_output.json"), budget=budget)
+    entry = {
+        "product_id": pid,
+        "url": url,
+        "build": build_name,
+        "dir": directory,
+        "scraped_at": time.time(),
+        "versions": versions(),
+        "results": {k: v for k, v in results.items() if v},
+    }
+    save(entry)
+    return entry
+
+
+async def build_catalog(urls: List[str], concurrency: int = None, force: bool = False) -> Dict[str, int]:
+    """Bring every product in `urls` up to date; returns how many were built, refreshed or skipped."""
+    budget = asyncio.Semaphore(concurrency or CONCURRENCY)
+    counts = {"built": 0, "refreshed": 0, "fresh": 0, "failed": 0}
+
+    async def one(url):
+        entry = load(product_id(url))
+        state, stale = ("missing", []) if force else check(entry)
+        try:
+            if state == "fresh":
+                counts["fresh"] += 1
+            elif state == "stale":
+                await refresh(entry, stale, budget)
+                counts["refreshed"] += 1
+                print(f"refreshed {url}: {', '.join(stale)}")
+            else:
+                await build(url, budget)
+                counts["built"] += 1
+                print(f"built {url}")
+        except Exception as e:
+            counts["failed"] += 1
+            print(f"[ERROR] {url}: {e}")
+
+    await asyncio.gather(*[one(url) for url in urls])
+    return counts
+
+
+def status() -> Dict[str, Any]:
+    """Entry counts by state, per-analyzer stale counts and the oldest scrape."""
+    states = {"fresh": 0, "stale": 0, "expired": 0}
+    stale_by_key: Dict[str, int] = {}
+    oldest = None
+    if os.path.isdir(TAG_DIR):
+        for name in os.listdir(TAG_DIR):
+            if not name.endswith(".json"):
+                continue
+            entry = load(name[:-len(".json")])
+            if entry is None:
+                continue
+            state, stale = check(entry)
+            states[state] += 1
+            if state == "stale":
+                for key in stale:
+                    stale_by_key[key] = stale_by_key.get(key, 0) + 1
+            oldest = entry["scraped_at"] if oldest is None else min(oldest, entry["scraped_at"])
+    for state, count in states.items():
+        metrics.set_gauge("tag_store_entries", count, state=state)
+    return {"entries": states, "stale_analyzers": stale_by_key,
+            "oldest_age_hours": round((time.time() - oldest) / 3600, 1) if oldest else None}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m scraper.tag_store")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_cmd = commands.add_parser("build", help="compute tags for the product URLs in a file (one per line)")
+    build_cmd.add_argument("urls_file")
+    build_cmd.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    build_cmd.add_argument("--force", action="store_true", help="rebuild fresh entries too")
+    commands.add_parser("status", help="report fresh, stale and expired entries")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        with open(args.urls_file, "r", encoding="utf-8") as f:
+            urls = list(dict.fromkeys(line.strip() for line in f if line.strip() and not line.startswith("#")))
+        counts = asyncio.run(build_catalog(urls, args.concurrency, args.force))
+        print(json.dumps(counts))
+        return 1 if counts["failed"] else 0
+    print(json.dumps(status(), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
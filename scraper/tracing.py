@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple
+
+# Per-job span tracing.
+#
+# A span is a plain dict: name, span/parent ids, wall-clock start and end,
+# pid and free-form attributes (tokens, bytes, cache hit...). The active
+# span lives in a contextvar so nesting follows the call stack, asyncio
+# tasks and threads. Worker processes are handed current() with the job,
+# record into their own buffer and send drain() back with the result, like
+# metrics. Finished jobs are exported to TRACE_DIR/<job_id>.jsonl.
+
+TRACE_DIR = os.getenv("TRACE_DIR", os.path.join("data", "traces"))
+
+# (job_id, span dict) of the innermost open span, or (job_id, None) at the job root.
+_current: contextvars.ContextVar = contextvars.ContextVar("tracing_current", default=None)
+
+_lock = threading.Lock()
+_buffers: Dict[str, List[Dict[str, Any]]] = {}
+
+
+def new_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def current() -> Optional[Tuple[str, Optional[str]]]:
+    """(job_id, span_id) to hand to another process or thread, or None when not tracing."""
+    state = _current.get()
+    if state is None:
+        return None
+    job_id, span = state
+    return job_id, span["span_id"] if span else None
+
+
+@contextmanager
+def job(job_id: str, parent_id: Optional[str] = None):
+    """Attach everything recorded inside the block to `job_id`, under `parent_id`."""
+    parent = {"span_id": parent_id} if parent_id else None
+    token = _current.set((job_id, parent))
+    try:
+        yield job_id
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def resume(parent: Optional[Tuple[str, Optional[str]]]):
+    """job() for a current() value that may be None (untraced caller)."""
+    if parent is None:
+        yield None
+        return
+    with job(*parent) as job_id:
+        yield job_id
+
+
+def record(job_id: str, name: str, start: float, end: float, parent_id: Optional[str] = None, **attributes) -> Dict[str, Any]:
+    """Add a span measured elsewhere (e.g. time spent waiting in the pool queue)."""
+    span = {
+        "span_id": new_id(),
+        "parent_id": parent_id,
+        "name": name,
+        "start": start,
+        "end": end,
+        "pid": os.getpid(),
+        "attributes": attributes,
+    }
+    with _lock:
+        _buffers.setdefault(job_id, []).append(span)
+    return span
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time the block as a child of the active span.
+
+    Yields the attribute dict; callers add to it once they know tokens,
+    bytes and the like. Outside a job this only yields a throwaway dict.
+    """
+    state = _current.get()
+    if state is None:
+        yield dict(attributes)
+        return
+
+    job_id, parent = state
+    current_span = {
+        "span_id": new_id(),
+        "parent_id": parent["span_id"] if parent else None,
+        "name": name,
+        "start": time.time(),
+        "end": None,
+        "pid": os.getpid(),
+        "attributes": dict(attributes),
+    }
+    token = _current.set((job_id, current_span))
+    try:
+        yield current_span["attributes"]
+    except BaseException as e:
+        current_span["attributes"]["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        current_span["end"] = time.time()
+        with _lock:
+            _buffers.setdefault(job_id, []).append(current_span)
+
+
+def set_attributes(**attributes) -> None:
+    """Add attributes to the innermost open span, if any."""
+    state = _current.get()
+    if state and state[1] and "attributes" in state[1]:
+        state[1]["attributes"].update(attributes)
+
+
+def drain(job_id: str) -> List[Dict[str, Any]]:
+    with _lock:
+        return _buffers.pop(job_id, [])
+
+
+def merge(job_id: str, spans: List[Dict[str, Any]]) -> None:
+    if not spans:
+        return
+    with _lock:
+        _buffers.setdefault(job_id, []).extend(spans)
+
+
+def trace_path(job_id: str) -> str:
+    return os.path.join(TRACE_DIR, f"{os.path.basename(job_id)}.jsonl")
+
+
+def export(job_id: str) -> str:
+    """Append the job's buffered spans to its trace file; safe to call again for late spans."""
+    spans = drain(job_id)
+    path = trace_path(job_id)
+    if spans:
+        os.makedirs(TRACE_DIR, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            for item in spans:
+                f.write(json.dumps(item, default=str) + "\n")
+    return path
+
+
+def load(job_id: str) -> List[Dict[str, Any]]:
+    path = trace_path(job_id)
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def prompt_cache(spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Prompt tokens of the job's model calls and the share the provider served from its prompt cache."""
+    calls = [s.get("attributes") or {} for s in spans if s["name"] == "llm"]
+    calls = [a for a in calls if "prompt_tokens" in a]
+    prompt = sum(a["prompt_tokens"] for a in calls)
+    cached = sum(a.get("cached_tokens", 0) for a in calls)
+    return {"calls": len(calls), "prompt_tokens": prompt, "cached_tokens": cached,
+            "hit_rate": round(cached / prompt, 4) if prompt else 0.0}
+
+
+def waterfall(spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Order spans depth-first under their parents and place them on a 0-100% axis."""
+    if not spans:
+        return {"rows": [], "duration": 0.0}
+
+    by_parent: Dict[Optional[str], List[Dict[str, Any]]] = {}
+    ids = {s["span_id"] for s in spans}
+    for s in spans:
+        parent = s.get("parent_id") if s.get("parent_id") in ids else None
+        by_parent.setdefault(parent, []).append(s)
+    for children in by_parent.values():
+        children.sort(key=lambda s: s["start"])
+
+    origin = min(s["start"] for s in spans)
+    finish = max(s["end"] or s["start"] for s in spans)
+    duration = max(finish - origin, 1e-6)
+
+    rows = []
+
+    def walk(parent_id, depth):
+        for s in by_parent.get(parent_id, []):
+            end = s["end"] or s["start"]
+            rows.append({
+                "name": s["name"],
+                "depth": depth,
+                "pid": s.get("pid"),
+                "offset": round(s["start"] - origin, 3),
+                "seconds": round(end - s["start"], 3),
+                "left": 100.0 * (s["start"] - origin) / duration,
+                "width": max(0.2, 100.0 * (end - s["start"]) / duration),
+                "attributes": s.get("attributes") or {},
+            })
+            walk(s["span_id"], depth + 1)
+
+    walk(None, 0)
+    return {"rows": rows, "duration": round(duration, 3)}
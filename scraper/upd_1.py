@@ -1,182 +1,210 @@
 import asyncio
+import aiohttp
 from playwright.async_api import async_playwright
 from bs4 import BeautifulSoup
 import json
 import os
-import requests
 from PIL import Image
 from io import BytesIO
 import pillow_avif
+from scraper import metrics, tracing
 
-DATA_DIR = os.path.join(os.path.dirname(__file__),'Scripts' 'data')
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'Scripts', 'data')
 IMAGES_DIR = os.path.join(DATA_DIR, 'images')
 DOWNLOADED_IMAGES_DIR = os.path.join(IMAGES_DIR, 'downloaded')
 
+# Page opened before the product page; empty skips it (offline benchmarks).
+PREFLIGHT_URL = os.getenv("SCRAPER_PREFLIGHT_URL", "https://www.google.com")
+HEADLESS = os.getenv("SCRAPER_HEADLESS", "0") == "1"
 
-def download_images(image_links, save_dir=DOWNLOADED_IMAGES_DIR):
-    print("[DEBUG] Starting download_images")
+
+DOWNLOAD_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+                  "AppleWebKit/537.36 (KHTML, like Gecko) "
+                  "Chrome/113.0.0.0 Safari/537.36",
+    "Accept": "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Referer": "https://www.net-a-porter.com/",
+    "Connection": "keep-alive"
+}
+DOWNLOAD_TIMEOUT = 30
+
+
+def save_image(content, path):
+    """Verify downloaded bytes are an image and store them as JPEG at `path`; False if they are not."""
+    img_bytes = BytesIO(content)
+    try:
+        img = Image.open(img_bytes)
+        img.verify()
+    except Exception as e:
+        print(f"[DEBUG] Image verify failed: {e}")
+        return False
+    img_bytes.seek(0)
+    img = Image.open(img_bytes)
+    if img.mode in ("RGBA", "P"):
+        img = img.convert("RGB")
+    # Replace, don't rewrite: cached pages notice the directory change (scraper/static_cache.py).
+    tmp_path = f"{path}.tmp"
+    img.save(tmp_path, format="JPEG", quality=95)
+    os.replace(tmp_path, path)
+    print(f"[DEBUG] Saved image: {path}")
+    return True
+
+
+async def download_images_async(image_links, save_dir=DOWNLOADED_IMAGES_DIR):
+    """Download `image_links` into `save_dir` on one aiohttp session, all at once; decoding runs in a thread."""
+    print("[DEBUG] Starting download_images_async")
     os.makedirs(save_dir, exist_ok=True)
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                      "AppleWebKit/537.36 (KHTML, like Gecko) "
-                      "Chrome/113.0.0.0 Safari/537.36",
-        "Accept": "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8",
-        "Accept-Language": "en-US,en;q=0.9",
-        "Referer": "https://www.net-a-porter.com/",
-        "Connection": "keep-alive"
-    }
-    for idx, url in enumerate(image_links):
+
+    async def one(session, idx, url):
         try:
             print(f"[DEBUG] Downloading image: {url}")
-            filename = f"image_{idx}.jpeg"
-            path = os.path.join(save_dir, filename)
-            response = requests.get(url, headers=headers, timeout=30)
-            response.raise_for_status()
-            img_bytes = BytesIO(response.content)
-            try:
-                img = Image.open(img_bytes)
-                img.verify()
-            except Exception as e:
-                print(f"[DEBUG] Image verify failed: {e}")
-                continue
-            img_bytes.seek(0)
-            img = Image.open(img_bytes)
-            if img.mode in ("RGBA", "P"):
-                img = img.convert("RGB")
-            img.save(path, format="JPEG", quality=95)
-            print(f"[DEBUG] Saved image: {path}")
+            path = os.path.join(save_dir, f"image_{idx}.jpeg")
+            with tracing.span("download_image", index=idx) as span:
+                async with session.get(url) as response:
+                    content = await response.read()
+                    span["status"] = response.status
+                    span["bytes"] = len(content)
+                    response.raise_for_status()
+            await asyncio.to_thread(save_image, content, path)
         except Exception as e:
             print(f"[DEBUG] Failed to download image: {e}")
-            pass
+
+    timeout = aiohttp.ClientTimeout(total=DOWNLOAD_TIMEOUT)
+    async with aiohttp.ClientSession(headers=DOWNLOAD_HEADERS, timeout=timeout) as session:
+        await asyncio.gather(*[one(session, idx, url) for idx, url in enumerate(image_links)])
 
 
-async def scrape_product_page(url):
+async def scrape_product_page(url, images_dir=IMAGES_DIR):
     print("[DEBUG] scraping started")
     print("[DEBUG] Before playwright launch")
     async with async_playwright() as p:
         print("[DEBUG] Playwright started")
-        browser = await p.firefox.launch(headless=False,  args=["--no-sandbox"])
+        browser = await p.firefox.launch(headless=HEADLESS,  args=["--no-sandbox"])
         print("[DEBUG] Browser launched")
-        context = await browser.new_context()
-        page = await context.new_page()
-        print("[DEBUG] Page created")
+        # Closed on every exit, including a cancelled job unwinding mid-page.
+        try:
+            context = await browser.new_context()
+            page = await context.new_page()
+            print("[DEBUG] Page created")
 
 
-        try:
-            print("[DEBUG] Trying to open https://www.google.com")
-            await page.goto("https://www.google.com", timeout=10000)
-            print("[DEBUG] Successfully opened https://www.google.com")
-        except Exception as e:
-            print(f"[DEBUG] Failed to open Google: {e}")
+            if PREFLIGHT_URL:
+                try:
+                    print(f"[DEBUG] Trying to open {PREFLIGHT_URL}")
+                    await page.goto(PREFLIGHT_URL, timeout=10000)
+                    print(f"[DEBUG] Successfully opened {PREFLIGHT_URL}")
+                except Exception as e:
+                    print(f"[DEBUG] Failed to open {PREFLIGHT_URL}: {e}")
 
-        # ✅ Now try the real target URL
-        try:
-            print(f"[DEBUG] Trying to open real target URL: {url}")
-            await page.goto(url, timeout=20000)
-            print(f"[DEBUG] Successfully opened target URL: {url}")
-        except Exception as e:
-            print(f"[DEBUG] Failed to open target URL: {e}")
-            await browser.close()
-            return {}
-
-        await page.wait_for_timeout(3000)
-
-        # --- Scraping logic ---
-        print("[DEBUG] Extracting HTML content")
-        full_html = await page.content()
-        soup = BeautifulSoup(full_html, 'html.parser')
-        result = {}
-
-        editors_notes = soup.select_one('#EDITORS_NOTES .EditorialAccordion88__accordionContent--editors_notes')
-        result["editors_notes"] = editors_notes.get_text(strip=True, separator="\n") if editors_notes else "Not found"
-        print(f"[DEBUG] Editors Notes: {result['editors_notes'][:50]}...")
-
-        size_fit_section = soup.select_one('#SIZE_AND_FIT .EditorialAccordion88__accordionContent--size_and_fit')
-        size_fit_details = []
-        model_measurements = []
-        if size_fit_section:
-            all_lis = size_fit_section.find_all('li')
-            for li in all_lis:
-                text = li.get_text(strip=True)
-                if "model is" in text.lower():
-                    model_measurements.append(text)
-                else:
-                    size_fit_details.append(text)
-        result["size_fit"] = size_fit_details
-        result["model_measurements"] = model_measurements
-        print(f"[DEBUG] Size & Fit details: {size_fit_details}")
-        print(f"[DEBUG] Model measurements: {model_measurements}")
+            # ✅ Now try the real target URL
+            try:
+                print(f"[DEBUG] Trying to open real target URL: {url}")
+                with tracing.span("page_load"):
+                    await page.goto(url, timeout=20000)
+                print(f"[DEBUG] Successfully opened target URL: {url}")
+            except Exception as e:
+                print(f"[DEBUG] Failed to open target URL: {e}")
+                return {}
+
+            await page.wait_for_timeout(3000)
+
+            # --- Scraping logic ---
+            print("[DEBUG] Extracting HTML content")
+            full_html = await page.content()
+            soup = BeautifulSoup(full_html, 'html.parser')
+            result = {}
+
+            editors_notes = soup.select_one('#EDITORS_NOTES .EditorialAccordion88__accordionContent--editors_notes')
+            result["editors_notes"] = editors_notes.get_text(strip=True, separator="\n") if editors_notes else "Not found"
+            print(f"[DEBUG] Editors Notes: {result['editors_notes'][:50]}...")
+
+            size_fit_section = soup.select_one('#SIZE_AND_FIT .EditorialAccordion88__accordionContent--size_and_fit')
+            size_fit_details = []
+            model_measurements = []
+            if size_fit_section:
+                all_lis = size_fit_section.find_all('li')
+                for li in all_lis:
+                    text = li.get_text(strip=True)
+                    if "model is" in text.lower():
+                        model_measurements.append(text)
+                    else:
+                        size_fit_details.append(text)
+            result["size_fit"] = size_fit_details
+            result["model_measurements"] = model_measurements
+            print(f"[DEBUG] Size & Fit details: {size_fit_details}")
+            print(f"[DEBUG] Model measurements: {model_measurements}")
+
+            details_care_section = soup.select_one('#DETAILS_AND_CARE .EditorialAccordion88__accordionContent--details_and_care')
+            result["details_care"] = [li.get_text(strip=True) for li in details_care_section.find_all('li')] if details_care_section else []
+            print(f"[DEBUG] Details & Care: {result['details_care']}")
 
-        details_care_section = soup.select_one('#DETAILS_AND_CARE .EditorialAccordion88__accordionContent--details_and_care')
-        result["details_care"] = [li.get_text(strip=True) for li in details_care_section.find_all('li')] if details_care_section else []
-        print(f"[DEBUG] Details & Care: {result['details_care']}")
+            try:
+                overlay_html = await page.inner_html(".Overlay9.SizeChart88__sizeGuide")
+                overlay_soup = BeautifulSoup(overlay_html, "html.parser")
+                structured_popup = {}
+                table = overlay_soup.select_one(".SizeTable88__table")
+                if table:
+                    headers = [th.get_text(strip=True).lower() for th in table.select("thead th")[1:]]
+                    rows = table.select("tbody tr")
+                    for row in rows:
+                        cells = row.select("td")
+                        if not cells or len(cells) < 2:
+                            continue
+                        label = cells[0].get_text(strip=True).capitalize()
+                        values = [td.get_text(strip=True) for td in cells[1:]]
+                        if len(values) == len(headers):
+                            structured_popup[label] = dict(zip(headers, values))
+                    result["size_guide_popup"] = structured_popup
+                else:
+                    result["size_guide_popup"] = "Table not found"
+                print(f"[DEBUG] Size guide popup: {result['size_guide_popup']}")
+            except Exception as e:
+                print(f"[DEBUG] Size guide popup error: {e}")
+                result["size_guide_popup"] = "Popup not loaded"
+
+            # Images
+            image_urls = []
+            carousel_track = soup.select_one('ul.ImageCarousel88__track')
+            noscripts = carousel_track.select('noscript img') if carousel_track else []
+            for img in noscripts:
+                srcset = img.get('srcset')
+                if srcset:
+                    urls = [u.strip().split()[0] for u in srcset.split(',')]
+                    preferred = next((url for url in urls if '/w920_q60' in url or '/w2000_q60' in url), None)
+                    if preferred:
+                        if preferred.startswith('//'):
+                            preferred = 'https:' + preferred
+                        image_urls.append(preferred)
+            image_urls = list(dict.fromkeys(image_urls))
+            print(f"[DEBUG] Found {len(image_urls)} image URLs")
+
+            os.makedirs(images_dir, exist_ok=True)
+            file_path = os.path.join(images_dir, "image_urls.txt")
+            with open(file_path, "w", encoding="utf-8") as f:
+                f.write("image urls:\n")
+                for url in image_urls:
+                    f.write(url + "\n")
+
+            with metrics.timed("stage_seconds", stage="download"), tracing.span("download", images=len(image_urls)):
+                await download_images_async(image_urls, os.path.join(images_dir, 'downloaded'))
+
+            return result
+        finally:
+            await browser.close()
+            print("[DEBUG] Browser closed")
 
-        try:
-            overlay_html = await page.inner_html(".Overlay9.SizeChart88__sizeGuide")
-            overlay_soup = BeautifulSoup(overlay_html, "html.parser")
-            structured_popup = {}
-            table = overlay_soup.select_one(".SizeTable88__table")
-            if table:
-                headers = [th.get_text(strip=True).lower() for th in table.select("thead th")[1:]]
-                rows = table.select("tbody tr")
-                for row in rows:
-                    cells = row.select("td")
-                    if not cells or len(cells) < 2:
-                        continue
-                    label = cells[0].get_text(strip=True).capitalize()
-                    values = [td.get_text(strip=True) for td in cells[1:]]
-                    if len(values) == len(headers):
-                        structured_popup[label] = dict(zip(headers, values))
-                result["size_guide_popup"] = structured_popup
-            else:
-                result["size_guide_popup"] = "Table not found"
-            print(f"[DEBUG] Size guide popup: {result['size_guide_popup']}")
-        except Exception as e:
-            print(f"[DEBUG] Size guide popup error: {e}")
-            result["size_guide_popup"] = "Popup not loaded"
-
-        # Images
-        image_urls = []
-        carousel_track = soup.select_one('ul.ImageCarousel88__track')
-        noscripts = carousel_track.select('noscript img') if carousel_track else []
-        for img in noscripts:
-            srcset = img.get('srcset')
-            if srcset:
-                urls = [u.strip().split()[0] for u in srcset.split(',')]
-                preferred = next((url for url in urls if '/w920_q60' in url or '/w2000_q60' in url), None)
-                if preferred:
-                    if preferred.startswith('//'):
-                        preferred = 'https:' + preferred
-                    image_urls.append(preferred)
-        image_urls = list(dict.fromkeys(image_urls))
-        print(f"[DEBUG] Found {len(image_urls)} image URLs")
-
-        os.makedirs(IMAGES_DIR, exist_ok=True)
-        file_path = os.path.join(IMAGES_DIR, "image_urls.txt")
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write("image urls:\n")
-            for url in image_urls:
-                f.write(url + "\n")
-
-        download_images(image_urls)
-
-        await browser.close()
-        print("[DEBUG] Browser closed")
-        return result
-
-
-def run_scrape_and_save(url):
+async def scrape_and_save(url, data_dir=None):
+    """Scrape `url` into `data_dir` (default: the shared Scripts/data directory)."""
+    data_dir = data_dir or DATA_DIR
+    images_dir = os.path.join(data_dir, 'images')
     try:
-        os.makedirs(DATA_DIR, exist_ok=True)
-        os.makedirs(IMAGES_DIR, exist_ok=True)
-        os.makedirs(DOWNLOADED_IMAGES_DIR, exist_ok=True)
-        print(f"[DEBUG] DATA_DIR: {DATA_DIR}")
-        print(f"[DEBUG] IMAGES_DIR: {IMAGES_DIR}")
-        print(f"[DEBUG] DOWNLOADED_IMAGES_DIR: {DOWNLOADED_IMAGES_DIR}")
+        os.makedirs(os.path.join(images_dir, 'downloaded'), exist_ok=True)
+        print(f"[DEBUG] DATA_DIR: {data_dir}")
 
-        data = asyncio.run(scrape_product_page(url))
+        data = await scrape_product_page(url, images_dir)
 
-        details_path = os.path.join(DATA_DIR, "dress_details.txt")
+        details_path = os.path.join(data_dir, "dress_details.txt")
         print(f"[DEBUG] Writing details to: {details_path}")
         with open(details_path, "w", encoding="utf-8") as f:
             f.write("EDITOR'S NOTES:\n" + data.get("editors_notes", "") + "\n\n")
@@ -190,16 +218,16 @@ def run_scrape_and_save(url):
             for item in data.get("details_care", []):
                 f.write("- " + item + "\n")
 
-        size_guide_path = os.path.join(DATA_DIR, "Size_guide.json")
+        size_guide_path = os.path.join(data_dir, "Size_guide.json")
         print(f"[DEBUG] Writing size guide to: {size_guide_path}")
         with open(size_guide_path, "w", encoding="utf-8") as f:
             json.dump(data.get("size_guide_popup", {}), f, ensure_ascii=False, indent=2)
 
-        print("[DEBUG] run_scrape_and_save completed successfully")
+        print("[DEBUG] scrape_and_save completed successfully")
     except Exception as e:
         print(f"[DEBUG] Error during scraping: {e}")
 
 
 if __name__ == "__main__":
     dress_url = "https://www.net-a-porter.com/en-us/shop/product/max-mara/clothing/mini-dresses/bartolo-twill-mini-dress/1647597354715458"
-    run_scrape_and_save(dress_url)
+    asyncio.run(scrape_and_save(dress_url))
@@ -1,19 +1,22 @@
 import os
 import json
 import base64
-from openai import OpenAI
+import asyncio
+from langchain_openai import ChatOpenAI
+from scraper import llm_client, tracing, silhouette
 
-def run_structure():
-    print("structing started")
+MODEL = "gpt-4o"
+
+
+def build_messages(data_dir=None):
+    """Chat messages asking to label the scraped images in `data_dir`, the image id -> path map and the output path."""
     BASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Scripts")
-    DATA_DIR = os.path.join(BASE_DIR, 'data')
+    DATA_DIR = data_dir or os.path.join(BASE_DIR, 'data')
     IMAGES_DIR = os.path.join(DATA_DIR, 'images', 'downloaded')
     DETAILS_PATH = os.path.join(DATA_DIR, 'dress_details.txt')
     SIZE_GUIDE_PATH = os.path.join(DATA_DIR, 'Size_guide.json')
     OUTPUT_PATH = os.path.join(DATA_DIR, 'formatted_output.json')
 
-    client = OpenAI(api_key = os.getenv("OPENAI_API_KEY"))
-
     def load_text(filepath):
         with open(filepath, "r", encoding="utf-8") as f:
             return f.read()
@@ -23,8 +26,11 @@ def run_structure():
             return json.load(f)
 
     def encode_image(filepath):
-        with open(filepath, "rb") as f:
-            return base64.b64encode(f.read()).decode('utf-8')
+        with tracing.span("encode_image", image=os.path.basename(filepath)) as span:
+            with open(filepath, "rb") as f:
+                encoded = base64.b64encode(f.read()).decode('utf-8')
+            span["bytes"] = len(encoded)
+        return encoded
 
     image_files = sorted([
         f for f in os.listdir(IMAGES_DIR)
@@ -94,13 +100,12 @@ Return only the JSON. Do not invent IDs. Do not add markdown.
         *base64_images
     ]
 
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=messages,
-        temperature=0
-    )
+    return messages, image_id_map, OUTPUT_PATH
+
 
-    content = response.choices[0].message.content.strip()
+def save_structured(content, image_id_map, output_path):
+    """Parse the model's JSON answer, resolve image ids to paths and write formatted_output.json."""
+    content = content.strip()
 
     if content.startswith("```json"):
         content = content.replace("```json", "", 1).strip()
@@ -117,10 +122,28 @@ Return only the JSON. Do not invent IDs. Do not add markdown.
             else:
                 print(f" Warning: ID {image_id} not found!")
 
-    with open(OUTPUT_PATH, "w", encoding="utf-8") as f:
+    # Segmented once here for the flare, waist, hemline and one-shoulder analyzers.
+    dress_image = (structured.get("images") or {}).get("fabric_dress_image")
+    if dress_image:
+        with tracing.span("silhouette"):
+            structured["silhouette"] = silhouette.analyze(dress_image)
+
+    with open(output_path, "w", encoding="utf-8") as f:
         json.dump(structured, f, indent=2)
 
-    print(f"\nJSON saved to {OUTPUT_PATH}")
+    print(f"\nJSON saved to {output_path}")
+
+
+def _llm():
+    return ChatOpenAI(model=MODEL, openai_api_key=os.getenv("OPENAI_API_KEY"), temperature=0)
+
+
+async def run_structure_async(data_dir=None):
+    """Label the scraped images in `data_dir` (default: Scripts/data) and write formatted_output.json there."""
+    print("structing started")
+    messages, image_id_map, output_path = await asyncio.to_thread(build_messages, data_dir)
+    response = await llm_client.ainvoke(_llm(), messages, "structure")
+    await asyncio.to_thread(save_structured, response.content, image_id_map, output_path)
 
 if __name__ == "__main__":
-    run_structure()
+    asyncio.run(run_structure_async())
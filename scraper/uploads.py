@@ -0,0 +1,344 @@
+import os
+import io
+import re
+import time
+import uuid
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from typing import Dict, Any, IO, Optional
+
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from scraper import metrics, tracing
+
+# Client photos are normalised once, at upload time: EXIF orientation applied,
+# longest side capped at MAX_DIMENSION, metadata dropped, stored as a single
+# JPEG. Everything downstream (silhouette work, the fit prompt) reads that file.
+#
+# Stored photos are content addressed: <upload folder>/<sha[:2]>/<sha>.jpg,
+# keyed by the hash of the bytes as uploaded, so a re-upload of the same
+# photo reuses the stored file without decoding it again. A small SQLite
+# index (UPLOAD_DB) holds one row per stored file and one reference per
+# (photo, job) using it. Jobs release their references when they finish;
+# references left by abandoned jobs expire after REF_TTL. A background
+# collector deletes files that have had no references for RETENTION, and
+# reports stored bytes and file count from the index, never by listing
+# the upload folder.
+
+MAX_UPLOAD_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+MAX_DIMENSION = int(os.getenv("UPLOAD_MAX_DIMENSION", "1536"))
+JPEG_QUALITY = int(os.getenv("UPLOAD_JPEG_QUALITY", "85"))
+CHUNK_SIZE = 64 * 1024
+
+# Keep files this small in memory; larger ones spill to a temp file while streaming.
+SPOOL_BYTES = 2 * 1024 * 1024
+
+UPLOAD_DB = os.getenv("UPLOAD_DB", os.path.join("data", "uploads.db"))
+RETENTION = float(os.getenv("UPLOAD_RETENTION_HOURS", "24")) * 3600
+REF_TTL = float(os.getenv("UPLOAD_REF_TTL_HOURS", "24")) * 3600
+GC_INTERVAL = float(os.getenv("UPLOAD_GC_INTERVAL", "600"))
+
+# Files from before content addressing (front_<uuid>.jpeg, side_<uuid>.jpg).
+LEGACY_NAME = re.compile(r"^(front|side)_[0-9a-f]{32}\.jpe?g$")
+
+
+class UploadError(ValueError):
+    """The upload is too large or not a readable image."""
+
+
+class _LimitedSpool(tempfile.SpooledTemporaryFile):
+    """A spooled file that refuses writes past `limit` bytes."""
+
+    def __init__(self, limit: int):
+        super().__init__(max_size=SPOOL_BYTES)
+        self.limit = limit
+        self.written = 0
+
+    def write(self, data) -> int:
+        self.written += len(data)
+        if self.written > self.limit:
+            raise RequestEntityTooLarge(f"Image is larger than {self.limit // (1024 * 1024)} MB")
+        return super().write(data)
+
+
+def file_stream(limit: int = None) -> IO[bytes]:
+    """Where the form parser writes an uploaded file; a photo over `limit` stops the parse as it arrives."""
+    return _LimitedSpool(MAX_UPLOAD_BYTES if limit is None else limit)
+
+
+def copy_limited(source: IO[bytes], limit: int = None, digest=None) -> IO[bytes]:
+    """Copy `source` in chunks, failing as soon as more than `limit` bytes arrive; feeds `digest` if given."""
+    limit = MAX_UPLOAD_BYTES if limit is None else limit
+    buffer = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+    total = 0
+    while True:
+        chunk = source.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > limit:
+            buffer.close()
+            raise UploadError(f"Image is larger than {limit // (1024 * 1024)} MB")
+        if digest is not None:
+            digest.update(chunk)
+        buffer.write(chunk)
+    if total == 0:
+        buffer.close()
+        raise UploadError("Uploaded image is empty")
+    buffer.seek(0)
+    return buffer
+
+
+def normalize(source: IO[bytes], dest_path: str, max_dimension: int = None) -> Dict[str, Any]:
+    """Decode, orient, downsize and re-encode `source` as a metadata-free JPEG at `dest_path`."""
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    max_dimension = MAX_DIMENSION if max_dimension is None else max_dimension
+    try:
+        image = Image.open(source)
+        original_size = image.size
+        # Let the JPEG decoder skip detail we are about to throw away.
+        image.draft("RGB", (max_dimension, max_dimension))
+        image = ImageOps.exif_transpose(image)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise UploadError(f"Could not read the uploaded image: {e}")
+
+    # Write next to the destination and rename, so readers never see half a file.
+    tmp_path = f"{dest_path}.{uuid.uuid4().hex}.tmp"
+    image.save(tmp_path, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    os.replace(tmp_path, dest_path)
+    return {"original_size": original_size, "stored_size": image.size}
+
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+
+def _connect() -> sqlite3.Connection:
+    global _schema_ready
+    directory = os.path.dirname(UPLOAD_DB)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # Autocommit; writers take the lock explicitly with BEGIN IMMEDIATE.
+    conn = sqlite3.connect(UPLOAD_DB, timeout=30, isolation_level=None)
+    if not _schema_ready:
+        with _schema_lock:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS blobs (
+                    hash TEXT PRIMARY KEY, path TEXT NOT NULL, bytes INTEGER NOT NULL DEFAULT 0,
+                    width INTEGER, height INTEGER, original_width INTEGER, original_height INTEGER,
+                    created REAL NOT NULL, last_used REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS refs (
+                    hash TEXT NOT NULL, owner TEXT NOT NULL, created REAL NOT NULL,
+                    PRIMARY KEY (hash, owner)
+                );
+                CREATE INDEX IF NOT EXISTS refs_owner ON refs (owner);
+                CREATE INDEX IF NOT EXISTS refs_created ON refs (created);
+                CREATE INDEX IF NOT EXISTS blobs_last_used ON blobs (last_used);
+            """)
+            _schema_ready = True
+    return conn
+
+
+def blob_path(upload_folder: str, digest: str) -> str:
+    return os.path.join(upload_folder, digest[:2], f"{digest}.jpg")
+
+
+def acquire(digest: str, path: str, owner: str) -> Optional[Dict[str, Any]]:
+    """Reference `digest` for `owner`; returns the stored file's row if it is already on disk."""
+    now = time.time()
+    conn = _connect()
+    try:
+        # Same lock as collect_garbage(): a file is never deleted between this check and the caller using it.
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("INSERT INTO blobs (hash, path, created, last_used) VALUES (?, ?, ?, ?) "
+                     "ON CONFLICT(hash) DO UPDATE SET last_used = excluded.last_used", (digest, path, now, now))
+        conn.execute("INSERT OR REPLACE INTO refs (hash, owner, created) VALUES (?, ?, ?)", (digest, owner, now))
+        row = conn.execute("SELECT path, bytes, width, height, original_width, original_height FROM blobs WHERE hash = ?",
+                           (digest,)).fetchone()
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    if row and row[1] and os.path.isfile(row[0]):
+        return {"path": row[0], "stored_bytes": row[1], "stored_size": (row[2], row[3]), "original_size": (row[4], row[5])}
+    return None
+
+
+def record_blob(digest: str, path: str, stored_bytes: int, sizes: Dict[str, Any]) -> None:
+    conn = _connect()
+    try:
+        conn.execute("UPDATE blobs SET path = ?, bytes = ?, width = ?, height = ?, original_width = ?, original_height = ? "
+                     "WHERE hash = ?", (path, stored_bytes, *sizes["stored_size"], *sizes["original_size"], digest))
+    finally:
+        conn.close()
+
+
+def release(owner: str) -> int:
+    """Drop every reference held by `owner` (a job id); returns how many there were."""
+    now = time.time()
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("UPDATE blobs SET last_used = ? WHERE hash IN (SELECT hash FROM refs WHERE owner = ?)", (now, owner))
+        released = conn.execute("DELETE FROM refs WHERE owner = ?", (owner,)).rowcount
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    return released
+
+
+def _forget_unstored(digest: str) -> None:
+    """Remove the placeholder row of a photo that failed to normalise, unless someone else holds it."""
+    conn = _connect()
+    try:
+        conn.execute("DELETE FROM blobs WHERE hash = ? AND bytes = 0 "
+                     "AND NOT EXISTS (SELECT 1 FROM refs WHERE refs.hash = blobs.hash)", (digest,))
+    finally:
+        conn.close()
+
+
+def usage() -> Dict[str, int]:
+    """Stored file count and bytes, from the index; also published as gauges."""
+    conn = _connect()
+    try:
+        files, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM blobs WHERE bytes > 0").fetchone()
+        referenced = conn.execute("SELECT COUNT(DISTINCT hash) FROM refs").fetchone()[0]
+    finally:
+        conn.close()
+    metrics.set_gauge("upload_store_files", files)
+    metrics.set_gauge("upload_store_bytes", total)
+    metrics.set_gauge("upload_store_referenced_files", referenced)
+    return {"files": files, "bytes": total, "referenced": referenced}
+
+
+def collect_garbage(upload_folder: Optional[str] = None, now: Optional[float] = None, batch: int = 500) -> Dict[str, int]:
+    """Expire abandoned references and delete unreferenced files older than RETENTION."""
+    now = time.time() if now is None else now
+    deleted = freed = 0
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        expired = conn.execute("DELETE FROM refs WHERE created < ?", (now - REF_TTL,)).rowcount
+        rows = conn.execute(
+            "SELECT hash, path, bytes FROM blobs WHERE last_used < ? "
+            "AND NOT EXISTS (SELECT 1 FROM refs WHERE refs.hash = blobs.hash) LIMIT ?",
+            (now - RETENTION, batch)).fetchall()
+        for digest, path, size in rows:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"[DEBUG] Could not delete upload {path}: {e}")
+                continue
+            conn.execute("DELETE FROM blobs WHERE hash = ?", (digest,))
+            deleted += 1
+            freed += size
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+    legacy = 0
+    if upload_folder and os.path.isdir(upload_folder):
+        # One pass over the top level only; it empties out as old files age past the retention.
+        with os.scandir(upload_folder) as entries:
+            for entry in entries:
+                if entry.is_file() and LEGACY_NAME.match(entry.name) and entry.stat().st_mtime < now - RETENTION:
+                    freed += entry.stat().st_size
+                    os.remove(entry.path)
+                    legacy += 1
+
+    metrics.inc("upload_gc_deleted_total", deleted, kind="stored")
+    metrics.inc("upload_gc_deleted_total", legacy, kind="legacy")
+    metrics.inc("upload_gc_freed_bytes_total", freed)
+    usage()
+    return {"deleted": deleted, "legacy_deleted": legacy, "freed_bytes": freed, "expired_refs": expired}
+
+
+def start_gc(upload_folder: str, interval: Optional[float] = None) -> threading.Thread:
+    """Run collect_garbage() every `interval` seconds in a daemon thread."""
+    interval = GC_INTERVAL if interval is None else interval
+
+    def loop():
+        while True:
+            try:
+                result = collect_garbage(upload_folder)
+                if result["deleted"] or result["legacy_deleted"]:
+                    print(f"[DEBUG] Upload GC: {result}")
+            except Exception as e:
+                print(f"[ERROR] Upload GC failed: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=loop, name="upload-gc", daemon=True)
+    thread.start()
+    return thread
+
+
+def save_upload(file_storage, upload_folder: str, prefix: str, owner: Optional[str] = None) -> Dict[str, Any]:
+    """Store a werkzeug FileStorage by content hash and reference it for `owner`; returns path and sizes.
+
+    A photo that is already stored is reused as is; otherwise it is streamed
+    through copy_limited() and normalize().
+    """
+    owner = owner or uuid.uuid4().hex
+    with tracing.span("normalize_upload", kind=prefix) as span:
+        digest = hashlib.sha256()
+        with copy_limited(file_storage.stream, digest=digest) as buffer:
+            buffer.seek(0, io.SEEK_END)
+            original_bytes = buffer.tell()
+            buffer.seek(0)
+            digest = digest.hexdigest()
+            dest_path = blob_path(upload_folder, digest)
+            stored = acquire(digest, dest_path, owner)
+            if stored is None:
+                os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+                try:
+                    sizes = normalize(buffer, dest_path)
+                except UploadError:
+                    release(owner)
+                    _forget_unstored(digest)
+                    raise
+                stored_bytes = os.path.getsize(dest_path)
+                record_blob(digest, dest_path, stored_bytes, sizes)
+            else:
+                sizes = {"original_size": stored["original_size"], "stored_size": stored["stored_size"]}
+                stored_bytes = stored["stored_bytes"]
+        span.update(original_bytes=original_bytes, bytes=stored_bytes, reused=stored is not None,
+                    original_size=list(sizes["original_size"]), stored_size=list(sizes["stored_size"]))
+
+    metrics.inc("upload_bytes_total", original_bytes, stage="received")
+    if stored is None:
+        metrics.inc("upload_bytes_total", stored_bytes, stage="stored")
+    else:
+        metrics.inc("upload_dedup_total")
+    return {"path": dest_path, "hash": digest, "reused": stored is not None,
+            "original_bytes": original_bytes, "stored_bytes": stored_bytes, **sizes}
+
+
+def import_blob(content: bytes, digest: str, upload_folder: str, owner: str) -> Dict[str, Any]:
+    """Store a photo another process already normalised (a queued job's payload) under its upload hash.
+
+    The bytes are written as they are; `digest` stays the hash of the photo
+    as the client uploaded it, so both sides agree on the stored file.
+    """
+    dest_path = blob_path(upload_folder, digest)
+    stored = acquire(digest, dest_path, owner)
+    if stored is None:
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        tmp_path = f"{dest_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, dest_path)
+        from PIL import Image
+        with Image.open(dest_path) as image:
+            size = image.size
+        record_blob(digest, dest_path, len(content), {"original_size": size, "stored_size": size})
+        return {"path": dest_path, "hash": digest, "reused": False, "stored_bytes": len(content)}
+    return {"path": stored["path"], "hash": digest, "reused": True, "stored_bytes": stored["stored_bytes"]}
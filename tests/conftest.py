@@ -0,0 +1,18 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Importing app starts background work and opens its stores; keep all of it out of the tree.
+_work = tempfile.mkdtemp(prefix="fitapp-tests-")
+for name, value in {
+    "PIPELINE_WARMUP": "0",
+    "UPLOAD_GC": "0",
+    "TAG_STORE_DIR": os.path.join(_work, "tags"),
+    "RESULTS_DB": os.path.join(_work, "results.db"),
+    "UPLOAD_DB": os.path.join(_work, "uploads.db"),
+    "TRACE_DIR": os.path.join(_work, "traces"),
+}.items():
+    os.environ.setdefault(name, value)
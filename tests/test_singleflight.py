@@ -0,0 +1,235 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+from scraper import singleflight
+
+
+def test_call_follower_shares_the_leaders_result():
+    group = singleflight.Group("test")
+    started, release = threading.Event(), threading.Event()
+    runs = []
+
+    def work():
+        runs.append(1)
+        started.set()
+        release.wait(5)
+        return "answer"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(group.call("k", work)))
+    leader.start()
+    assert started.wait(5)
+    follower = threading.Thread(target=lambda: results.append(group.call("k", work)))
+    follower.start()
+    time.sleep(0.05)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert results == ["answer", "answer"]
+    assert len(runs) == 1
+
+
+def test_call_follower_gets_the_leaders_exception():
+    group = singleflight.Group("test")
+    started, release = threading.Event(), threading.Event()
+
+    def work():
+        started.set()
+        release.wait(5)
+        raise ValueError("boom")
+
+    errors = []
+
+    def caller():
+        try:
+            group.call("k", work)
+        except ValueError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=caller)]
+    threads[0].start()
+    assert started.wait(5)
+    threads.append(threading.Thread(target=caller))
+    threads[1].start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert errors == ["boom", "boom"]
+
+
+def test_call_after_landing_starts_a_new_flight():
+    group = singleflight.Group("test")
+    runs = []
+    assert group.call("k", lambda: runs.append(1) or len(runs)) == 1
+    assert group.call("k", lambda: runs.append(1) or len(runs)) == 2
+
+
+class Work:
+    """A coroutine function that records whether it finished or was cancelled."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.runs = 0
+        self.outcome = None
+
+    async def __call__(self):
+        self.runs += 1
+        try:
+            await asyncio.sleep(self.seconds)
+        except asyncio.CancelledError:
+            self.outcome = "cancelled"
+            raise
+        self.outcome = "done"
+        return "answer"
+
+
+def test_run_follower_shares_the_leaders_result():
+    async def main():
+        group, work = singleflight.Group("test"), Work(0.1)
+        return await asyncio.gather(group.run("k", work), group.run("k", work)), work
+
+    results, work = asyncio.run(main())
+    assert results == ["answer", "answer"]
+    assert work.runs == 1
+
+
+def test_run_leader_cancelled_work_continues_for_the_follower():
+    async def main():
+        group, work = singleflight.Group("test"), Work(0.2)
+        leader = asyncio.ensure_future(group.run("k", work))
+        await asyncio.sleep(0.02)
+        follower = asyncio.ensure_future(group.run("k", work))
+        await asyncio.sleep(0.02)
+        leader.cancel()
+        return await follower, leader, work
+
+    result, leader, work = asyncio.run(main())
+    assert result == "answer"
+    assert leader.cancelled()
+    assert work.outcome == "done"
+
+
+def test_run_work_is_cancelled_with_the_last_caller():
+    async def main():
+        group, work = singleflight.Group("test"), Work(5)
+        callers = [asyncio.ensure_future(group.run("k", work)) for _ in range(2)]
+        await asyncio.sleep(0.02)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0.05)
+        return work
+
+    assert asyncio.run(main()).outcome == "cancelled"
+
+
+def test_run_rejoining_within_the_grace_period_keeps_the_work():
+    async def main():
+        group, work = singleflight.Group("test", grace=0.2), Work(0.3)
+        first = asyncio.ensure_future(group.run("k", work))
+        await asyncio.sleep(0.02)
+        first.cancel()
+        await asyncio.sleep(0.05)
+        # A reloaded page: the same key again before the grace period ends.
+        return await group.run("k", work), work
+
+    result, work = asyncio.run(main())
+    assert result == "answer"
+    assert work.runs == 1
+    assert work.outcome == "done"
+
+
+def test_run_work_is_cancelled_once_the_grace_period_ends():
+    async def main():
+        group, work = singleflight.Group("test", grace=0.1), Work(5)
+        caller = asyncio.ensure_future(group.run("k", work))
+        await asyncio.sleep(0.02)
+        caller.cancel()
+        await asyncio.sleep(0.05)
+        during = work.outcome
+        await asyncio.sleep(0.15)
+        return during, work.outcome
+
+    assert asyncio.run(main()) == (None, "cancelled")
+
+
+class Chunks:
+    """A generator function that yields on demand and records whether it was closed early."""
+
+    def __init__(self, count, delay):
+        self.count = count
+        self.delay = delay
+        self.runs = 0
+        self.closed = threading.Event()
+        self.finished = threading.Event()
+
+    def __call__(self):
+        self.runs += 1
+        try:
+            for i in range(self.count):
+                time.sleep(self.delay)
+                yield i
+        except GeneratorExit:
+            self.closed.set()
+            raise
+        self.finished.set()
+
+
+def test_stream_late_follower_gets_every_chunk():
+    group, chunks = singleflight.Group("test"), Chunks(5, 0.02)
+    leader = group.stream("k", chunks)
+    assert next(leader) == 0
+    assert next(leader) == 1
+    follower = group.stream("k", chunks)
+
+    assert list(follower) == [0, 1, 2, 3, 4]
+    assert list(leader) == [2, 3, 4]
+    assert chunks.runs == 1
+
+
+def test_stream_follower_survives_the_leader_leaving():
+    group, chunks = singleflight.Group("test"), Chunks(5, 0.02)
+    leader = group.stream("k", chunks)
+    next(leader)
+    follower = group.stream("k", chunks)
+    next(follower)
+    leader.close()
+
+    assert list(follower) == [1, 2, 3, 4]
+    assert chunks.finished.is_set()
+    assert not chunks.closed.is_set()
+
+
+def test_stream_is_closed_once_every_follower_has_left():
+    group, chunks = singleflight.Group("test"), Chunks(100, 0.02)
+    readers = [group.stream("k", chunks) for _ in range(2)]
+    for reader in readers:
+        next(reader)
+    for reader in readers:
+        reader.close()
+
+    assert chunks.closed.wait(2)
+    assert not chunks.finished.is_set()
+
+
+def test_stream_exception_reaches_every_follower():
+    group = singleflight.Group("test")
+
+    def failing():
+        yield "first"
+        time.sleep(0.05)
+        raise ValueError("boom")
+
+    leader = group.stream("k", failing)
+    assert next(leader) == "first"
+    follower = group.stream("k", failing)
+    with pytest.raises(ValueError):
+        list(follower)
+    with pytest.raises(ValueError):
+        list(leader)
@@ -0,0 +1,107 @@
+import os
+import re
+import json
+
+import pytest
+from PIL import Image
+
+from scraper import static_cache
+
+
+def write_image(path, color, size):
+    Image.new("RGB", size, color).save(path, format="JPEG")
+
+
+def test_file_version_changes_when_a_file_is_rewritten_in_place(tmp_path):
+    path = tmp_path / "image_0.jpeg"
+    path.write_bytes(b"old")
+    before = static_cache.file_version(str(path))
+    directory_before = static_cache.file_version(str(tmp_path))
+
+    with open(path, "wb") as f:
+        f.write(b"new content")
+
+    assert static_cache.file_version(str(path)) != before
+    # The reason pages are versioned on their files: the directory itself does not notice.
+    assert static_cache.file_version(str(tmp_path)) == directory_before
+
+
+def test_file_version_covers_missing_files(tmp_path):
+    path = tmp_path / "missing.json"
+    assert static_cache.file_version(str(path)) == ((str(path), None, None),)
+    path.write_text("{}")
+    assert static_cache.file_version(str(path))[0][1] is not None
+
+
+def test_versioned_cache_rebuilds_only_when_the_version_changes():
+    cache, builds = static_cache.VersionedCache(), []
+
+    def build():
+        builds.append(1)
+        return len(builds)
+
+    assert cache.get("k", ("v1",), build) == 1
+    assert cache.get("k", ("v1",), build) == 1
+    assert cache.get("k", ("v2",), build) == 2
+    assert (cache.hits, cache.builds) == (1, 2)
+
+
+def test_fingerprint_follows_the_content(tmp_path):
+    path = tmp_path / "a.jpeg"
+    path.write_bytes(b"one")
+    first = static_cache.fingerprint(str(path))
+    with open(path, "wb") as f:
+        f.write(b"other")
+    assert static_cache.fingerprint(str(path)) != first
+
+
+@pytest.fixture
+def result_app(tmp_path, monkeypatch):
+    import app as web
+
+    static = tmp_path / "static"
+    downloaded = static / "images" / "downloaded"
+    downloaded.mkdir(parents=True)
+    result_json = tmp_path / "result.json"
+    result_json.write_text(json.dumps({"editors_notes": "Notes", "size_fit": [], "details_care": []}))
+    monkeypatch.setattr(web.app, "static_folder", str(static))
+    monkeypatch.setattr(web, "DOWNLOADED_DIR", str(downloaded))
+    monkeypatch.setattr(web, "RESULT_JSON", str(result_json))
+    monkeypatch.setattr(web, "RESULT_CACHE", True)
+    monkeypatch.setattr(web, "_pages", static_cache.VersionedCache())
+    return web.app.test_client(), downloaded
+
+
+def original_url(html):
+    return re.search(r'href="(/assets/[0-9a-f]+/images/downloaded/image_0\.jpeg)"', html).group(1)
+
+
+def test_result_page_picks_up_an_image_rewritten_in_place(result_app):
+    client, downloaded = result_app
+    image = downloaded / "image_0.jpeg"
+    write_image(image, "red", (40, 60))
+
+    old_url = original_url(client.get("/result").get_data(as_text=True))
+    assert client.get(old_url).status_code == 200
+
+    # Same name, new content, written over the old file: the directory's mtime does not move.
+    write_image(image, "blue", (80, 120))
+    page = client.get("/result").get_data(as_text=True)
+    new_url = original_url(page)
+
+    assert new_url != old_url
+    assert client.get(new_url).status_code == 200
+    assert client.get(old_url).status_code == 404
+
+
+def test_result_page_is_served_from_the_cache_while_nothing_changes(result_app):
+    import app as web
+
+    client, downloaded = result_app
+    write_image(downloaded / "image_0.jpeg", "red", (40, 60))
+    first = client.get("/result")
+    second = client.get("/result")
+
+    assert first.get_data() == second.get_data()
+    assert (web._pages.builds, web._pages.hits) == (1, 1)
+    assert client.get("/result", headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
@@ -0,0 +1,127 @@
+import os
+import time
+import signal
+import asyncio
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from scraper import job_queue, jobs, metrics, pipeline
+
+# Worker entry point: runs analysis and comparison jobs from the durable
+# queue (scraper/job_queue.py), so scraping and model capacity scale apart
+# from the web tier.
+#
+#     JOB_QUEUE=redis://redis:6379/0 python worker.py [--concurrency 1] [--metrics-port 9100]
+#
+# The web processes get the same JOB_QUEUE and only store photos, enqueue
+# and show results. A claimed job's lease is extended while it runs; on
+# SIGTERM the worker stops claiming and finishes what it holds. Each job
+# runs to the end here, fit step included, and its result is written back
+# to the queue. Each job scrapes into its own data/jobs/<job_id>/
+# directory, so --concurrency can go above one; the analyzers of all slots
+# share one worker pool. A job cancelled while it runs (the record turns
+# "cancelled") is stopped within CANCEL_POLL seconds.
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+UPLOAD_FOLDER = os.path.join(ROOT, 'static', 'images', 'uploads')
+CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "1"))
+POLL_INTERVAL = float(os.getenv("JOB_WORKER_POLL", "1"))
+CANCEL_POLL = float(os.getenv("JOB_WORKER_CANCEL_POLL", "2"))
+
+
+async def heartbeat(queue, job, task):
+    """Keep the lease alive while the job runs; cancel `task` once the job is cancelled."""
+    extended = time.monotonic()
+    while True:
+        await asyncio.sleep(min(CANCEL_POLL, job_queue.VISIBILITY / 3))
+        record = await asyncio.to_thread(queue.get, job["job_id"])
+        if record is not None and record["status"] == "cancelled":
+            print(f"[DEBUG] Job {job['job_id']} was cancelled; stopping it")
+            task.cancel()
+            return
+        if time.monotonic() - extended < job_queue.VISIBILITY / 3:
+            continue
+        extended = time.monotonic()
+        if not await asyncio.to_thread(queue.extend, job["job_id"], job["lease"]):
+            print(f"[ERROR] Lost the lease on job {job['job_id']}; another worker may run it again")
+            return
+
+
+async def handle(queue, job):
+    job_id, lease = job["job_id"], job["lease"]
+    print(f"[DEBUG] Job {job_id} ({job['kind']}), attempt {job['attempts']}")
+    started = time.time()
+    run = asyncio.create_task(jobs.run_queued(job, UPLOAD_FOLDER))
+    beat = asyncio.create_task(heartbeat(queue, job, run))
+    try:
+        result = await run
+    except asyncio.CancelledError:
+        if not run.cancelled():
+            raise
+        outcome = "cancelled"
+    except Exception as e:
+        print(f"[ERROR] Job {job_id} failed: {e}")
+        outcome = await asyncio.to_thread(queue.fail, job_id, lease, str(e)) or "lost"
+    else:
+        outcome = "done" if await asyncio.to_thread(queue.complete, job_id, lease, result) else "lost"
+    finally:
+        beat.cancel()
+    metrics.inc("queue_jobs_total", kind=job["kind"], outcome=outcome)
+    metrics.observe("queue_job_seconds", time.time() - started, kind=job["kind"])
+    metrics.set_gauge("queue_depth", await asyncio.to_thread(queue.depth))
+
+
+async def consume(queue, stop):
+    while not stop.is_set():
+        job = await asyncio.to_thread(queue.claim)
+        if job is None:
+            try:
+                await asyncio.wait_for(stop.wait(), POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        await handle(queue, job)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+async def run(concurrency, metrics_port=None):
+    if metrics_port:
+        server = ThreadingHTTPServer(("0.0.0.0", metrics_port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="worker-metrics", daemon=True).start()
+    if os.getenv("PIPELINE_WARMUP", "1") == "1":
+        pipeline.warm_up_in_background()
+
+    queue = job_queue.default_queue()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    print(f"[DEBUG] Worker consuming {job_queue.JOB_QUEUE} with {concurrency} slot(s)")
+    await asyncio.gather(*[consume(queue, stop) for _ in range(concurrency)])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run queued analysis jobs.")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--metrics-port", type=int, default=int(os.getenv("JOB_WORKER_METRICS_PORT", "0")))
+    args = parser.parse_args(argv)
+    if not job_queue.ENABLED:
+        parser.error("set JOB_QUEUE (sqlite:///path or redis://host:port/db)")
+    asyncio.run(run(args.concurrency, args.metrics_port))
+
+
+if __name__ == "__main__":
+    main()